@@ -3,6 +3,7 @@ class AppState:
     view_mode values:
         SINGLE  ``single_target``
         DUAL    first two peers in ``other_ids``
+        GRID    every peer in ``other_ids`` tiled (three or more peers)
         TRANSITION clip playing, new view pending activation
     """
 
@@ -72,6 +73,10 @@ class AppState:
             except ValueError:
                 idx = 0
 
+            if num_peers >= 3 and idx < num_peers - 1:
+                # walk every peer's single view before the multi views
+                return 'SINGLE', self.other_ids[idx + 1]
+
             if num_peers >= 2 and idx == 0:
                 # switch to peer #2 single view
                 return 'SINGLE', self.other_ids[1]
@@ -88,9 +93,14 @@ class AppState:
             return None, None
 
         elif self.view_mode == 'DUAL':
+            if num_peers >= 3:
+                return 'GRID', None
             # go back to first peer single view
             return 'SINGLE', self.other_ids[0]
 
+        elif self.view_mode == 'GRID':
+            return 'SINGLE', self.other_ids[0]
+
         elif self.view_mode == 'TRANSITION':
             # currently showing clip; ignore rotations until finished
             return None, None
@@ -135,6 +145,9 @@ class AppState:
     def dual_targets(self):
         return [self.peer_info[pid] for pid in self.other_ids[:2]] if len(self.other_ids) >= 1 else []
 
+    def grid_targets(self):
+        return [self.peer_info[pid] for pid in self.other_ids]
+
     def current_view_peer_ips(self):
         """return list of IDs currently onscreen (remote IPs or LOCAL tag)"""
         if self.view_mode == 'SINGLE':
@@ -144,6 +157,8 @@ class AppState:
             return [ip] if ip else []
         elif self.view_mode == 'DUAL':
             return [t['ip'] for t in self.dual_targets()]
+        elif self.view_mode == 'GRID':
+            return [t['ip'] for t in self.grid_targets()]
         else:
             return []
 
@@ -0,0 +1,90 @@
+import collections, threading
+import numpy as np
+
+
+class FrameBuffer:
+    """pooled array with a reference count
+
+    whoever acquires or retains a buffer must release it once; at zero
+    references the array goes back to its pool.  A buffer without a pool
+    (see ``wrap``) just holds an ordinary array and release is a no-op
+    """
+
+    __slots__ = ('array', '_pool', '_key', '_refs')
+
+    def __init__(self, array, pool=None, key=None):
+        self.array = array
+        self._pool = pool
+        self._key = key
+        self._refs = 1
+
+    @classmethod
+    def wrap(cls, array):
+        return cls(array)
+
+    def retain(self):
+        if self._pool is not None:
+            with self._pool._lock:
+                self._refs += 1
+        return self
+
+    def release(self):
+        if self._pool is not None:
+            self._pool._release(self)
+
+
+class BufferPool:
+    """free lists of preallocated frame arrays, one per (shape, dtype)
+
+    every stage draws its per-frame arrays from here instead of letting
+    cv2 / TurboJPEG allocate a fresh one, so steady state runs without
+    allocations once each shape has been seen.  At most ``max_free``
+    arrays per shape are kept; extra releases are left to the GC
+    """
+
+    def __init__(self, max_free: int = 8):
+        self._lock = threading.Lock()
+        self._free = collections.defaultdict(collections.deque)
+        self._max_free = max_free
+        self.allocated = 0    # arrays ever created
+        self.reused = 0       # acquires served from a free list
+        self.in_use = 0
+        self.high_water = 0   # most buffers in use at once
+
+
+    def acquire(self, shape, dtype=np.uint8):
+        """FrameBuffer of ``shape`` with one reference; contents are undefined"""
+        key = (tuple(shape), np.dtype(dtype).str)
+        with self._lock:
+            free = self._free[key]
+            self.in_use += 1
+            self.high_water = max(self.high_water, self.in_use)
+            if free:
+                self.reused += 1
+                fb = free.pop()
+                fb._refs = 1
+                return fb
+            self.allocated += 1
+        return FrameBuffer(np.empty(shape, dtype), self, key)
+
+
+    def _release(self, fb):
+        with self._lock:
+            fb._refs -= 1
+            if fb._refs > 0:
+                return
+            if fb._refs < 0:
+                raise RuntimeError('FrameBuffer released more often than acquired')
+            self.in_use -= 1
+            free = self._free[fb._key]
+            if len(free) < self._max_free:
+                free.append(fb)
+
+
+    def stats(self):
+        with self._lock:
+            return {'allocated': self.allocated,
+                    'reused': self.reused,
+                    'in_use': self.in_use,
+                    'high_water': self.high_water,
+                    'free': sum(len(f) for f in self._free.values())}
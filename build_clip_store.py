@@ -0,0 +1,68 @@
+"""convert the transition clips into one pre-scaled clip store
+
+    python build_clip_store.py                      # CLIP_DIR -> CLIP_STORE from config
+    python build_clip_store.py clips/ clips.store --format raw
+
+every clip in the folder is decoded once, scaled to FRAME_WIDTH x
+FRAME_HEIGHT and written as a JPEG sequence (default, ~20x smaller) or raw
+BGR frames (a memcpy per frame at playback, ~0.9 MB per frame).  Rerun
+after changing the clips
+"""
+import argparse, os, sys
+from pathlib import Path
+import cv2
+import config
+from clip_reader import open_clip
+from clip_store import ClipStoreWriter
+
+
+def build(clip_dir, store, fmt='jpeg', quality=90, default_fps=30.0, verbose=True):
+    """write every clip in ``clip_dir`` into ``store``; returns the clip count"""
+    w, h = config.FRAME_WIDTH, config.FRAME_HEIGHT
+    # write next to the target and rename, so a running app never maps a half-written store
+    tmp = store + '.tmp'
+    out = ClipStoreWriter(tmp, fmt, quality)
+    clips = 0
+    for path in sorted(p for p in Path(clip_dir).glob('*.*') if p.is_file()):
+        cap = open_clip(str(path))
+        if cap is None:
+            print(f'[WARN] skipping {path.name}: cannot open')
+            continue
+        fps = cap.get(cv2.CAP_PROP_FPS)
+        out.begin(path.name, fps if 1.0 <= fps <= 240.0 else default_fps, w, h)
+        frames = 0
+        while True:
+            ok, frame = cap.read()
+            if not ok or frame is None:
+                break
+            if frame.shape[:2] != (h, w):
+                frame = cv2.resize(frame, (w, h), interpolation=cv2.INTER_AREA)
+            out.add(frame)
+            frames += 1
+        cap.release()
+        clips += 1
+        if verbose:
+            print(f'{path.name}: {frames} frames')
+    out.close()
+    os.replace(tmp, store)
+    return clips
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument('clip_dir', nargs='?', default=config.CLIP_DIR)
+    ap.add_argument('store', nargs='?', default=getattr(config, 'CLIP_STORE', None))
+    ap.add_argument('--format', default='jpeg', choices=['jpeg', 'raw'])
+    ap.add_argument('--quality', type=int, default=90)
+    ap.add_argument('--fps', type=float, default=30.0, help='for clips that do not report one')
+    args = ap.parse_args()
+    if not args.store:
+        ap.error('no store path given and config.CLIP_STORE is not set')
+
+    clips = build(args.clip_dir, args.store, args.format, args.quality, args.fps)
+    print(f'{clips} clips, {os.path.getsize(args.store) / 2**20:.1f} MB -> {args.store}')
+    sys.exit(0 if clips else 1)
+
+
+if __name__ == '__main__':
+    main()
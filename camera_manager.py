@@ -1,40 +1,210 @@
-import cv2, time, config
+import cv2, os, time, config, telemetry
+import numpy as np
+from buffer_pool import BufferPool, FrameBuffer
+from codec_utils import encode_bgr_to_jpeg, encode_yuyv_to_jpeg, decode_jpeg_into, decoded_shape
+
+
+_SOI = b'\xff\xd8'
+_EOI = b'\xff\xd9'
+
+
+class MjpegFileSource:
+    """cv2.VideoCapture stand-in that replays a file of concatenated JPEGs
+    (e.g. ``ffmpeg -i cam.mp4 -c:v mjpeg -f mjpeg out.mjpeg``), looping at EOF
+
+    read() returns the compressed bytes as a 1-D uint8 array, the same shape
+    V4L2 delivers MJPEG in when CAP_PROP_CONVERT_RGB is off
+    """
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self._data = f.read()
+        self._frames = []
+        pos = self._data.find(_SOI)
+        while pos >= 0:
+            end = self._data.find(_EOI, pos + 2)
+            if end < 0:
+                break
+            self._frames.append((pos, end + 2))
+            pos = self._data.find(_SOI, end + 2)
+        self._next = 0
+
+    def isOpened(self):
+        return bool(self._frames)
+
+    def read(self, image=None):
+        if not self._frames:
+            return False, None
+        start, end = self._frames[self._next]
+        self._next = (self._next + 1) % len(self._frames)
+        return True, np.frombuffer(self._data, np.uint8, end - start, start)
+
+    def set(self, prop, value):
+        return False
+
+    def get(self, prop):
+        return 0.0
+
+    def release(self):
+        self._frames = []
 
 
 class CameraManager:
-    def __init__(self):
-        # use the V4L2 backend explicitly
-        self.cap = cv2.VideoCapture(config.CAMERA_SRC, cv2.CAP_V4L2)
-        if not self.cap.isOpened():
-            raise IOError('Cannot open camera')
-        self.cap.set(cv2.CAP_PROP_FRAME_WIDTH,  config.FRAME_WIDTH)
-        self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, config.FRAME_HEIGHT)
+    """local camera
+
+    CAMERA_FORMAT 'BGR' decodes frames to BGR in OpenCV.  'MJPEG' asks V4L2
+    for the camera's own JPEG stream and passes the compressed bytes through
+    to the network untouched.  'YUYV' keeps the camera's packed YUV and
+    encodes it through TurboJPEG's YUV entry point, skipping the two colour
+    conversions of the BGR path.  Either falls back to BGR if the camera does
+    not deliver that format.  A CAMERA_SRC naming a file is replayed as an
+    MJPEG stream
 
+    BGR and YUYV frames are read straight into buffers from ``pool``
+    """
 
-        w = int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-        h = int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-        if (w, h) != (config.FRAME_WIDTH, config.FRAME_HEIGHT):
-            print(f"[WARN] Camera resolution is {w}x{h} instead of "
-                  f"{config.FRAME_WIDTH}x{config.FRAME_HEIGHT}. Frames larger than"
-                  " expected may be dropped by the stream processor.")
+    def __init__(self, pool=None):
+        src = config.CAMERA_SRC
+        self.format = getattr(config, 'CAMERA_FORMAT', 'BGR')
+        self.pool = pool or BufferPool()
+        self._shape = None    # shape cap.read() delivers, learned from the first frame
+        self._bgr = None      # to_bgr output, reused between calls
 
-        self.frame_time   = 1.0 / config.FPS_LIMIT if config.FPS_LIMIT else 0
-        self.last_capture = 0.0
+        if isinstance(src, str) and os.path.isfile(src):
+            self.cap = MjpegFileSource(src)
+            if not self.cap.isOpened():
+                raise IOError(f'No JPEG frames in {src}')
+            self.format = 'MJPEG'
+        else:
+            # use the V4L2 backend explicitly
+            self.cap = cv2.VideoCapture(src, cv2.CAP_V4L2)
+            if not self.cap.isOpened():
+                raise IOError('Cannot open camera')
+            if self.format == 'MJPEG':
+                self.cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*'MJPG'))
+            elif self.format == 'YUYV':
+                self.cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*'YUYV'))
+            self.cap.set(cv2.CAP_PROP_FRAME_WIDTH,  config.FRAME_WIDTH)
+            self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, config.FRAME_HEIGHT)
 
-        # print('[INFO] capture thread running')  
+
+            w = int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+            h = int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+            self.size = (w, h)
+            if self.format != 'BGR' and not self._enable_raw():
+                self.format = 'BGR'
+            if (w, h) != (config.FRAME_WIDTH, config.FRAME_HEIGHT):
+                print(f"[WARN] Camera resolution is {w}x{h} instead of "
+                      f"{config.FRAME_WIDTH}x{config.FRAME_HEIGHT}. Frames larger than"
+                      " expected may be dropped by the stream processor.")
+
+        self.frame_time    = 1.0 / config.FPS_LIMIT if config.FPS_LIMIT else 0
+        self.next_capture  = 0.0   # time.monotonic() deadline of the next frame
+
+        # print('[INFO] capture thread running')
+
+
+    def _enable_raw(self):
+        """switch V4L2 to raw buffers and check they hold self.format"""
+        self.cap.set(cv2.CAP_PROP_CONVERT_RGB, 0)
+        ok, raw = self.cap.read()
+        if ok and raw is not None and raw.dtype == np.uint8:
+            w, h = self.size
+            if self.format == 'MJPEG' and raw.size > 4 and raw.reshape(-1)[:2].tobytes() == _SOI:
+                return True
+            # rows must need no padding at TurboJPEG's 4 byte YUV alignment
+            if self.format == 'YUYV' and raw.size == w * h * 2 and w % 8 == 0 and h % 2 == 0:
+                return True
+        print(f"[WARN] Camera does not deliver {self.format}; falling back to BGR capture")
+        self.cap.set(cv2.CAP_PROP_CONVERT_RGB, 1)
+        return False
 
 
     def capture(self):
-        now = time.time()
-        if now - self.last_capture < self.frame_time:
-            return None
-        ret, frame = self.cap.read()
+        """return the next frame as a FrameBuffer the caller must release;
+        its array is in the camera's format: BGR, JPEG bytes as a 1-D array,
+        or packed YUYV in whatever shape V4L2 delivers it
+
+        blocks until the frame is due under FPS_LIMIT and the camera has it"""
+        if self.frame_time:
+            delay = self.next_capture - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            # schedule from the deadline, not from now, so the rate holds;
+            # after a stall start over rather than burst to catch up
+            now = time.monotonic()
+            self.next_capture = max(self.next_capture + self.frame_time, now)
+        t0 = telemetry.start()
+        fb = self._read()
+        telemetry.stop('capture', t0)
+        if fb is None:
+            telemetry.count('capture_failed')
+        return fb
+
+
+    def _read(self):
+        if self.format == 'MJPEG' or self._shape is None:
+            # compressed frames vary in size and aren't pooled; raw ones are
+            # once the first read has shown their shape
+            fb = None
+            ret, frame = self.cap.read()
+        else:
+            fb = self.pool.acquire(self._shape)
+            ret, frame = self.cap.read(image=fb.array)
         # print('CAP ret=', ret, '; shape=',
-        #       None if frame is None else frame.shape)  
+        #       None if frame is None else frame.shape)
         if not ret:
+            if fb is not None:
+                fb.release()
             return None
-        self.last_capture = now
-        return frame
+        if self.format == 'MJPEG':
+            return FrameBuffer.wrap(frame.reshape(-1))
+        if fb is None or frame is not fb.array:
+            # first frame, or the driver changed size: it read into a fresh array
+            if fb is not None:
+                fb.release()
+            self._shape = frame.shape
+            fb = FrameBuffer.wrap(frame)
+        return fb
+
+
+    def to_jpeg(self, frame, quality, scale=1.0):
+        """compressed form of a captured frame, for the network, ``scale``
+        times the capture size; MJPEG frames go out as the camera made them"""
+        if self.format == 'MJPEG':
+            return frame
+        if scale < 1.0:
+            # degraded link: the conversion + resize costs less than the bytes it saves
+            if self.format == 'YUYV':
+                w, h = self.size
+                frame = cv2.cvtColor(frame.reshape(h, w, 2), cv2.COLOR_YUV2BGR_YUYV)
+            h, w = frame.shape[:2]
+            size = (int(w * scale) // 2 * 2, int(h * scale) // 2 * 2)
+            return encode_bgr_to_jpeg(cv2.resize(frame, size, interpolation=cv2.INTER_AREA), quality)
+        if self.format == 'YUYV':
+            return encode_yuyv_to_jpeg(frame, self.size[0], self.size[1], quality)
+        return encode_bgr_to_jpeg(frame, quality)
+
+
+    def to_bgr(self, frame):
+        """BGR form of a captured frame, for the local view; for YUYV and
+        MJPEG the result is overwritten by the next call"""
+        if frame is None or self.format == 'BGR':
+            return frame
+        if self.format == 'YUYV':
+            w, h = self.size
+            frame = frame.reshape(h, w, 2)
+            shape = (h, w, 3)
+        else:
+            info = decoded_shape(frame)
+            if info is None:
+                return None
+            shape = info[0]
+        if self._bgr is None or self._bgr.shape != shape:
+            self._bgr = np.empty(shape, np.uint8)
+        if self.format == 'YUYV':
+            return cv2.cvtColor(frame, cv2.COLOR_YUV2BGR_YUYV, dst=self._bgr)
+        return decode_jpeg_into(frame, self._bgr)
 
 
     def release(self):
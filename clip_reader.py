@@ -0,0 +1,139 @@
+import threading, cv2, numpy as np
+from typing import Optional, Tuple
+
+
+def open_clip(path: str) -> Optional[cv2.VideoCapture]:
+    """open a clip, GStreamer first (hardware decode on Jetson), then any backend"""
+    cap = cv2.VideoCapture(path, cv2.CAP_GSTREAMER)
+    if not cap.isOpened():
+        cap = cv2.VideoCapture(path)
+    if not cap.isOpened():
+        return None
+    return cap
+
+
+class ClipReader:
+    """decodes one clip on its own thread into a ring of preallocated frames
+
+    the thread opens the clip and fills the ring (``frames`` slots, resized
+    to ``size``) as soon as the reader is created, then keeps it topped up
+    while the clip is read.  read(index) never waits for the decoder: it
+    returns the newest buffered frame up to ``index``, dropping older ones.
+    Frames already behind the last requested index are grabbed but not
+    decoded.  The returned array stays valid until the next read()
+    """
+
+    def __init__(self, path: str, size: Tuple[int, int], frames: int):
+        self.path = path
+        self.size = size  # (width, height)
+        self.fps = 0.0
+        self.failed = False  # clip could not be opened
+        self.eof = False     # decoder reached the end; buffered frames remain
+        self.length = 0      # frames in the clip, known once eof is set
+        self.grabbed = 0     # frames skipped without decoding
+        # one extra slot for the frame handed out by the last read();
+        # allocated by the thread, not by whoever creates the reader
+        self._slots = [None] * (max(1, frames) + 1)
+        self._index = [0] * len(self._slots)   # clip frame number per slot
+        self._head = 0
+        self._count = 0
+        self._want = 0
+        self._cond = threading.Condition()
+        self._running = True
+        self._thread = threading.Thread(target=self._loop, name='clip-reader', daemon=True)
+        self._thread.start()
+
+
+    @property
+    def buffered(self) -> int:
+        with self._cond:
+            return self._count
+
+
+    def ready(self) -> bool:
+        """opened and either the ring is full or the clip is fully decoded"""
+        with self._cond:
+            return not self.failed and (self._count == len(self._slots) - 1 or (self.eof and self._count > 0))
+
+
+    def ended(self) -> bool:
+        """nothing left to read: failed, or decoded to the end and drained"""
+        with self._cond:
+            return self.failed or (self.eof and self._count == 0)
+
+
+    def read(self, index: int):
+        """(frame, frame number) of the newest buffered frame numbered at most
+        ``index``, older ones dropped; (None, -1) if there is none yet"""
+        n = len(self._slots)
+        with self._cond:
+            self._want = max(self._want, index)
+            take = 0
+            while take < self._count and self._index[(self._head + take) % n] <= index:
+                take += 1
+            if take == 0:
+                return None, -1
+            last = (self._head + take - 1) % n
+            self._head = (last + 1) % n
+            self._count -= take
+            self._cond.notify()
+            return self._slots[last], self._index[last]
+
+
+    def close(self, wait=False):
+        """stop decoding; ``wait`` joins the thread (shutdown, not the UI path)"""
+        with self._cond:
+            self._running = False
+            self._cond.notify()
+        if wait:
+            self._thread.join(timeout=2.0)
+
+
+    def _loop(self):
+        cap = open_clip(self.path)
+        if cap is None:
+            with self._cond:
+                self.failed = True
+            return
+        self.fps = cap.get(cv2.CAP_PROP_FPS) or 0.0
+        w, h = self.size
+        raw = None
+        n = len(self._slots)
+        pos = 0  # clip frame number of the next frame out of cap
+        try:
+            while True:
+                with self._cond:
+                    # never write the slot the consumer is still showing
+                    while self._running and self._count >= n - 1:
+                        self._cond.wait()
+                    if not self._running:
+                        return
+                    late = pos < self._want
+                    i = (self._head + self._count) % n
+                if late:
+                    # the player is already past this frame: skip it undecoded
+                    ok = cap.grab()
+                    self.grabbed += ok
+                else:
+                    ok, raw = cap.read(raw)
+                    ok = ok and raw is not None
+                if not ok:
+                    with self._cond:
+                        self.length = pos
+                        self.eof = True
+                    return
+                pos += 1
+                if late:
+                    continue
+                slot = self._slots[i]
+                if slot is None:
+                    slot = self._slots[i] = np.empty((h, w, 3), np.uint8)
+                if raw.shape[:2] == (h, w):
+                    slot[...] = raw
+                else:
+                    cv2.resize(raw, (w, h), dst=slot)
+                with self._cond:
+                    self._index[i] = pos - 1
+                    self._count += 1
+        finally:
+            cap.release()
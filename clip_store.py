@@ -0,0 +1,162 @@
+# pre-decoded transition clips in one memory-mapped file, see build_clip_store.py
+import json, mmap, os, struct, cv2, numpy as np
+from typing import Dict, List, Optional, Tuple
+from codec_utils import decode_jpeg_into
+
+
+# file layout: header, frame payloads back to back, JSON index
+#   header  b'PCLIPS01' + u64 offset of the index
+#   index   {"clips": [{"name", "fps", "width", "height", "format": "raw"|"jpeg",
+#                       "frames": [[offset, length], ...]}, ...]}
+# raw frames are BGR, height x width x 3; jpeg frames are baseline JPEGs
+_MAGIC = b'PCLIPS01'
+_HEADER = struct.Struct('<8sQ')
+
+
+class ClipStoreWriter:
+    """appends clips frame by frame; close() writes the index"""
+
+    def __init__(self, path: str, fmt: str = 'jpeg', quality: int = 90):
+        if fmt not in ('raw', 'jpeg'):
+            raise ValueError(f"unknown clip store format {fmt!r}")
+        self.fmt = fmt
+        self.quality = quality
+        self._f = open(path, 'wb')
+        self._f.write(_HEADER.pack(_MAGIC, 0))
+        self._clips: List[Dict] = []
+
+    def begin(self, name: str, fps: float, width: int, height: int):
+        self._clips.append({'name': name, 'fps': fps, 'width': width, 'height': height,
+                            'format': self.fmt, 'frames': []})
+
+    def add(self, frame):
+        """append one BGR frame, already at the clip's size, to the current clip"""
+        if self.fmt == 'raw':
+            data = np.ascontiguousarray(frame).tobytes()
+        else:
+            ok, buf = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+            if not ok:
+                raise ValueError("JPEG encode failed")
+            data = buf.tobytes()
+        self._clips[-1]['frames'].append([self._f.tell(), len(data)])
+        self._f.write(data)
+
+    def close(self):
+        index = self._f.tell()
+        self._f.write(json.dumps({'clips': self._clips}).encode())
+        self._f.seek(0)
+        self._f.write(_HEADER.pack(_MAGIC, index))
+        self._f.close()
+
+
+class ClipStore:
+    """read side: the whole store mapped once, clips looked up in its index"""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, index = _HEADER.unpack_from(self._mm, 0)
+        if magic != _MAGIC:
+            self._mm.close()
+            raise ValueError(f"{path} is not a clip store")
+        self.clips: List[Dict] = json.loads(self._mm[index:])['clips']
+        for clip in self.clips:
+            clip['frames'] = np.array(clip['frames'], np.int64).reshape(-1, 2)
+        self._view = memoryview(self._mm)
+
+    def names(self) -> List[str]:
+        return [c['name'] for c in self.clips]
+
+    def frame_bytes(self, clip: Dict, i: int) -> memoryview:
+        off, n = clip['frames'][i]
+        return self._view[off:off + n]
+
+    def willneed(self, clip: Dict, frames: int):
+        """ask the kernel to page in the first ``frames`` frames of ``clip``"""
+        if not hasattr(self._mm, 'madvise') or not len(clip['frames']):
+            return
+        start = int(clip['frames'][0, 0]) // mmap.PAGESIZE * mmap.PAGESIZE
+        last = clip['frames'][min(frames, len(clip['frames'])) - 1]
+        try:
+            self._mm.madvise(mmap.MADV_WILLNEED, start, int(last[0] + last[1]) - start)
+        except (OSError, ValueError):
+            pass
+
+    def close(self):
+        self._view.release()
+        try:
+            self._mm.close()
+        except BufferError:
+            # a frame handed out is still referenced; the map goes with it
+            pass
+
+
+class StoreClipReader:
+    """ClipReader for one clip of a ClipStore
+
+    frames are read straight out of the map on the caller's thread: a raw
+    frame is a view into the store (copied only if it needs resizing), a
+    JPEG frame is decoded into a reused buffer.  Any frame number can be
+    read directly, so skipped frames cost nothing
+    """
+
+    def __init__(self, store: ClipStore, clip: Dict, size: Tuple[int, int], frames: int = 0):
+        self.path = f"{store.path}:{clip['name']}"
+        self.size = size  # (width, height)
+        self.fps = float(clip['fps'])
+        self.failed = False
+        self.eof = True
+        self.length = len(clip['frames'])
+        self.grabbed = 0
+        self._store = store
+        self._clip = clip
+        self._shape = (clip['height'], clip['width'], 3)
+        self._next = 0
+        self._buf: Optional[np.ndarray] = None
+        self._out: Optional[np.ndarray] = None
+        store.willneed(clip, frames)
+
+    def ready(self) -> bool:
+        return self.length > 0
+
+    def ended(self) -> bool:
+        return self._next >= self.length
+
+    def read(self, index: int):
+        if self._next >= self.length:
+            return None, -1
+        i = min(index, self.length - 1)
+        if i < self._next:
+            return None, -1
+        self.grabbed += i - self._next
+        self._next = i + 1
+        data = self._store.frame_bytes(self._clip, i)
+        if self._clip['format'] == 'raw':
+            frame = np.frombuffer(data, np.uint8).reshape(self._shape)
+        else:
+            if self._buf is None:
+                self._buf = np.empty(self._shape, np.uint8)
+            frame = decode_jpeg_into(data, self._buf)
+            if frame is None:
+                return None, -1
+        w, h = self.size
+        if frame.shape[:2] != (h, w):
+            if self._out is None:
+                self._out = np.empty((h, w, 3), np.uint8)
+            frame = cv2.resize(frame, (w, h), dst=self._out)
+        return frame, i
+
+    def close(self, wait=False):
+        pass
+
+
+def open_store(path: Optional[str]) -> Optional[ClipStore]:
+    """the store at ``path``, or None when unset / missing / unreadable"""
+    if not path or not os.path.isfile(path):
+        return None
+    try:
+        return ClipStore(path)
+    except (OSError, ValueError) as e:
+        print(f"[WARN] clip store {path}: {e}")
+        return None
@@ -1,5 +1,6 @@
-from turbojpeg import TurboJPEG, TJPF_BGR, TJFLAG_FASTDCT
-import threading
+from turbojpeg import TurboJPEG, TJPF_BGR, TJFLAG_FASTDCT, TJSAMP_420
+import inspect, threading
+import numpy as np
 
 
 # now each thread gets its own TurboJPEG instance.  Turns out the C implementation is not
@@ -8,6 +9,9 @@ import threading
 
 _thread_local = threading.local()
 
+# PyTurboJPEG grew a ``dst`` argument in 2.x; older releases always allocate
+_DECODE_DST = 'dst' in inspect.signature(TurboJPEG.decode).parameters
+
 
 def _get_jpeg():
 
@@ -24,11 +28,84 @@ def encode_bgr_to_jpeg(frame_bgr, quality):
     return jpeg.encode(frame_bgr, quality=quality, pixel_format=TJPF_BGR, flags=TJFLAG_FASTDCT)
 
 
-def decode_jpeg_to_bgr(jpeg_bytes):
+def encode_yuyv_to_jpeg(frame_yuyv, width, height, quality):
+    """encode a packed YUYV (4:2:2) camera frame without going through BGR
+
+    the frame is repacked into TurboJPEG's planar 4:2:0 layout (chroma taken
+    from even rows) and fed to the YUV entry point, which skips the colour
+    conversion that encode() would do internally
+    """
+    jpeg = _get_jpeg()
+    planes = getattr(_thread_local, 'i420', None)
+    if planes is None or planes[0] != (width, height):
+        buf = np.empty(width * height * 3 // 2, np.uint8)
+        y = buf[:width * height].reshape(height, width)
+        u = buf[width * height:width * height * 5 // 4].reshape(height // 2, width // 2)
+        v = buf[width * height * 5 // 4:].reshape(height // 2, width // 2)
+        planes = _thread_local.i420 = ((width, height), buf, y, u, v)
+    _, buf, y, u, v = planes
+    packed = frame_yuyv.reshape(height, width * 2)
+    np.copyto(y, packed[:, 0::2])
+    np.copyto(u, packed[0::2, 1::4])
+    np.copyto(v, packed[0::2, 3::4])
+    return jpeg.encode_from_yuv(buf, height, width, quality=quality,
+                                jpeg_subsample=TJSAMP_420, flags=TJFLAG_FASTDCT)
+
+
+def decode_jpeg_to_bgr(jpeg_bytes, scaling_factor=None):
 
     jpeg = _get_jpeg()
     try:
-        return jpeg.decode(jpeg_bytes, pixel_format=TJPF_BGR)
+        return jpeg.decode(jpeg_bytes, pixel_format=TJPF_BGR, scaling_factor=scaling_factor)
     except Exception:
         # corrupted payload or internal decoder error
         return None
+
+
+def scaling_factor_for(width, height, target_w, target_h):
+    """smallest DCT-domain scaling factor whose output still covers the target
+    size, or None when only a full size decode does
+
+    scaling happens inside the IDCT, so a 1/2 decode costs roughly a quarter
+    of a full decode followed by cv2.resize
+    """
+    best = None
+    for num, denom in _get_jpeg().scaling_factors:
+        if num >= denom:
+            continue
+        w = (width * num + denom - 1) // denom
+        h = (height * num + denom - 1) // denom
+        if w >= target_w and h >= target_h and (best is None or num * best[1] < best[0] * denom):
+            best = (num, denom)
+    return best
+
+
+def decoded_shape(jpeg_bytes, size=None):
+    """(shape, scaling_factor) of the BGR array a decode will produce;
+    with ``size`` = (w, h) the smallest scale covering it is chosen.  None
+    if the header can't be read"""
+    try:
+        width, height = _get_jpeg().decode_header(jpeg_bytes)[:2]
+    except Exception:
+        return None
+    sf = None if size is None else scaling_factor_for(width, height, size[0], size[1])
+    if sf is not None:
+        num, denom = sf
+        width = (width * num + denom - 1) // denom
+        height = (height * num + denom - 1) // denom
+    return (height, width, 3), sf
+
+
+def decode_jpeg_into(jpeg_bytes, dst, scaling_factor=None):
+    """decode into the preallocated ``dst`` (shape from decoded_shape);
+    returns dst, or None on a corrupt payload"""
+    jpeg = _get_jpeg()
+    try:
+        if _DECODE_DST:
+            return jpeg.decode(jpeg_bytes, pixel_format=TJPF_BGR,
+                               scaling_factor=scaling_factor, dst=dst)
+        np.copyto(dst, jpeg.decode(jpeg_bytes, pixel_format=TJPF_BGR,
+                                   scaling_factor=scaling_factor))
+        return dst
+    except Exception:
+        return None
@@ -0,0 +1,91 @@
+import math, time, cv2, numpy as np
+from typing import Dict, List, Sequence, Tuple
+
+
+def grid_regions(n, width, height):
+    """canvas size and regions tiling ``n`` sources near-square into at
+    most ``width`` x ``height``; tiles keep the width:height aspect"""
+    cols = math.ceil(math.sqrt(n))
+    rows = math.ceil(n / cols)
+    tw = min(width // cols, height // rows * width // height)
+    th = tw * height // width
+    return (tw * cols, th * rows), [((i % cols) * tw, (i // cols) * th, tw, th) for i in range(n)]
+
+
+class _Layout:
+    __slots__ = ('canvas', 'rois', 'regions', 'frames', 'ms_avg', 'ms_max')
+
+    def __init__(self, size, regions):
+        w, h = size
+        self.canvas = np.zeros((h, w, 3), np.uint8)
+        self.regions = list(regions)
+        self.rois = [self.canvas[y:y + rh, x:x + rw] for x, y, rw, rh in self.regions]
+        self.frames = 0
+        self.ms_avg = 0.0
+        self.ms_max = 0.0
+
+
+class Compositor:
+    """composes source frames into one preallocated canvas per layout
+
+    a layout is a canvas size plus one (x, y, w, h) region per source; each
+    frame is resized straight into its region of the canvas, missing sources
+    get a placeholder rendered once per (text, size).  A single-region layout
+    whose frame already has the canvas size is passed through uncopied
+    """
+
+    def __init__(self):
+        self._layouts: Dict[str, _Layout] = {}
+        self._placeholders: Dict[Tuple[str, int, int], np.ndarray] = {}
+
+
+    def add_layout(self, name: str, size: Tuple[int, int], regions: Sequence[Tuple[int, int, int, int]]):
+        self._layouts[name] = _Layout(size, regions)
+
+
+    def region_size(self, name, i=0):
+        """(w, h) of region ``i`` in layout ``name``"""
+        return tuple(self._layouts[name].regions[i][2:])
+
+
+    def placeholder(self, text, w, h):
+        img = self._placeholders.get((text, w, h))
+        if img is None:
+            img = np.zeros((h, w, 3), np.uint8)
+            cv2.putText(img, text, (40, h//2), cv2.FONT_HERSHEY_SIMPLEX, 1, (255,255,255), 2)
+            self._placeholders[(text, w, h)] = img
+        return img
+
+
+    def compose(self, name: str, frames: List, labels: List[str]):
+        """canvas of layout ``name`` with ``frames`` in its regions; None
+        frames are drawn as a placeholder showing the matching label.  The
+        canvas is overwritten by the next compose of the same layout"""
+        t0 = time.perf_counter()
+        lay = self._layouts[name]
+        out = lay.canvas
+        if len(lay.rois) == 1 and frames[0] is not None \
+                and frames[0].shape[:2] == lay.canvas.shape[:2]:
+            out = frames[0]
+        else:
+            for f, text, roi in zip(frames, labels, lay.rois):
+                h, w = roi.shape[:2]
+                if f is None:
+                    f = self.placeholder(text, w, h)
+                if f.shape[:2] == (h, w):
+                    roi[...] = f
+                else:
+                    cv2.resize(f, (w, h), dst=roi)
+        ms = (time.perf_counter() - t0) * 1e3
+        lay.frames += 1
+        lay.ms_avg = ms if lay.frames == 1 else lay.ms_avg * 0.9 + ms * 0.1
+        lay.ms_max = max(lay.ms_max, ms)
+        return out
+
+
+    def stats(self):
+        """per layout frame count and compose time"""
+        return {name: {'frames': lay.frames,
+                       'compose_ms_avg': round(lay.ms_avg, 3),
+                       'compose_ms_max': round(lay.ms_max, 3)}
+                for name, lay in self._layouts.items()}
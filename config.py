@@ -12,22 +12,96 @@ PEER_NANO_INFO = {
 #     'nano_C': {'ip': '127.0.0.1', 'name': 'Loopy_C'},
 # }
 UDP_PORT          = 5005
-CAMERA_SRC        = 0
+CAMERA_SRC        = 0            # V4L2 index, or path to an .mjpeg file of concatenated JPEGs (replayed, implies MJPEG)
+CAMERA_FORMAT     = 'BGR'        # 'MJPEG': send the camera's own JPEGs without decode/re-encode
+                                 # 'YUYV': encode the camera's YUV directly (4:2:0), no BGR round trip
+                                 # both fall back to 'BGR' if the camera can't deliver them
 FRAME_WIDTH       = 640
 FRAME_HEIGHT      = 480
 JPEG_QUALITY      = 45           # switching to TurboJPEG for encode/decode for speed/ quality 1‑100
 FPS_LIMIT         = 30
+ENCODE_QUEUE_LEN  = 1            # captured frames waiting for encode; a newer frame replaces the oldest
+ENCODE_WORKERS    = 2
 MAX_DATAGRAM      = 1300         # payload size per UDP packet 
+DUAL_HEIGHT       = 480          # pane height in DUAL view; below FRAME_HEIGHT peers are decoded scaled in the DCT domain
+GRID_HEIGHT       = 720          # canvas height of GRID view (three or more peers); peers are decoded at tile size
 FRAME_DEQUE_LEN   = 5            # per peer history depth
+BUFFER_POOL_FREE  = 8            # spare frame arrays kept per shape by the shared buffer pool
+RENDER_FPS        = 60           # most redraws per second; new frames arriving faster are coalesced (0: no cap)
+KEY_POLL_MS       = 20           # idle render loop: longest wait for a new frame before polling the window for keys
+DECODE_MODE       = 'eager'      # 'eager': decode every frame on arrival; 'lazy': keep the newest JPEG per peer, decode when rendered
+                                 # 'pool': decode every frame on DECODE_WORKERS threads, peers sharded across them
+DECODE_WORKERS    = 2            # 'pool' decode threads; in 'lazy' mode the threads a GRID / DUAL redraw decodes its tiles on
+DECODE_QUEUE_LEN  = 2            # frames queued per decode worker before the oldest is dropped
+REASSEMBLY_SLOTS  = 8            # in-flight frames per peer; a slot is recycled when its fid comes around
+NET_BATCH_IO      = False        # sendmmsg/recvmmsg batching (pure python stand-in if libc lacks it)
+PACE_FRACTION     = 0.0          # spread each frame's datagrams over this part of the frame interval on a sender thread; 0 sends at once
+PACE_BURST        = 4            # datagrams the pacer may send back to back
+SEND_BATCH        = 64           # datagrams per sendmmsg call
+RECV_BATCH        = 32           # datagrams drained per recvmmsg call
+
+# forward error correction: XOR parity chunks appended to every frame.
+# parity j covers data chunks with cid % n_parity == j, so a frame survives
+# any burst of up to n_parity lost chunks (or one loss per stride)
+FEC_OVERHEAD      = 0.0          # parity chunks per data chunk, e.g. 0.1 = +10 % bandwidth; 0 disables
+FEC_MAX_PARITY    = 8            # upper bound on parity chunks (= longest repairable burst)
+
+# adaptive sending: every receiver reports frame completion and reassembly
+# latency back to the sender every QC_REPORT_SEC; the sender lowers JPEG
+# quality, then resolution, then frame rate while the worst peer's loss is
+# over QC_LOSS_TARGET, and raises them back while it stays well under.
+# JPEG_QUALITY, the capture size and FPS_LIMIT are the upper bounds
+ADAPTIVE_QUALITY  = False
+QC_REPORT_SEC     = 0.5
+QC_LOSS_TARGET    = 0.02         # fraction of frames lost
+QC_LATENCY_MS     = 50.0         # mean first chunk -> complete frame time treated as congestion
+QC_QUALITY_MIN    = 20
+QC_QUALITY_STEP   = 10           # JPEG quality added per step back up
+QC_SCALES         = [1.0, 0.75, 0.5]   # frame scales stepped through after quality hits its minimum
+QC_FPS_MIN        = 10
+QC_PROBE_REPORTS  = 2            # clean reports in a row before stepping back up
+
+# wire format of outgoing video chunks.  2: 32-bit sequence number and the
+# capture time in every header, so receivers measure capture -> complete
+# latency per peer (clock offsets from a ping every PING_SEC).  Receivers
+# take both formats; set 1 while any peer still runs a version without v2
+PROTOCOL_VERSION  = 2
+PING_SEC          = 1.0
+LATENCY_WINDOW    = 256          # frames per peer the latency percentiles cover
+
+# per-stage timing (capture, encode, send, reassembly, decode, effects,
+# composite, imshow) into histograms, with drop / expiry counters.
+# Snapshots go to TELEMETRY_FILE every TELEMETRY_DUMP_SEC and / or to
+# GET http://127.0.0.1:TELEMETRY_HTTP_PORT/ (never bound to other hosts)
+TELEMETRY         = False
+TELEMETRY_FILE    = None           # e.g. "/tmp/portals_telemetry.json"
+TELEMETRY_DUMP_SEC = 5.0
+TELEMETRY_HTTP_PORT = 0            # 0: no endpoint
 
 
 # folder for 640x480 mp4 clips
 CLIP_DIR          = "/home/kineolabs/firefly2025/stream_transitions"
+# the same clips pre-scaled into one memory-mapped file (python build_clip_store.py);
+# played instead of CLIP_DIR when the file exists
+CLIP_STORE        = "/home/kineolabs/firefly2025/stream_transitions.store"
 # chance 0.0-1.0 that a video is played during a view switch
 TRANSITION_CHANCE = 0.3
+# frames of the next clip decoded ahead on a background thread (~0.9 MB each
+# at 640x480; 60 is 2 s of a 30 fps clip); arming a transition never waits on the decoder
+CLIP_PREFETCH_FRAMES = 60
 # duration that a GPU glitch effect is applied to the live stream
 # immediately after switching (seconds)
 GLITCH_SEC        = 20.0
+# random noise textures / scan-line grids / shifts precomputed per frame size;
+# glitch frames cycle through them (each 640x480 entry is ~1 MB)
+EFFECT_ASSET_POOL = 8
+# a glitch runs one randomly picked chain of effect plugins (effect_manager.EFFECTS)
+EFFECT_CHAINS     = [['channel_shift'], ['scan_line_offset'], ['noise_overlay']]
+# per peer frame; each effect of a chain gets an equal share and degrades
+# (half intensity -> half resolution -> every other frame) while over it
+EFFECT_BUDGET_MS  = 4.0
+# threads glitching the panes of DUAL / GRID views at once; 1 keeps it on the render thread
+EFFECT_WORKERS    = 2
 
 # serial port for external button controller
 ARDUINO_PORT      = 'auto'  
@@ -38,6 +112,7 @@ def get_key_mappings(my_id, peer_info):
 
     Rotate view with "1" key
     1 - rotate view (single peer 1 -> single peer 2 -> dual view -> single peer 1 ->...)
+        with three or more peers: single peer 1 -> ... -> single peer n -> dual view -> grid view -> single peer 1
 
     q - quit
     """
@@ -0,0 +1,107 @@
+import collections, threading, time, telemetry
+from typing import Callable, Dict, List
+from codec_utils import decode_jpeg_to_bgr
+
+
+class _PeerStats:
+    __slots__ = ('decoded', 'dropped', 'failed', 'ms_avg', 'ms_max')
+
+    def __init__(self):
+        self.decoded = 0
+        self.dropped = 0
+        self.failed = 0
+        self.ms_avg = 0.0
+        self.ms_max = 0.0
+
+
+class _DecodeWorker:
+    """one decode thread with a bounded drop-oldest queue"""
+
+    def __init__(self, name, depth, decode, on_frame, stats):
+        self._queue = collections.deque(maxlen=depth)
+        self._cond = threading.Condition()
+        self._decode = decode
+        self._on_frame = on_frame
+        self._stats = stats
+        self._running = True
+        self.thread = threading.Thread(target=self._loop, name=name, daemon=True)
+        self.thread.start()
+
+    def submit(self, ip, fid, jpeg):
+        with self._cond:
+            if len(self._queue) == self._queue.maxlen:
+                # deque drops the oldest on append; account for it
+                self._stats[self._queue[0][0]].dropped += 1
+                telemetry.count('decode_dropped')
+            self._queue.append((ip, fid, jpeg))
+            self._cond.notify()
+
+    def depth(self, ip):
+        with self._cond:
+            return sum(1 for item in self._queue if item[0] == ip)
+
+    def stop(self):
+        with self._cond:
+            self._running = False
+            self._cond.notify()
+
+    def _loop(self):
+        while True:
+            with self._cond:
+                while self._running and not self._queue:
+                    self._cond.wait()
+                if not self._running:
+                    return
+                ip, fid, jpeg = self._queue.popleft()
+
+            # TurboJPEG releases the GIL while decoding
+            t0 = time.perf_counter()
+            frame = self._decode(ip, jpeg)
+            ms = (time.perf_counter() - t0) * 1e3
+
+            st = self._stats[ip]
+            st.decoded += 1
+            st.ms_avg = ms if st.decoded == 1 else st.ms_avg * 0.9 + ms * 0.1
+            st.ms_max = max(st.ms_max, ms)
+            if frame is None:
+                st.failed += 1
+                continue
+            self._on_frame(ip, fid, frame)
+
+
+class DecodePool:
+    """decode completed frames off the receiver thread
+
+    peers are sharded onto ``workers`` threads so frames of one peer are
+    always decoded in order; each worker queue holds at most ``depth``
+    frames and drops the oldest, so the receiver never blocks on decode.
+    ``decode(ip, jpeg)`` returns whatever ``on_frame`` receives, None on failure
+    """
+
+    def __init__(self, peer_ips: List[str], workers: int, depth: int,
+                 on_frame: Callable[[str, int, object], None],
+                 decode: Callable[[str, bytes], object] = lambda ip, jpeg: decode_jpeg_to_bgr(jpeg)):
+        self._stats: Dict[str, _PeerStats] = {ip: _PeerStats() for ip in peer_ips}
+        n = max(1, min(workers, len(peer_ips) or 1))
+        self._workers = [_DecodeWorker(f'decode-{i}', max(1, depth), decode, on_frame, self._stats)
+                         for i in range(n)]
+        self._shard = {ip: self._workers[i % n] for i, ip in enumerate(peer_ips)}
+
+    def submit(self, ip, fid, jpeg):
+        self._shard[ip].submit(ip, fid, jpeg)
+
+    def stats(self):
+        """per peer queue depth, drops and decode time"""
+        return {ip: {'queue': self._shard[ip].depth(ip),
+                     'dropped': st.dropped,
+                     'decoded': st.decoded,
+                     'failed': st.failed,
+                     'decode_ms_avg': round(st.ms_avg, 3),
+                     'decode_ms_max': round(st.ms_max, 3)}
+                for ip, st in self._stats.items()}
+
+    def close(self):
+        for w in self._workers:
+            w.stop()
+        for w in self._workers:
+            w.thread.join(timeout=1.0)
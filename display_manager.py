@@ -1,4 +1,5 @@
-import cv2, numpy as np
+import cv2, config, telemetry
+from compositor import Compositor, grid_regions
 
 
 class DisplayManager:
@@ -17,31 +18,73 @@ class DisplayManager:
             except Exception:
                 pass
 
+        # canvases are composed in place and placeholders drawn once
+        w, h = config.FRAME_WIDTH, config.FRAME_HEIGHT
+        pw, ph = self.pane_size()
+        self.comp = Compositor()
+        self.comp.add_layout('SINGLE', (w, h), [(0, 0, w, h)])
+        self.comp.add_layout('DUAL', (2 * pw, ph), [(0, 0, pw, ph), (pw, 0, pw, ph)])
+        self.comp.add_layout('TRANSITION', (w, h), [(0, 0, w, h)])
+        self._grids = set()
+        self._shown_title = None
 
-    def _placeholder(self, text, h=480, w=640):
-        img = np.zeros((h, w, 3), np.uint8)
-        cv2.putText(img, text, (40, h//2), cv2.FONT_HERSHEY_SIMPLEX, 1, (255,255,255), 2)
-        return img
+
+    def _set_title(self, text):
+        # setWindowTitle round-trips to the window system; only on a change
+        if text != self._shown_title:
+            cv2.setWindowTitle(self.title, text)
+            self._shown_title = text
+
+
+    def _show(self, layout, frames, labels):
+        t0 = telemetry.start()
+        canvas = self.comp.compose(layout, frames, labels)
+        telemetry.stop('composite', t0)
+        t0 = telemetry.start()
+        cv2.imshow(self.title, canvas)
+        telemetry.stop('imshow', t0)
 
 
     def show_single(self, frame, name):
-        if frame is None:
-            frame = self._placeholder(f"Waiting {name}")
-        cv2.imshow(self.title, frame)
-        cv2.setWindowTitle(self.title, f"{self.title} – {name}")
+        self._show('SINGLE', [frame], [f"Waiting {name}"])
+        self._set_title(f"{self.title} – {name}")
+
+
+    def pane_size(self):
+        """(w, h) each source is drawn at in DUAL view"""
+        h = config.DUAL_HEIGHT
+        return int(config.FRAME_WIDTH * h / config.FRAME_HEIGHT), h
 
 
     def show_dual(self, f1, n1, f2, n2):
-        if f1 is None:
-            f1 = self._placeholder(f"No {n1}")
-        if f2 is None:
-            f2 = self._placeholder(f"No {n2}")
-        h = 480
-        f1 = cv2.resize(f1, (int(f1.shape[1]*h/f1.shape[0]), h))
-        f2 = cv2.resize(f2, (int(f2.shape[1]*h/f2.shape[0]), h))
-        comp = np.concatenate([f1, f2], axis=1)
-        cv2.imshow(self.title, comp)
-        cv2.setWindowTitle(self.title, f"{self.title} - {n1} | {n2}")
+        self._show('DUAL', [f1, f2], [f"No {n1}", f"No {n2}"])
+        self._set_title(f"{self.title} - {n1} | {n2}")
+
+
+    def _grid_layout(self, n):
+        # one layout per peer count: near-square tiling of a GRID_HEIGHT canvas
+        name = f'GRID{n}'
+        if name not in self._grids:
+            h = getattr(config, 'GRID_HEIGHT', config.FRAME_HEIGHT)
+            self.comp.add_layout(name, *grid_regions(n, int(config.FRAME_WIDTH * h / config.FRAME_HEIGHT), h))
+            self._grids.add(name)
+        return name
+
+
+    def grid_tile_size(self, n):
+        """(w, h) each of ``n`` sources is drawn at in GRID view"""
+        return self.comp.region_size(self._grid_layout(n))
+
+
+    def show_grid(self, frames, names):
+        layout = self._grid_layout(len(frames))
+        self._show(layout, frames, [f"No {n}" for n in names])
+        self._set_title(f"{self.title} - {' | '.join(names)}")
+
+
+    def stats(self):
+        """compose time per layout"""
+        return self.comp.stats()
 
 
     def key(self):
@@ -56,6 +99,4 @@ class DisplayManager:
         """render a frame that matches the fullscreen window size
         if frame is None draw placeholder to keep the window active
         """
-        if frame is None:
-            frame = np.zeros((480, 640, 3), dtype=np.uint8)
-        cv2.imshow(self.title, frame)
+        self._show('TRANSITION', [frame], [''])
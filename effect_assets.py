@@ -0,0 +1,106 @@
+import random, threading, cv2, numpy as np
+from typing import Dict, List, Tuple
+
+
+class _Rotation:
+    """up to ``size`` entries built one per call until full, then replayed
+    in a fixed shuffled order, so neither RNG nor allocation stays on the
+    per-frame path once warm.  Safe to call from several effect workers"""
+
+    __slots__ = ('entries', 'size', 'order', 'pos', 'lock')
+
+    def __init__(self, size):
+        self.entries: List = []
+        self.size = size
+        self.order: List[int] = []
+        self.pos = 0
+        self.lock = threading.Lock()
+
+    def next(self, build):
+        with self.lock:
+            return self._next(build)
+
+    def _next(self, build):
+        if len(self.entries) < self.size:
+            self.entries.append(build())
+            if len(self.entries) == self.size:
+                # several passes, each shuffled, so the cycle is not obvious
+                for _ in range(4):
+                    idx = list(range(self.size))
+                    random.shuffle(idx)
+                    self.order += idx
+            return self.entries[-1]
+        entry = self.entries[self.order[self.pos]]
+        self.pos = (self.pos + 1) % len(self.order)
+        return entry
+
+
+class EffectAssetCache:
+    """rotating pools of the random inputs the glitch effects need, per frame size
+
+    noise textures (already BGR and scaled by alpha), scan-line remap grids
+    and channel shift offsets are built lazily, one entry per frame until
+    ``pool_size`` exist, or up front with prewarm()
+    """
+
+    def __init__(self, pool_size: int = 8):
+        self.pool_size = max(1, pool_size)
+        self._pools: Dict[Tuple, _Rotation] = {}
+        self._base_y: Dict[Tuple[int, int], np.ndarray] = {}
+        self._lock = threading.Lock()
+
+
+    def _pool(self, key):
+        pool = self._pools.get(key)
+        if pool is None:
+            with self._lock:
+                pool = self._pools.setdefault(key, _Rotation(self.pool_size))
+        return pool
+
+
+    def prewarm(self, h, w, alpha=0.5):
+        """fill every pool for an (h, w) frame size now instead of during a glitch"""
+        for _ in range(self.pool_size):
+            self.noise(h, w, alpha)
+            self.scan_maps(h, w)
+            self.shift()
+
+
+    def shift(self):
+        """(dx, dy) for the channel shift, each in -5..5"""
+        return self._pool(('shift',)).next(lambda: (random.randint(-5, 5), random.randint(-5, 5)))
+
+
+    def noise(self, h, w, alpha):
+        """(h, w, 3) uint8 gray noise scaled by ``alpha``, ready for a saturating add"""
+        def build():
+            noise = np.empty((h, w), np.uint8)
+            cv2.randu(noise, 0, 256)
+            return cv2.cvtColor(cv2.convertScaleAbs(noise, alpha=alpha), cv2.COLOR_GRAY2BGR)
+        return self._pool(('noise', h, w, alpha)).next(build)
+
+
+    def scan_maps(self, h, w, amp=5):
+        """(xmap, ymap) float32 remap grids shifting each row by a whole
+        number of pixels in -amp..amp; ymap is the identity, shared"""
+        base_y = self._base_y.get((h, w))
+        if base_y is None:
+            base_y = self._base_y.setdefault(
+                (h, w), np.broadcast_to(np.arange(h, dtype=np.float32)[:, None], (h, w)).copy())
+        def build():
+            offsets = np.random.randint(-amp, amp + 1, (h, 1)).astype(np.float32)
+            return np.arange(w, dtype=np.float32) + offsets, base_y
+        return self._pool(('scan', h, w, amp)).next(build)
+
+
+    def stats(self):
+        """entries built per pool, and bytes held"""
+        nbytes = sum(a.nbytes for a in self._base_y.values())
+        for pool in list(self._pools.values()):
+            for e in pool.entries:
+                if isinstance(e, np.ndarray):
+                    nbytes += e.nbytes
+                elif isinstance(e, tuple) and isinstance(e[0], np.ndarray):
+                    nbytes += e[0].nbytes
+        return {'pools': {'/'.join(map(str, k)): len(p.entries) for k, p in self._pools.items()},
+                'bytes': nbytes}
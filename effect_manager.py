@@ -1,5 +1,7 @@
-import time, random, cv2, numpy as np
-from typing import Dict, List
+import time, random, threading, cv2, numpy as np, config, telemetry
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+from effect_assets import EffectAssetCache
 
 
 _GPU_AVAILABLE = cv2.cuda.getCudaEnabledDeviceCount() > 0
@@ -21,59 +23,50 @@ class _GpuHelper:
         return gpu_mat.download()
 
 
-class EffectManager:
-    """applies temporary effect to frames coming from peers
+# effect plugins by name; EFFECT_CHAINS in config lists chains of these names
+EFFECTS: Dict[str, type] = {}
 
-    after start_glitch is called for a set of peer IPs, frames belonging to
-    those peers are run through one of three effects for specified duration
-    """
 
-    def __init__(self):
-        # state per peer ip
-        self._state: Dict[str, Dict] = {}
+def register_effect(name: str) -> Callable[[type], type]:
+    """class decorator adding an Effect subclass to EFFECTS under ``name``"""
+    def deco(cls):
+        cls.name = name
+        EFFECTS[name] = cls
+        return cls
+    return deco
 
-        # pre-compute scan-line noise texture for CPU fallback
-        self._scan_noise = np.random.randint(0, 6, (480,), dtype=np.int16)  # per row offset
 
-    
-    def start_glitch(self, peer_ips: List[str], duration_sec: float):
-        now = time.time()
-        for ip in peer_ips:
-            self._state[ip] = {
-                'active': True,
-                't_end': now + duration_sec,
-                'effect': random.randint(0, 2),  # 0,1,2
-            }
+def _to_cpu(mat):
+    """return a numpy array whether mat is a cv2.cuda_GpuMat or already CPU"""
+    if mat is None:
+        return None
+    return mat.download() if hasattr(mat, 'download') else mat
 
-    
-    def apply(self, ip: str, frame):
-        if frame is None:
-            return None
 
-        rec = self._state.get(ip)
-        if not rec or time.time() > rec['t_end']:
-            return frame
+class Effect:
+    """one glitch plugin
 
-        effect_id = rec['effect']
-        if effect_id == 0:
-            return self._channel_shift(frame)
-        elif effect_id == 1:
-            return self._scan_line_offset(frame)
-        else:
-            return self._noise_overlay(frame)
+    apply() draws the effect of ``frame`` into ``out`` (same shape) and
+    returns it, or returns a new array (CUDA paths).  ``frame`` may be a
+    shared pooled buffer and is never written.  ``intensity`` in (0, 1]
+    scales the effect down when the pipeline degrades it
+    """
 
+    name = ''
 
-    @staticmethod
-    def _to_cpu(mat):
-        """return a numpy array whether mat is a cv2.cuda_GpuMat or already CPU"""
-        if mat is None:
-            return None
-        return mat.download() if hasattr(mat, 'download') else mat
+    def __init__(self, assets: EffectAssetCache):
+        self.assets = assets
+
+    def apply(self, frame, out, intensity):
+        raise NotImplementedError
 
-    def _channel_shift(self, frame):
+
+@register_effect('channel_shift')
+class ChannelShift(Effect):
+    def apply(self, frame, out, intensity):
         # small random translation for G channel
-        shift_x = random.randint(-5, 5)
-        shift_y = random.randint(-5, 5)
+        shift_x, shift_y = self.assets.shift()
+        shift_x, shift_y = round(shift_x * intensity), round(shift_y * intensity)
 
         if _GPU_AVAILABLE:
             gpu = cv2.cuda_GpuMat()
@@ -86,26 +79,25 @@ class EffectManager:
             h_src, w_src = frame.shape[:2]
             g_shift = cv2.cuda.warpAffine(g, M, (w_src, h_src))
             merged = cv2.cuda.merge([b, g_shift, r])
-            return self._to_cpu(merged)
+            return _to_cpu(merged)
+
+        # CPU: copy, then overwrite G with a shifted slice of itself; the
+        # strip uncovered by the shift keeps its original G
+        h, w = frame.shape[:2]
+        np.copyto(out, frame)
+        out[max(shift_y, 0):h + min(shift_y, 0), max(shift_x, 0):w + min(shift_x, 0), 1] = \
+            frame[max(-shift_y, 0):h + min(-shift_y, 0), max(-shift_x, 0):w + min(-shift_x, 0), 1]
+        return out
 
-        # # CPU fallback 
-        # g = np.roll(frame[:, :, 1], shift_x, axis=1)
-        # g = np.roll(g, shift_y, axis=0)
-        # out = frame.copy()
-        # out[:, :, 1] = g
-        # return out
 
-    def _scan_line_offset(self, frame):
+@register_effect('scan_line_offset')
+class ScanLineOffset(Effect):
+    def apply(self, frame, out, intensity):
         h, w = frame.shape[:2]
-        out = np.empty_like(frame)
+        # one random horizontal offset per row
+        xmap, ymap = self.assets.scan_maps(h, w, max(1, round(5 * intensity)))
 
         if _GPU_AVAILABLE:
-            # generate offset map on CPU (int16 per row) then upload once
-            offsets = (np.random.randint(-5, 6, (h,), dtype=np.int16))
-            xmap = np.tile(np.arange(w, dtype=np.float32), (h, 1))
-            ymap = np.tile(np.arange(h, dtype=np.float32).reshape(-1, 1), (1, w))
-            for y in range(h):
-                xmap[y] += offsets[y]
             gpu_frame = cv2.cuda_GpuMat()
             gpu_frame.upload(frame)
             gpu_xmap = cv2.cuda_GpuMat()
@@ -113,28 +105,257 @@ class EffectManager:
             gpu_ymap = cv2.cuda_GpuMat()
             gpu_ymap.upload(ymap)
             warped = cv2.cuda.remap(gpu_frame, gpu_xmap, gpu_ymap, interpolation=cv2.INTER_LINEAR)
-            return self._to_cpu(warped)
+            return _to_cpu(warped)
 
-        # # CPU fallback
-        # for y in range(h):
-        #     dx = random.randint(-5, 5)
-        #     out[y] = np.roll(frame[y], dx, axis=1)
-        # return out
+        # CPU: offsets are whole pixels, so nearest is exact; rows wrap around
+        return cv2.remap(frame, xmap, ymap, cv2.INTER_NEAREST, dst=out, borderMode=cv2.BORDER_WRAP)
 
-    def _noise_overlay(self, frame):
-        alpha = 0.5
+
+@register_effect('noise_overlay')
+class NoiseOverlay(Effect):
+    ALPHA = 0.5
+
+    def apply(self, frame, out, intensity):
         h, w = frame.shape[:2]
+        # BGR noise already scaled by alpha: frame + alpha * noise is one saturating add
+        noise_bgr = self.assets.noise(h, w, self.ALPHA * intensity)
         if _GPU_AVAILABLE:
-            noise = np.random.randint(0, 256, (h, w), dtype=np.uint8)
             gpu_frame = cv2.cuda_GpuMat()
             gpu_frame.upload(frame)
             gpu_noise = cv2.cuda_GpuMat()
-            gpu_noise.upload(noise)
-            noise_bgr = cv2.cuda.cvtColor(gpu_noise, cv2.COLOR_GRAY2BGR)
-            out_gpu = cv2.cuda.addWeighted(gpu_frame, 1.0, noise_bgr, alpha, 0.0)
-            return self._to_cpu(out_gpu)
-
-        # noise = np.random.randint(0, 256, frame.shape[:2], dtype=np.uint8)
-        # noise_bgr = cv2.cvtColor(noise, cv2.COLOR_GRAY2BGR)
-        # out = cv2.addWeighted(frame, 1.0, noise_bgr, alpha, 0.0)
-        # return out 
\ No newline at end of file
+            gpu_noise.upload(noise_bgr)
+            out_gpu = cv2.cuda.add(gpu_frame, gpu_noise)
+            return _to_cpu(out_gpu)
+
+        return cv2.add(frame, noise_bgr, dst=out)
+
+
+class _EffectStage:
+    """one effect plus its cost tracking and degrade level
+
+    levels: 0 full, 1 half intensity, 2 half intensity at half resolution,
+    3 as 2 but only every other frame.  The level rises when the average
+    cost goes over the stage's budget and falls again after a run of
+    frames well under it.  The average cost per frame is kept for every
+    level; a level that turns out no cheaper than the one it was entered
+    from (the two resizes of half resolution cost more than a cheap
+    effect) is left again and skipped from then on, and level 3 then
+    keeps full resolution.  The level is shared by all peers; frame parity
+    and half resolution buffers are per peer, so several peers can run
+    the stage at once
+    """
+
+    _LEVELS = 4
+    _RECOVER = 60   # frames under half the budget before stepping back down;
+                    # doubles each time the level has to rise again
+    _JUDGE = 8      # frames at a new level before its cost is compared
+
+    def __init__(self, effect: Effect):
+        self.effect = effect
+        self.level = 0
+        self.frames = 0
+        self.skipped = 0
+        self.ms_avg = 0.0
+        self.ms_max = 0.0
+        self._calm = 0
+        self._recover = self._RECOVER
+        self._lowered = False
+        self._fresh = True    # next cost sample restarts the average
+        self.costs: List[Optional[float]] = [None] * self._LEVELS   # ms per frame offered, per level
+        self.slower = set()   # levels found no cheaper than the level below them
+        self._from = None     # level a rise came from, until the new level is judged
+        self._n = 0           # frames at the current level
+        self._lock = threading.Lock()
+        self._ticks: Dict[str, int] = {}
+        self._small: Dict[tuple, tuple] = {}   # (peer, full shape) -> (half frame, half out)
+
+    def run(self, key, frame, out, budget_ms):
+        """effect of peer ``key``'s ``frame`` (into ``out`` when possible), or
+        ``frame`` itself when skipped"""
+        level = self.level
+        tick = self._ticks[key] = self._ticks.get(key, 0) + 1
+        if level >= 3 and tick & 1:
+            with self._lock:
+                self.skipped += 1
+            return frame
+        intensity = 0.5 if level >= 1 else 1.0
+
+        t0 = time.perf_counter()
+        if level == 2 or (level == 3 and 2 not in self.slower):
+            h, w = frame.shape[:2]
+            bufs = self._small.get((key, frame.shape))
+            if bufs is None:
+                half = np.empty((h // 2, w // 2, 3), np.uint8)
+                bufs = self._small[(key, frame.shape)] = (half, np.empty_like(half))
+            half, half_out = bufs
+            cv2.resize(frame, (w // 2, h // 2), dst=half, interpolation=cv2.INTER_LINEAR)
+            res = self.effect.apply(half, half_out, intensity)
+            res = cv2.resize(res, (w, h), dst=out, interpolation=cv2.INTER_NEAREST)
+        else:
+            res = self.effect.apply(frame, out, intensity)
+        ms = (time.perf_counter() - t0) * 1e3
+        with self._lock:
+            self._account(ms, budget_ms)
+        return res
+
+    def _set_level(self, level, came_from=None):
+        self.level = level
+        self._from = came_from
+        self._fresh = True
+        self._calm = 0
+        self._n = 0
+
+    def _account(self, ms, budget_ms):
+        self.frames += 1
+        self.ms_avg = ms if self._fresh else self.ms_avg * 0.9 + ms * 0.1
+        self.ms_max = max(self.ms_max, ms)
+        self._fresh = False
+        self._n += 1
+        level = self.level
+        # level 3 runs on every other frame only
+        self.costs[level] = self.ms_avg / 2 if level == 3 else self.ms_avg
+        if self._from is not None and self._n >= self._JUDGE:
+            if self.costs[level] >= self.costs[self._from]:
+                # degrading made it slower: go back and never use this level again
+                self.slower.add(level)
+                self._set_level(self._from)
+                return
+            self._from = None
+        elif self._from is not None:
+            return
+        if self.ms_avg > budget_ms:
+            up = next((l for l in range(level + 1, self._LEVELS) if l not in self.slower), None)
+            if up is None:
+                return
+            if self._lowered:
+                # stepped down too early last time; stay degraded longer
+                self._recover = min(self._recover * 2, 32 * self._RECOVER)
+                self._lowered = False
+            self._set_level(up, came_from=level)
+        elif self.ms_avg < budget_ms / 2 and level > 0:
+            self._calm += 1
+            if self._calm >= self._recover:
+                self._set_level(next(l for l in range(level - 1, -1, -1) if l not in self.slower))
+                self._lowered = True
+        else:
+            self._calm = 0
+
+
+class EffectManager:
+    """applies temporary effect to frames coming from peers
+
+    after start_glitch is called for a set of peer IPs, frames belonging to
+    those peers are run through a randomly chosen chain of effect plugins
+    (EFFECT_CHAINS) for specified duration.  Each effect gets an equal share
+    of EFFECT_BUDGET_MS per frame and degrades itself when it overruns it.
+    apply_many() glitches the frames of several peers at once on
+    EFFECT_WORKERS threads.  Without CUDA the effects run on vectorized numpy / OpenCV paths that
+    stay under ~3 ms per 640x480 frame (test_script/bench_effects.py)
+    """
+
+    def __init__(self):
+        # state per peer ip
+        self._state: Dict[str, Dict] = {}
+
+        # random textures / offset tables / remap grids, precomputed per
+        # frame size so a glitch frame only picks one
+        self.assets = EffectAssetCache(getattr(config, 'EFFECT_ASSET_POOL', 8))
+        self.assets.prewarm(config.FRAME_HEIGHT, config.FRAME_WIDTH, NoiseOverlay.ALPHA)
+
+        self.budget_ms = getattr(config, 'EFFECT_BUDGET_MS', 4.0)
+        self._stages: Dict[str, _EffectStage] = {}
+        self.chains: List[List[str]] = []
+        for chain in getattr(config, 'EFFECT_CHAINS', [[n] for n in EFFECTS]):
+            known = [n for n in chain if n in EFFECTS]
+            if len(known) != len(chain):
+                print(f"[WARN] EffectManager: unknown effect in chain {chain}")
+            if known:
+                self.chains.append(known)
+                for n in known:
+                    if n not in self._stages:
+                        self._stages[n] = _EffectStage(EFFECTS[n](self.assets))
+
+        # per peer output frames (two, for chains), reused from frame to frame
+        self._outputs: Dict[str, List[np.ndarray]] = {}
+
+        # multi-peer views glitch every shown frame in parallel; OpenCV and
+        # the large numpy copies release the GIL
+        workers = getattr(config, 'EFFECT_WORKERS', 2)
+        self._executor = ThreadPoolExecutor(workers, 'effect') if workers > 1 else None
+
+    
+    def start_glitch(self, peer_ips: List[str], duration_sec: float):
+        if not self.chains:
+            return
+        now = time.time()
+        for ip in peer_ips:
+            self._state[ip] = {
+                'active': True,
+                't_end': now + duration_sec,
+                'chain': random.choice(self.chains),
+            }
+
+    
+    def active(self, ip: str, now=None) -> bool:
+        rec = self._state.get(ip)
+        return bool(rec) and (time.time() if now is None else now) <= rec['t_end']
+
+
+    def apply(self, ip: str, frame, now=None):
+        if frame is None or not self.active(ip, now):
+            return frame
+
+        t0 = telemetry.start()
+        chain = self._state[ip]['chain']
+        budget = self.budget_ms / len(chain)
+        outs = self._out(ip, frame)
+        for name in chain:
+            # ping-pong between the two outputs so a stage never writes its
+            # input; a skipped stage hands its input on, so go by the buffer
+            out = outs[1] if frame is outs[0] else outs[0]
+            frame = self._stages[name].run(ip, frame, out, budget)
+        telemetry.stop('effects', t0)
+        return frame
+
+
+    def apply_many(self, ips: List[str], frames: List) -> List:
+        """apply() for each (ip, frame) pair, glitched frames in parallel
+
+        every frame is judged against the same clock reading, so panes of
+        one glitch start and stop on the same render; returns once all are done
+        """
+        now = time.time()
+        busy = [i for i, (ip, f) in enumerate(zip(ips, frames)) if f is not None and self.active(ip, now)]
+        if len(busy) < 2 or self._executor is None:
+            return [self.apply(ip, f, now) for ip, f in zip(ips, frames)]
+        out = list(frames)
+        futures = [(i, self._executor.submit(self.apply, ips[i], frames[i], now)) for i in busy]
+        for i, fut in futures:
+            out[i] = fut.result()
+        return out
+
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+
+
+    def stats(self):
+        """per effect: frames applied / skipped, cost and current degrade level"""
+        return {name: {'frames': st.frames,
+                       'skipped': st.skipped,
+                       'level': st.level,
+                       'ms_avg': round(st.ms_avg, 3),
+                       'ms_max': round(st.ms_max, 3),
+                       'level_ms': [None if c is None else round(c, 3) for c in st.costs],
+                       'slower': sorted(st.slower)}
+                for name, st in self._stages.items()}
+
+
+    def _out(self, ip, frame):
+        """per-peer output frames, reused while the size stays the same; the
+        input frame may be a shared pooled buffer and is never written"""
+        outs = self._outputs.get(ip)
+        if outs is None or outs[0].shape != frame.shape:
+            outs = self._outputs[ip] = [np.empty_like(frame), np.empty_like(frame)]
+        return outs
@@ -0,0 +1,115 @@
+import collections, itertools, threading, time, telemetry
+from typing import Callable, Optional
+
+
+class EncodePipeline:
+    """encode/send stage between the capture loop and the network
+
+    captured frames go into a fixed-depth queue; when it is full the oldest
+    frame is dropped, so a slow link sheds stale frames instead of growing
+    a backlog.  Frames are numbered on submit and workers encode in
+    parallel, but a frame is only sent if it is newer than the last frame
+    sent, so peers never see frames out of order.  ``release`` is called
+    exactly once per submitted frame, after it was sent or dropped.
+    ``send(payload, t_capture)`` gets the frame's capture stamp along
+    """
+
+    def __init__(self, encode: Callable, send: Callable, depth: int = 1, workers: int = 2,
+                 release: Optional[Callable] = None):
+        self._encode = encode
+        self._send = send
+        self._release = release
+        self._queue = collections.deque(maxlen=max(1, depth))
+        self._cond = threading.Condition()
+        self._send_lock = threading.Lock()
+        self._seq = itertools.count(1)
+        self._last_sent = 0
+        self._running = True
+
+        self.submitted = 0
+        self.sent = 0
+        self.dropped_queue = 0   # replaced in the queue by a newer frame
+        self.dropped_late = 0    # encoded after a newer frame was already sent
+        self.errors = 0
+        self.latency_ms_avg = 0.0  # capture -> handed to the socket
+        self.latency_ms_max = 0.0
+
+        self._threads = [threading.Thread(target=self._loop, name=f'encode-{i}', daemon=True)
+                         for i in range(max(1, workers))]
+        for t in self._threads:
+            t.start()
+
+
+    def submit(self, frame, t_capture=None):
+        """queue a frame; never blocks.  ``t_capture`` is a time.monotonic() stamp"""
+        if t_capture is None:
+            t_capture = time.monotonic()
+        dropped = None
+        with self._cond:
+            if len(self._queue) == self._queue.maxlen:
+                self.dropped_queue += 1
+                telemetry.count('encode_dropped_queue')
+                dropped = self._queue[0][2]
+            self._queue.append((next(self._seq), t_capture, frame))
+            self.submitted += 1
+            self._cond.notify()
+        if dropped is not None and self._release is not None:
+            self._release(dropped)
+
+
+    def _loop(self):
+        while True:
+            with self._cond:
+                while self._running and not self._queue:
+                    self._cond.wait()
+                if not self._queue:
+                    return
+                seq, t_capture, frame = self._queue.popleft()
+
+            try:
+                t0 = telemetry.start()
+                payload = self._encode(frame)
+                telemetry.stop('encode', t0)
+                if payload is None:
+                    continue
+                with self._send_lock:
+                    if seq < self._last_sent:
+                        self.dropped_late += 1
+                        telemetry.count('encode_dropped_late')
+                        continue
+                    self._last_sent = seq
+                    t0 = telemetry.start()
+                    self._send(payload, t_capture)
+                    telemetry.stop('send', t0)
+                    ms = (time.monotonic() - t_capture) * 1e3
+                    self.sent += 1
+                    self.latency_ms_avg = ms if self.sent == 1 else self.latency_ms_avg * 0.9 + ms * 0.1
+                    self.latency_ms_max = max(self.latency_ms_max, ms)
+            except Exception as e:
+                self.errors += 1
+                print('ENC task EXCEPTION', e)
+            finally:
+                if self._release is not None:
+                    self._release(frame)
+
+
+    def stats(self):
+        with self._cond:
+            depth = len(self._queue)
+        return {'queue': depth,
+                'submitted': self.submitted,
+                'sent': self.sent,
+                'dropped_queue': self.dropped_queue,
+                'dropped_late': self.dropped_late,
+                'errors': self.errors,
+                'latency_ms_avg': round(self.latency_ms_avg, 3),
+                'latency_ms_max': round(self.latency_ms_max, 3)}
+
+
+    def close(self, timeout=2.0):
+        """finish frames already queued, then stop the workers"""
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        for t in self._threads:
+            t.join(timeout=timeout)
@@ -0,0 +1,67 @@
+import math, struct
+import numpy as np
+
+
+# interleaved XOR parity for the chunked frame protocol
+#
+# a frame of ``total`` data chunks gets ``n_parity`` extra chunks; parity j is
+# the XOR of every data chunk with cid % n_parity == j (the last chunk is zero
+# padded).  Each parity repairs one missing chunk of its stride, so any burst
+# of up to n_parity consecutive losses, e.g. a dropped tail, is recoverable.
+# Parity chunks travel with cid = total + j, which old receivers reject as an
+# out-of-range cid, so they simply ignore them
+#
+# a parity payload starts with (n_parity, frame_len) so the receiver learns the
+# stride, the data chunk size and the true length of the last chunk
+
+FEC_HDR = struct.Struct('!HI')
+
+
+def parity_count(total, overhead, max_parity):
+    """number of parity chunks for a frame of ``total`` data chunks"""
+    if overhead <= 0 or total < 2:
+        return 0
+    return max(1, min(total - 1, max_parity, math.ceil(total * overhead)))
+
+
+def encode_parity(payload, chunk, n_parity):
+    """return ``n_parity`` parity payloads (FEC_HDR + XOR block) for ``payload``"""
+    size = len(payload)
+    total = (size + chunk - 1) // chunk
+    rows = np.zeros((total, chunk), np.uint8)
+    rows.reshape(-1)[:size] = np.frombuffer(payload, np.uint8)
+    out = []
+    for j in range(n_parity):
+        xor = np.bitwise_xor.reduce(rows[j::n_parity], axis=0)
+        out.append(FEC_HDR.pack(n_parity, size) + xor.tobytes())
+    return out
+
+
+def recover_rows(rows, mask, parity_rows, parity_mask, n_parity):
+    """rebuild missing data chunks in place
+
+    ``rows`` is a (total, chunk) uint8 view of the frame buffer with the last
+    chunk zero padded, ``mask`` / ``parity_mask`` are bitmaps of the data and
+    parity rows present.  Returns the bitmap of rows rebuilt
+    """
+    total = rows.shape[0]
+    rebuilt = 0
+    for j in range(n_parity):
+        if not parity_mask >> j & 1:
+            continue
+        missing = -1
+        for cid in range(j, total, n_parity):
+            if not mask >> cid & 1:
+                if missing >= 0:
+                    missing = -2  # two holes in this stride, not repairable
+                    break
+                missing = cid
+        if missing < 0:
+            continue
+        acc = rows[missing]
+        np.copyto(acc, parity_rows[j])
+        for cid in range(j, total, n_parity):
+            if cid != missing:
+                np.bitwise_xor(acc, rows[cid], out=acc)
+        rebuilt |= 1 << missing
+    return rebuilt
@@ -0,0 +1,73 @@
+import threading, time
+from typing import Dict, Iterable, Tuple
+
+
+class FrameMailbox:
+    """generation counter per frame source (local camera, each peer ip)
+    behind one shared condition
+
+    producers post() after publishing a frame wherever it is stored; the
+    render loop waits until a source it shows moves past the generation it
+    last drew, so it neither polls nor redraws unchanged frames.  kick()
+    wakes the waiter without a frame, e.g. for a key press
+    """
+
+    def __init__(self, sources: Iterable[str] = ()):
+        self._cond = threading.Condition()
+        self._gen: Dict[str, int] = dict.fromkeys(sources, 0)
+        self._posted: Dict[str, float] = {}  # source -> monotonic time of its last post
+        self._kicked = False
+
+        self.latency_ms_avg = 0.0  # post -> drawn, for frames that were drawn
+        self.latency_ms_max = 0.0
+        self._drawn = 0
+
+
+    def post(self, source):
+        with self._cond:
+            self._gen[source] = self._gen.get(source, 0) + 1
+            self._posted[source] = time.monotonic()
+            self._cond.notify_all()
+
+
+    def kick(self):
+        with self._cond:
+            self._kicked = True
+            self._cond.notify_all()
+
+
+    def generations(self, sources) -> Tuple[int, ...]:
+        with self._cond:
+            return tuple(self._gen.get(s, 0) for s in sources)
+
+
+    def wait(self, sources, seen, timeout):
+        """block until generations(sources) != seen, a kick, or timeout;
+        True unless it timed out"""
+        sources = tuple(sources)
+        with self._cond:
+            ok = self._cond.wait_for(
+                lambda: self._kicked or tuple(self._gen.get(s, 0) for s in sources) != seen,
+                timeout)
+            self._kicked = False
+            return ok
+
+
+    def drawn(self, sources, seen, gens):
+        """record that ``gens`` were drawn, having last drawn ``seen``"""
+        now = time.monotonic()
+        with self._cond:
+            for s, old, new in zip(sources, seen, gens):
+                if old == new or s not in self._posted:
+                    continue
+                ms = (now - self._posted[s]) * 1e3
+                self._drawn += 1
+                self.latency_ms_avg = ms if self._drawn == 1 else self.latency_ms_avg * 0.9 + ms * 0.1
+                self.latency_ms_max = max(self.latency_ms_max, ms)
+
+
+    def stats(self):
+        with self._cond:
+            return {'generations': dict(self._gen),
+                    'latency_ms_avg': round(self.latency_ms_avg, 3),
+                    'latency_ms_max': round(self.latency_ms_max, 3)}
@@ -1,10 +1,13 @@
-import threading, time, concurrent.futures, random, config, cv2, queue
+import threading, time, random, config, cv2, queue, telemetry
 from camera_manager import CameraManager
 from network_manager import NetworkManager
 from stream_processor import StreamProcessor
 from display_manager import DisplayManager
 from app_state import AppState
-from codec_utils import encode_bgr_to_jpeg
+from buffer_pool import BufferPool, FrameBuffer
+from encode_pipeline import EncodePipeline
+from frame_mailbox import FrameMailbox
+from quality_controller import QualityController
 from transition_manager import TransitionManager
 from effect_manager import EffectManager
 from button_listener import ButtonListener
@@ -13,18 +16,40 @@ from button_listener import ButtonListener
 class VideoStreamerApp:
     def __init__(self):
         peers = config.get_other_peer_infos(config.MY_ID, config.PEER_NANO_INFO)
-        self.cam  = CameraManager()
+        # frame arrays shared by capture, encode, decode and display
+        self.pool = BufferPool(getattr(config, 'BUFFER_POOL_FREE', 8))
+        # new-frame notifications from capture / receive to the render loop
+        self.mail = FrameMailbox([AppState.LOCAL] + [p['ip'] for p in peers])
+        self.cam  = CameraManager(self.pool)
         self.net  = NetworkManager(config.UDP_PORT, peers)
-        self.proc = StreamProcessor([p['ip'] for p in peers])
+        # quality / scale / frame rate of the outgoing stream, steered by the
+        # peers' receiver reports
+        self.qc = None
+        if getattr(config, 'ADAPTIVE_QUALITY', False):
+            # MJPEG passthrough sends the camera's JPEGs as they are: only the rate can change
+            self.qc = QualityController(passthrough=self.cam.format == 'MJPEG')
+        self.proc = StreamProcessor([p['ip'] for p in peers], self.pool, self.mail,
+                                    control=self.qc.on_control if self.qc else None)
         self.disp = DisplayManager(window_title=config.PEER_NANO_INFO[config.MY_ID]['name'])
         self.state= AppState(config.MY_ID, config.PEER_NANO_INFO, config.KEY_MAPPINGS)
         self.trans = TransitionManager(config.CLIP_DIR, config.TRANSITION_CHANCE,
-                                       window_size=(config.FRAME_WIDTH, config.FRAME_HEIGHT))
+                                       window_size=(config.FRAME_WIDTH, config.FRAME_HEIGHT),
+                                       prefetch_frames=getattr(config, 'CLIP_PREFETCH_FRAMES', 60),
+                                       store=getattr(config, 'CLIP_STORE', None))
         self.effects = EffectManager()
         self.running = True
-        self.pool = concurrent.futures.ThreadPoolExecutor(max_workers=2)
-        # last captured local frame for LOCAL view
-        self._latest_local_frame = None
+        # bounded, latest-wins encode/send stage fed by the capture loop;
+        # it owns the capture's reference to each frame buffer
+        self.encoder = EncodePipeline(self._encode, self.net.send_jpeg,
+                                      depth=getattr(config, 'ENCODE_QUEUE_LEN', 1),
+                                      workers=getattr(config, 'ENCODE_WORKERS', 2),
+                                      release=FrameBuffer.release)
+        # last captured local frame for LOCAL view, in the camera's format;
+        # converted to BGR only when the LOCAL view is actually drawn
+        self._local_lock = threading.Lock()
+        self._latest_local_frame = None  # FrameBuffer, one reference held
+        self._local_src = None           # FrameBuffer behind _local_bgr, one reference held
+        self._local_bgr = None
 
         # queue for keys coming from external button controller
         self._key_queue: "queue.Queue[int]" = queue.Queue()
@@ -36,33 +61,103 @@ class VideoStreamerApp:
         else:
             self.btn_listener = None
 
+        # component stats ride along in every telemetry snapshot
+        if telemetry.enabled():
+            telemetry.provide('peers', self.proc.stats)
+            telemetry.provide('encoder', self.encoder.stats)
+            telemetry.provide('buffer_pool', self.pool.stats)
+            telemetry.provide('effects', self.effects.stats)
+            telemetry.provide('display', self.disp.stats)
+            if self.qc is not None:
+                telemetry.provide('quality', self.qc.stats)
+            telemetry.serve()
+
 
     # background threads
     def _capture_loop(self):
+        next_send = 0.0
         while self.running:
-            frame = self.cam.capture()
-            if frame is not None:
-                self._latest_local_frame = frame          # keep for LOCAL view
-                self.pool.submit(self._encode_and_send, frame)
-            time.sleep(0.001)
+            # paced by FPS_LIMIT and by the camera itself
+            fb = self.cam.capture()
+            if fb is None:
+                time.sleep(0.005)  # read failed; don't spin on a dead camera
+                continue
+            # keep for LOCAL view
+            fb.retain()
+            with self._local_lock:
+                old, self._latest_local_frame = self._latest_local_frame, fb
+            if old is not None:
+                old.release()
+            self.mail.post(AppState.LOCAL)
+            now = time.monotonic()
+            if self.qc is not None and self.qc.fps < self.qc.fps_max:
+                # link can't take every frame; the local view still gets them
+                if now < next_send:
+                    fb.release()
+                    continue
+                next_send = max(next_send + 1.0 / self.qc.fps, now)
+            self.encoder.submit(fb, now)
 
 
-    def _encode_and_send(self, frame):
-        # print('ENC task start')  
-        try:
-            jpeg = encode_bgr_to_jpeg(frame, config.JPEG_QUALITY)
-            # print('SEND -> jpeg', len(jpeg), 'bytes')  
-            self.net.send_jpeg(jpeg)
-        except Exception as e:
-            print('ENC task EXCEPTION', e)
+    def _encode(self, fb):
+        # runs on an encode worker; sending and error reporting are done by the pipeline
+        # MJPEG passthrough hands the camera's JPEG through unchanged
+        if self.qc is None:
+            return self.cam.to_jpeg(fb.array, config.JPEG_QUALITY)
+        quality, scale, _fps = self.qc.settings()
+        return self.cam.to_jpeg(fb.array, quality, scale)
+
+
+    def _local_frame(self):
+        # the BGR frame stays valid until the next call: its buffer is held
+        # until a newer capture is converted
+        with self._local_lock:
+            fb = self._latest_local_frame
+            if fb is None or fb is self._local_src:
+                return self._local_bgr
+            fb.retain()
+        if self._local_src is not None:
+            self._local_src.release()
+        self._local_src = fb
+        self._local_bgr = self.cam.to_bgr(fb.array)
+        return self._local_bgr
+
+
+    def _release_all(self, held):
+        for fb in held:
+            if fb is not None:
+                fb.release()
+        held.clear()
+
+
+    def _peer_frame(self, held, ip, size=None):
+        # peer frames are held until the end of the render tick
+        fb = self.proc.acquire(ip, size)
+        held.append(fb)
+        return fb.array if fb is not None else None
+
+
+    def _peer_frames(self, held, ips, size=None):
+        # lazy decode: the tiles' new frames are decoded in parallel
+        fbs = self.proc.acquire_many(ips, size)
+        held.extend(fbs)
+        return [fb.array if fb is not None else None for fb in fbs]
+
+
+    def _view_key(self, sources):
+        return self.state.view_mode, self.state.single_target, tuple(sources)
 
 
     def _receiver_loop(self):
         while self.running:
-            data, ip = self.net.recv_datagram()
-            if data:
-                # print('RECV <-', len(data), 'bytes from', ip)  
-                self.proc.process_datagram(data, ip)
+            batch = self.net.recv_batch()
+            if batch:
+                # print('RECV <-', len(batch), 'datagrams')  
+                self.proc.process_datagrams(batch)
+            # receiver reports for the peers' quality controllers, and the
+            # pings / pongs behind the end-to-end latency figures
+            for ip, data in self.proc.outgoing():
+                self.net.send_control(ip, data)
 
 
     
@@ -73,7 +168,32 @@ class VideoStreamerApp:
         self.t_capture.start()
         self.t_recv.start()
 
+        key_poll = getattr(config, 'KEY_POLL_MS', 20) / 1000
+        render_fps = getattr(config, 'RENDER_FPS', 60)
+        min_interval = 1.0 / render_fps if render_fps else 0.0
+        held = []
+        seen, shown = (), None  # generations and view last drawn
+        last_draw = 0.0
+        clip_held = False       # the last clip frame asked for was not ready
         while self.running:
+            self._release_all(held)
+            sources = self.state.current_view_peer_ips()
+            # with many peers every one of them posts; drawing at most
+            # RENDER_FPS times a second lets their updates coalesce
+            hold = last_draw + min_interval - time.monotonic()
+            if hold > 0:
+                self.mail.wait((), (), hold)
+            if self.state.view_mode == 'TRANSITION':
+                # a clip has no producer to post frames; sleep until its next
+                # frame is due, still polling window keys.  A frame already due
+                # but not decoded yet is polled for, not spun on
+                due = self.trans.time_to_next()
+                self.mail.wait((), (), key_poll if clip_held and due <= 0 else min(due, key_poll))
+            elif self._view_key(sources) == shown:
+                # idle until a shown source has a new frame or a button is
+                # pressed; window keys can only be polled, hence the timeout
+                self.mail.wait(sources, seen, key_poll)
+
             # fetch key from external queue if any; otherwise poll cv2 window
             try:
                 k = self._key_queue.get_nowait()
@@ -104,10 +224,22 @@ class VideoStreamerApp:
                         ips = self.state.current_view_peer_ips()
                         self.effects.start_glitch(ips, config.GLITCH_SEC)
 
+            # skip the redraw if nothing on screen changed; a running glitch
+            # changes every redraw, so it is re-applied to the last frames
+            sources = self.state.current_view_peer_ips()
+            view = self._view_key(sources)
+            gens = self.mail.generations(sources)
+            if self.state.view_mode != 'TRANSITION' and view == shown and gens == seen \
+                    and not any(self.effects.active(ip) for ip in sources):
+                continue
+
             # render according to current mode
             if self.state.view_mode == 'TRANSITION':
                 frame, done = self.trans.next_frame()
-                self.disp.show_fullscreen(frame)
+                clip_held = frame is None and not done
+                if frame is not None:
+                    # None: hold the frame on screen (next one not due yet, or decoder behind)
+                    self.disp.show_fullscreen(frame)
                 if done:
                     # apply pending view and start glitch
                     self.state.activate_pending_view()
@@ -117,28 +249,39 @@ class VideoStreamerApp:
             elif self.state.view_mode == 'SINGLE':
                 if self.state.single_is_local():
                     # show local camera with possible glitch overlay
-                    frame = self.effects.apply(AppState.LOCAL,
-                                               self._latest_local_frame)
+                    frame = self.effects.apply(AppState.LOCAL, self._local_frame())
                     name  = config.PEER_NANO_INFO[config.MY_ID]['name']
                     self.disp.show_single(frame, name)
                 else:
                     ip   = self.state.current_single_ip()
                     name = self.state.current_single_name()
-                    frame = self.proc.latest(ip)
+                    frame = self._peer_frame(held, ip)
                     frame = self.effects.apply(ip, frame)
                     self.disp.show_single(frame, name)
 
+            elif self.state.view_mode == 'GRID':
+                t = self.state.grid_targets()
+                size = self.disp.grid_tile_size(len(t))
+                ips = [p['ip'] for p in t]
+                frames = self.effects.apply_many(ips, self._peer_frames(held, ips, size))
+                self.disp.show_grid(frames, [p['name'] for p in t])
+
             else:  # DUAL
                 t = self.state.dual_targets()
                 if len(t) == 2:
-                    f1 = self.proc.latest(t[0]['ip']); f2 = self.proc.latest(t[1]['ip'])
-                    f1 = self.effects.apply(t[0]['ip'], f1)
-                    f2 = self.effects.apply(t[1]['ip'], f2)
+                    size = self.disp.pane_size()
+                    ips = [t[0]['ip'], t[1]['ip']]
+                    # both panes glitched concurrently, joined before composing
+                    f1, f2 = self.effects.apply_many(ips, self._peer_frames(held, ips, size))
                     self.disp.show_dual(f1, t[0]['name'], f2, t[1]['name'])
                 elif len(t) == 1:
-                    f1 = self.proc.latest(t[0]['ip']); f1 = self.effects.apply(t[0]['ip'], f1)
+                    f1 = self._peer_frame(held, t[0]['ip']); f1 = self.effects.apply(t[0]['ip'], f1)
                     self.disp.show_single(f1, t[0]['name'])
-            time.sleep(0.01)
+            if view == shown:
+                self.mail.drawn(sources, seen, gens)
+            seen, shown = gens, view
+            last_draw = time.monotonic()
+        self._release_all(held)
         self.cleanup()
 
 
@@ -153,13 +296,21 @@ class VideoStreamerApp:
             self.t_recv.join(timeout=2.0)
 
         # all encode tasks must be done before closing the sockets
-        self.pool.shutdown(wait=True)
+        self.encoder.close()
+        self.effects.close()
+        self.trans.close()
 
+        for fb in (self._latest_local_frame, self._local_src):
+            if fb is not None:
+                fb.release()
+        self._latest_local_frame = self._local_src = None
         self.cam.release()
+        self.proc.close()
         self.net.close()
         self.disp.close()
         if self.btn_listener:
             self.btn_listener.stop()
+        telemetry.close()
         cv2.destroyAllWindows()
 
 
@@ -169,6 +320,7 @@ class VideoStreamerApp:
             self._key_queue.put_nowait(key_code)
         except queue.Full:
             pass
+        self.mail.kick()
 
 
 if __name__ == '__main__':
@@ -1,8 +1,84 @@
-import socket, struct, itertools, config
+import socket, itertools, threading, time, collections, config
+from socket_utils import DatagramBatch, DatagramReceiver
+from fec_utils import FEC_HDR, parity_count, encode_parity
+from protocol import HDR_V1, HDR_V2, MAGIC_V2, VERSION_2, FLAGS_NONE
 
 
-_HDR = struct.Struct('!HHH')
-_MAX_PAYLOAD = config.MAX_DATAGRAM - _HDR.size
+_RECV_TIMEOUT = 0.5
+
+
+class _Pacer:
+    """sender thread draining queued datagrams through a byte token bucket
+
+    the bucket refills at the queued bytes divided by ``window`` seconds,
+    recomputed whenever a frame is queued, so each frame is spread over the
+    window and a backlog left by the previous frame is finished inside the
+    next one rather than dropped.  At most ``burst`` datagrams leave back
+    to back
+    """
+
+    def __init__(self, sock, window, burst):
+        self._sock = sock
+        self._window = window
+        self._depth = max(1, burst) * config.MAX_DATAGRAM
+        self._queue = collections.deque()   # (parts, addr, size)
+        self._cond = threading.Condition()
+        self._backlog = 0
+        self._rate = 1.0   # bytes per second
+        self._running = True
+
+        self.frames = 0
+        self.datagrams = 0
+        self.backlog_max = 0   # bytes queued, highest seen when a frame arrived
+        self._thread = threading.Thread(target=self._loop, name='pacer', daemon=True)
+        self._thread.start()
+
+
+    def submit(self, packets):
+        """queue one frame's datagrams; never blocks"""
+        with self._cond:
+            for p in packets:
+                self._queue.append(p)
+                self._backlog += p[2]
+            self._rate = max(self._backlog / self._window, 1.0)
+            self.frames += 1
+            self.backlog_max = max(self.backlog_max, self._backlog)
+            self._cond.notify()
+
+
+    def close(self):
+        with self._cond:
+            self._running = False
+            self._cond.notify()
+        self._thread.join(timeout=1.0)
+
+
+    def _loop(self):
+        tokens = float(self._depth)
+        t = time.monotonic()
+        while True:
+            with self._cond:
+                while self._running and not self._queue:
+                    self._cond.wait()
+                if not self._running:
+                    return
+                parts, addr, size = self._queue.popleft()
+                self._backlog -= size
+                rate = self._rate
+            now = time.monotonic()
+            tokens = min(self._depth, tokens + (now - t) * rate)
+            t = now
+            if tokens < size:
+                time.sleep((size - tokens) / rate)
+                now = time.monotonic()
+                tokens = min(self._depth, tokens + (now - t) * rate)
+                t = now
+            tokens -= size
+            try:
+                self._sock.sendmsg(parts, (), 0, addr)
+            except Exception:
+                pass
+            self.datagrams += 1
 
 
 class NetworkManager:
@@ -10,34 +86,155 @@ class NetworkManager:
         self._send = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
         self._recv = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
         self._recv.bind(('0.0.0.0', local_port))
-        self._recv.settimeout(0.5)
+        self._recv.settimeout(_RECV_TIMEOUT)
         self.targets = [(p['ip'], local_port) for p in peer_infos]
+        self._port = local_port
         self._fid = itertools.count(0)
 
+        # v2 headers carry a 32-bit sequence number and the capture time;
+        # PROTOCOL_VERSION = 1 keeps peers running the old receiver working
+        self.version = 2 if getattr(config, 'PROTOCOL_VERSION', 2) >= 2 else 1
+        self._hdr = HDR_V2 if self.version == 2 else HDR_V1
+        max_payload = config.MAX_DATAGRAM - self._hdr.size
+
+        # with FEC on, data chunks shrink so a parity chunk (which carries a
+        # small FEC header) still fits in MAX_DATAGRAM
+        self._fec_overhead = getattr(config, 'FEC_OVERHEAD', 0.0)
+        self._fec_max = getattr(config, 'FEC_MAX_PARITY', 8)
+        self._chunk = max_payload - FEC_HDR.size if self._fec_overhead > 0 else max_payload
+
+        # one header slot per chunk, reused for every frame
+        self._alloc_headers(64)
+        # encode workers share the header buffer and the send batch
+        self._tx_lock = threading.Lock()
+
+        # paced mode: frames are queued for a sender thread that spreads their
+        # datagrams over PACE_FRACTION of the frame interval
+        pace = getattr(config, 'PACE_FRACTION', 0.0)
+        self._pacer = None
+        if pace > 0:
+            self._pacer = _Pacer(self._send, pace / (config.FPS_LIMIT or 30),
+                                 getattr(config, 'PACE_BURST', 4))
 
-    def send_jpeg(self, jpeg_bytes):
-        fid = next(self._fid) & 0xFFFF
-        total = (len(jpeg_bytes) + _MAX_PAYLOAD - 1) // _MAX_PAYLOAD
-        for cid in range(total):
-            start = cid * _MAX_PAYLOAD
-            end   = start + _MAX_PAYLOAD
-            header = _HDR.pack(fid, cid, total)
-            chunk  = header + jpeg_bytes[start:end]
-            for addr in self.targets:
-                try:
-                    self._send.sendto(chunk, addr)
-                except Exception:
-                    pass
+        # batched mode: one sendmmsg per frame, one recvmmsg per wakeup
+        self.batched = getattr(config, 'NET_BATCH_IO', False)
+        if self.batched:
+            self._tx = DatagramBatch(self._send, getattr(config, 'SEND_BATCH', 64), max_parts=2)
+            self._rx = DatagramReceiver(self._recv, getattr(config, 'RECV_BATCH', 32),
+                                        config.MAX_DATAGRAM)
+
+
+    def _alloc_headers(self, count):
+        hs = self._hdr.size
+        self._hdr_buf = bytearray(count * hs)
+        view = memoryview(self._hdr_buf)
+        self._hdr_views = [view[i * hs:(i + 1) * hs] for i in range(count)]
+
+
+    def _fields(self, fid, total, t_capture):
+        """header fields for chunk cid of one frame, as a function of cid"""
+        if self.version == 1:
+            return lambda cid: (fid, cid, total)
+        t_us = int((time.monotonic() if t_capture is None else t_capture) * 1e6)
+        return lambda cid: (MAGIC_V2, VERSION_2, FLAGS_NONE, fid, cid, total, t_us)
+
+
+    def send_jpeg(self, jpeg_bytes, t_capture=None):
+        """send one frame to every peer; ``t_capture`` is the time.monotonic()
+        stamp of its capture, carried in v2 headers for latency measurement"""
+        fid = next(self._fid) & (0xFFFFFFFF if self.version == 2 else 0xFFFF)
+        size = len(jpeg_bytes)
+        chunk = self._chunk
+        total = (size + chunk - 1) // chunk
+        n_parity = parity_count(total, self._fec_overhead, self._fec_max)
+        parity = encode_parity(jpeg_bytes, chunk, n_parity) if n_parity else ()
+        HDR, fields = self._hdr, self._fields(fid, total, t_capture)
+        if self._pacer is not None:
+            # the pacer sends later, so every datagram gets its own header
+            # instead of a slot in the shared buffer
+            payload = memoryview(jpeg_bytes)
+            packets = []
+            for cid in range(total + n_parity):
+                body = payload[cid * chunk:(cid + 1) * chunk] if cid < total else parity[cid - total]
+                parts = (HDR.pack(*fields(cid)), body)
+                for addr in self.targets:
+                    packets.append((parts, addr, HDR.size + len(body)))
+            self._pacer.submit(packets)
+            return
+        with self._tx_lock:
+            # headers are packed into one preallocated buffer and the payload
+            # is sent straight out of the encoder's buffer: no per-chunk copies
+            if len(self._hdr_views) < total + n_parity:
+                self._alloc_headers(total + n_parity)
+            hdr = self._hdr_buf
+            hs = HDR.size
+            for cid in range(total + n_parity):
+                HDR.pack_into(hdr, cid * hs, *fields(cid))
+
+            if self.batched:
+                add = self._tx.add
+                for cid in range(total):
+                    h = cid * hs
+                    start = cid * chunk
+                    end = min(start + chunk, size)
+                    for addr in self.targets:
+                        add(addr, (hdr, h, h + hs), (jpeg_bytes, start, end))
+                for j, par in enumerate(parity):
+                    h = (total + j) * hs
+                    for addr in self.targets:
+                        add(addr, (hdr, h, h + hs), (par, 0, len(par)))
+                self._tx.flush()
+                return
+
+            payload = memoryview(jpeg_bytes)
+            parts = [None, None]
+            for cid in range(total + n_parity):
+                parts[0] = self._hdr_views[cid]
+                if cid < total:
+                    parts[1] = payload[cid * chunk:(cid + 1) * chunk]
+                else:
+                    parts[1] = parity[cid - total]
+                for addr in self.targets:
+                    try:
+                        self._send.sendmsg(parts, (), 0, addr)
+                    except Exception:
+                        pass
+
+
+    def send_control(self, ip, data):
+        """one control datagram (receiver report, ping, pong) to a peer"""
+        try:
+            self._send.sendto(data, (ip, self._port))
+        except Exception:
+            pass
 
 
     def recv_datagram(self):
         try:
             data, (ip, _p) = self._recv.recvfrom(config.MAX_DATAGRAM)
             return data, ip
-        except socket.timeout:
+        except (socket.timeout, BlockingIOError):
             return None, None
 
 
+    def recv_batch(self):
+        """return a list of ``(payload, ip)`` tuples, empty on timeout"""
+        if self.batched:
+            return self._rx.recv(_RECV_TIMEOUT)
+        data, ip = self.recv_datagram()
+        return [(data, ip)] if data else []
+
+
+    def pacing_stats(self):
+        """frames / datagrams through the pacer and its largest backlog, or None"""
+        p = self._pacer
+        if p is None:
+            return None
+        return {'frames': p.frames, 'datagrams': p.datagrams, 'backlog_max': p.backlog_max}
+
+
     def close(self):
+        if self._pacer is not None:
+            self._pacer.close()
         self._send.close()
         self._recv.close()
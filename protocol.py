@@ -0,0 +1,90 @@
+import collections, struct, time
+from typing import Optional
+
+
+# video chunk headers
+#
+# v1  !HHH          fid (16 bit), cid, total
+# v2  !2sBBIHHQ     b'P2', version 2, flags, seq (32 bit), cid, total,
+#                   capture time in the sender's monotonic microseconds
+#
+# a v1 chunk always has cid < 256, so its third byte is 0; a datagram that
+# starts with b'P2' followed by the version byte 2 is therefore never v1.
+# Receivers take both, senders send PROTOCOL_VERSION
+HDR_V1 = struct.Struct('!HHH')
+HDR_V2 = struct.Struct('!2sBBIHHQ')
+MAGIC_V2 = b'P2'
+VERSION_2 = 2
+# no flags are defined yet; receivers ignore bits they do not know
+FLAGS_NONE = 0
+
+
+def is_v2(data) -> bool:
+    return len(data) >= HDR_V2.size and data[2] == VERSION_2 and data[:2] == MAGIC_V2
+
+
+def now_us() -> int:
+    """the monotonic clock v2 capture times and ping/pong stamps use"""
+    return time.monotonic_ns() // 1000
+
+
+# control datagrams share the port and the v1 layout of the video chunks:
+# total == 0 (never valid for video) and cid says what follows
+CTRL_HDR    = struct.Struct('!HHH')   # seq, kind, 0
+CTRL_REPORT = 1                       # receiver report, see quality_controller
+CTRL_PING   = 2                       # t1
+CTRL_PONG   = 3                       # t1 echoed, t2 ping received, t3 pong sent
+PING = struct.Struct('!Q')
+PONG = struct.Struct('!QQQ')
+
+
+def control_kind(data) -> Optional[int]:
+    """kind of a control datagram, None for video"""
+    if len(data) < CTRL_HDR.size or is_v2(data):
+        return None
+    _seq, kind, total = CTRL_HDR.unpack_from(data)
+    return kind if total == 0 else None
+
+
+def pack_ping(seq):
+    return CTRL_HDR.pack(seq & 0xFFFF, CTRL_PING, 0) + PING.pack(now_us())
+
+
+def pack_pong(ping, t_recv):
+    """answer to ``ping``, received at ``t_recv`` (now_us)"""
+    if len(ping) < CTRL_HDR.size + PING.size:
+        return None
+    seq = CTRL_HDR.unpack_from(ping)[0]
+    t1, = PING.unpack_from(ping, CTRL_HDR.size)
+    return CTRL_HDR.pack(seq, CTRL_PONG, 0) + PONG.pack(t1, t_recv, now_us())
+
+
+class ClockSync:
+    """offset of one peer's monotonic clock from ours, from ping/pong
+
+    each pong gives offset = ((t2 - t1) + (t3 - t4)) / 2 and round trip
+    (t4 - t1) - (t3 - t2); queueing skews the offset by up to half the
+    round trip, so the estimate is the sample with the shortest round trip
+    among the last ``window``
+    """
+
+    def __init__(self, window=8):
+        self._samples = collections.deque(maxlen=window)   # (rtt_us, offset_us)
+        self.offset_us: Optional[float] = None   # peer clock - our clock
+        self.rtt_us: Optional[float] = None
+
+    def on_pong(self, data, t4):
+        if len(data) < CTRL_HDR.size + PONG.size:
+            return
+        t1, t2, t3 = PONG.unpack_from(data, CTRL_HDR.size)
+        rtt = (t4 - t1) - (t3 - t2)
+        if rtt < 0:
+            return
+        self._samples.append((rtt, ((t2 - t1) + (t3 - t4)) / 2))
+        self.rtt_us, self.offset_us = min(self._samples)
+
+    def to_local(self, t_peer_us) -> Optional[float]:
+        """a peer timestamp on our clock, None before the first pong"""
+        if self.offset_us is None:
+            return None
+        return t_peer_us - self.offset_us
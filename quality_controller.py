@@ -0,0 +1,159 @@
+import struct, threading, time, config
+from typing import Dict, List, Optional, Tuple
+from protocol import CTRL_HDR, CTRL_REPORT
+
+
+# receiver report: frames the sender numbered since the last report, frames
+# lost (never seen, or dropped incomplete), frames completed, and the mean
+# first chunk -> complete frame time in ms
+REPORT = struct.Struct('!HHHf')
+
+
+def pack_report(seq, expected, lost, completed, latency_ms):
+    return CTRL_HDR.pack(seq & 0xFFFF, CTRL_REPORT, 0) + \
+        REPORT.pack(min(expected, 0xFFFF), min(lost, 0xFFFF), min(completed, 0xFFFF), latency_ms)
+
+
+def unpack_report(data) -> Optional[Tuple[int, int, int, float]]:
+    """(expected, lost, completed, latency_ms), or None if not a report"""
+    if len(data) < CTRL_HDR.size + REPORT.size:
+        return None
+    _seq, kind, total = CTRL_HDR.unpack_from(data)
+    if total != 0 or kind != CTRL_REPORT:
+        return None
+    return REPORT.unpack_from(data, CTRL_HDR.size)
+
+
+class QualityController:
+    """picks JPEG quality, frame scale and frame rate from receiver reports
+
+    the stream goes to every peer, so the worst recent report decides.  Over
+    the loss target (or the latency limit) settings drop multiplicatively:
+    quality first, then resolution, then frame rate.  After a run of reports
+    well under the target they come back additively in the opposite order,
+    so the sender settles at the best quality the links carry.  A step up
+    that had to be taken back doubles the wait before the next one; one
+    that holds for QC_PROBE_REPORTS resets it, so once the link
+    has room again the settings climb one step per probe.  With
+    ``passthrough`` (MJPEG camera frames sent as they are) quality and scale
+    change nothing, so only the frame rate is stepped
+    """
+
+    def __init__(self, quality=None, fps=None, passthrough=None):
+        self.q_max = quality or config.JPEG_QUALITY
+        self.q_min = min(getattr(config, 'QC_QUALITY_MIN', 20), self.q_max)
+        self.q_step = getattr(config, 'QC_QUALITY_STEP', 10)
+        self.scales: List[float] = getattr(config, 'QC_SCALES', [1.0, 0.75, 0.5]) or [1.0]
+        self.fps_max = fps or config.FPS_LIMIT or 30
+        self.fps_min = min(getattr(config, 'QC_FPS_MIN', 10), self.fps_max)
+        self.loss_target = getattr(config, 'QC_LOSS_TARGET', 0.02)
+        self.latency_ms = getattr(config, 'QC_LATENCY_MS', 50.0)
+        self.interval = getattr(config, 'QC_REPORT_SEC', 0.5)
+        self.probe = getattr(config, 'QC_PROBE_REPORTS', 4)
+        if passthrough is None:
+            passthrough = getattr(config, 'CAMERA_FORMAT', 'BGR') == 'MJPEG'
+        self.passthrough = passthrough
+
+        self.quality = self.q_max
+        self.scale_idx = 0
+        self.fps = float(self.fps_max)
+
+        self._lock = threading.Lock()
+        self._reports: Dict[str, Tuple[float, float, float]] = {}  # ip -> (time, loss, latency)
+        self._next_step = 0.0
+        self._calm = 0
+        self._wait = self.probe   # clean reports needed for the next step up
+        self._raised = False
+        self.decreases = 0
+        self.increases = 0
+        self.worst_loss = 0.0
+
+
+    @property
+    def scale(self) -> float:
+        return self.scales[self.scale_idx]
+
+
+    def settings(self):
+        """(quality, scale, fps) to encode and send with now"""
+        with self._lock:
+            return self.quality, self.scales[self.scale_idx], self.fps
+
+
+    def on_control(self, ip, data):
+        """StreamProcessor control callback (receiver thread)"""
+        rep = unpack_report(data)
+        if rep is None:
+            return
+        expected, lost, _completed, latency = rep
+        if expected == 0:
+            return
+        self.update(ip, min(1.0, lost / expected), latency)
+
+
+    def update(self, ip, loss, latency_ms, now=None):
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            self._reports[ip] = (now, loss, latency_ms)
+            # one step per report interval however many peers report, and
+            # reports describing the old settings are not acted on twice
+            if now < self._next_step:
+                return
+            fresh = [r for r in self._reports.values() if now - r[0] <= 4 * self.interval]
+            worst = max(r[1] for r in fresh)
+            slow = max(r[2] for r in fresh) > self.latency_ms
+            self.worst_loss = worst
+            if worst > self.loss_target or slow:
+                if self._raised:
+                    # the last step up was too far; probe less often
+                    self._wait = min(self._wait * 2, 2 * self.probe)
+                    self._raised = False
+                self._decrease()
+                self._calm = 0
+                self._next_step = now + 2 * self.interval
+                return
+            self._next_step = now + self.interval
+            if worst < self.loss_target / 2:
+                self._calm += 1
+                if self._raised and self._calm >= self.probe:
+                    # the last step up held: the link has room again
+                    self._wait = self.probe
+                    self._raised = False
+                if self._calm >= self._wait:
+                    self._raised = self._increase()
+                    self._calm = 0
+            else:
+                self._calm = 0
+
+
+    def _decrease(self):
+        if self.quality > self.q_min and not self.passthrough:
+            self.quality = max(self.q_min, int(self.quality * 0.7))
+        elif self.scale_idx < len(self.scales) - 1 and not self.passthrough:
+            self.scale_idx += 1
+        elif self.fps > self.fps_min:
+            self.fps = max(float(self.fps_min), self.fps * 0.7)
+        else:
+            return
+        self.decreases += 1
+
+
+    def _increase(self):
+        if self.fps < self.fps_max:
+            self.fps = min(float(self.fps_max), self.fps + 5)
+        elif self.scale_idx > 0:
+            self.scale_idx -= 1
+        elif self.quality < self.q_max:
+            self.quality = min(self.q_max, self.quality + self.q_step)
+        else:
+            return False
+        self.increases += 1
+        return True
+
+
+    def stats(self):
+        with self._lock:
+            return {'quality': self.quality, 'scale': self.scales[self.scale_idx],
+                    'fps': round(self.fps, 1), 'worst_loss': round(self.worst_loss, 4),
+                    'decreases': self.decreases, 'increases': self.increases,
+                    'peers_reporting': len(self._reports), 'passthrough': self.passthrough}
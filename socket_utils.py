@@ -0,0 +1,296 @@
+import ctypes, ctypes.util, errno, select, socket, struct
+
+
+# batched datagram I/O.  Linux exposes sendmmsg/recvmmsg which move a whole
+# batch of datagrams with one syscall; python's socket module does not wrap
+# them, so they are called through ctypes.  Where libc lacks them the pure
+# python classes below provide the same API with one syscall per datagram
+
+MSG_DONTWAIT = getattr(socket, 'MSG_DONTWAIT', 0x40)
+
+
+class _IoVec(ctypes.Structure):
+    _fields_ = [('iov_base', ctypes.c_void_p),
+                ('iov_len',  ctypes.c_size_t)]
+
+
+class _MsgHdr(ctypes.Structure):
+    _fields_ = [('msg_name',       ctypes.c_void_p),
+                ('msg_namelen',    ctypes.c_uint32),
+                ('msg_iov',        ctypes.POINTER(_IoVec)),
+                ('msg_iovlen',     ctypes.c_size_t),
+                ('msg_control',    ctypes.c_void_p),
+                ('msg_controllen', ctypes.c_size_t),
+                ('msg_flags',      ctypes.c_int)]
+
+
+class _MMsgHdr(ctypes.Structure):
+    _fields_ = [('msg_hdr', _MsgHdr),
+                ('msg_len', ctypes.c_uint)]
+
+
+class _SockAddrIn(ctypes.Structure):
+    # port and address hold network byte order values
+    _fields_ = [('sin_family', ctypes.c_ushort),
+                ('sin_port',   ctypes.c_uint16),
+                ('sin_addr',   ctypes.c_uint32),
+                ('sin_zero',   ctypes.c_uint8 * 8)]
+
+
+_NATIVE_U16 = struct.Struct('=H')
+_NATIVE_U32 = struct.Struct('=I')
+
+# the hot paths read and write the C structs through struct.pack_into /
+# unpack_from on a memoryview; per-field ctypes attribute access costs more
+# than the syscalls being saved
+_PTR     = struct.Struct('P')
+_SIZE_T  = struct.Struct('N')
+_UINT    = struct.Struct('I')
+_IOV_FMT = struct.Struct('PN')
+_MMSG_SIZE   = ctypes.sizeof(_MMsgHdr)
+_NAME_OFF    = _MsgHdr.msg_name.offset
+_IOVLEN_OFF  = _MsgHdr.msg_iovlen.offset
+_MSGLEN_OFF  = _MMsgHdr.msg_len.offset
+_SADDR_SIZE  = ctypes.sizeof(_SockAddrIn)
+_SADDR_OFF   = _SockAddrIn.sin_addr.offset
+
+
+def _load_mmsg():
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or None, use_errno=True)
+        send = libc.sendmmsg
+        recv = libc.recvmmsg
+    except (OSError, AttributeError):
+        return None, None
+    send.argtypes = [ctypes.c_int, ctypes.c_void_p, ctypes.c_uint, ctypes.c_int]
+    send.restype  = ctypes.c_int
+    recv.argtypes = [ctypes.c_int, ctypes.c_void_p, ctypes.c_uint, ctypes.c_int, ctypes.c_void_p]
+    recv.restype  = ctypes.c_int
+    return send, recv
+
+
+_sendmmsg, _recvmmsg = _load_mmsg()
+MMSG_AVAILABLE = _sendmmsg is not None
+
+
+def _buffer_address(buf):
+    """return (address, keepalive) for a bytes-like object without copying it"""
+    if isinstance(buf, bytes):
+        ref = ctypes.c_char_p(buf)
+        return ctypes.cast(ref, ctypes.c_void_p).value, ref
+    iface = getattr(buf, '__array_interface__', None)
+    if iface is not None and iface.get('strides') is None:
+        # contiguous numpy array, possibly read-only (e.g. camera MJPEG bytes)
+        return iface['data'][0], buf
+    try:
+        ref = ctypes.c_char.from_buffer(buf)
+    except (TypeError, ValueError):
+        # read-only or empty buffer of another type; fall back to a copy
+        buf = bytes(buf)
+        ref = ctypes.c_char_p(buf)
+        return ctypes.cast(ref, ctypes.c_void_p).value, (ref, buf)
+    return ctypes.addressof(ref), ref
+
+
+class _PyDatagramBatch:
+    """outgoing datagram queue, one sendmsg per datagram"""
+
+    def __init__(self, sock, capacity, max_parts=2):
+        self.sock = sock
+        self.capacity = capacity
+        self.max_parts = max_parts
+        self._pending = []
+
+    def __len__(self):
+        return len(self._pending)
+
+    def add(self, addr, *parts):
+        """queue one datagram made of ``parts`` = (buffer, start, end) slices"""
+        self._pending.append((addr, parts))
+        if len(self._pending) >= self.capacity:
+            self.flush()
+
+    def flush(self):
+        sent = 0
+        for addr, parts in self._pending:
+            try:
+                if len(parts) == 1:
+                    buf, start, end = parts[0]
+                    self.sock.sendto(memoryview(buf)[start:end], addr)
+                else:
+                    self.sock.sendmsg([memoryview(b)[s:e] for b, s, e in parts], (), 0, addr)
+                sent += 1
+            except OSError:
+                pass
+        self._pending.clear()
+        return sent
+
+
+class _MMsgDatagramBatch:
+    """outgoing datagram queue flushed with a single sendmmsg call"""
+
+    def __init__(self, sock, capacity, max_parts=2):
+        self.sock = sock
+        self.capacity = capacity
+        self.max_parts = max_parts
+        self._msgs = (_MMsgHdr * capacity)()
+        self._iov  = (_IoVec * (capacity * max_parts))()
+        self._msgs_mem = memoryview(self._msgs).cast('B')
+        self._iov_mem  = memoryview(self._iov).cast('B')
+        iov_base = ctypes.addressof(self._iov)
+        for i in range(capacity):
+            hdr = self._msgs[i].msg_hdr
+            hdr.msg_namelen = ctypes.sizeof(_SockAddrIn)
+            hdr.msg_iov = ctypes.cast(iov_base + i * max_parts * ctypes.sizeof(_IoVec),
+                                      ctypes.POINTER(_IoVec))
+        self._sockaddrs = {}
+        self._addr_cache = {}
+        self._n = 0
+
+    def __len__(self):
+        return self._n
+
+    def _sockaddr(self, addr):
+        sa = self._sockaddrs.get(addr)
+        if sa is None:
+            ip, port = addr
+            sa = _SockAddrIn(socket.AF_INET,
+                             _NATIVE_U16.unpack(struct.pack('!H', port))[0],
+                             _NATIVE_U32.unpack(socket.inet_aton(ip))[0])
+            self._sockaddrs[addr] = sa
+        return ctypes.addressof(sa)
+
+    def _address(self, buf):
+        key = id(buf)
+        hit = self._addr_cache.get(key)
+        if hit is None:
+            # cache keeps the buffer alive until flush, so id() stays unique
+            hit = self._addr_cache[key] = _buffer_address(buf) + (buf,)
+        return hit[0]
+
+    def add(self, addr, *parts):
+        """queue one datagram made of ``parts`` = (buffer, start, end) slices"""
+        n = self._n
+        off = n * _MMSG_SIZE
+        _PTR.pack_into(self._msgs_mem, off + _NAME_OFF, self._sockaddr(addr))
+        _SIZE_T.pack_into(self._msgs_mem, off + _IOVLEN_OFF, len(parts))
+        off = n * self.max_parts * _IOV_FMT.size
+        for buf, start, end in parts:
+            _IOV_FMT.pack_into(self._iov_mem, off, self._address(buf) + start, end - start)
+            off += _IOV_FMT.size
+        self._n = n + 1
+        if self._n >= self.capacity:
+            self.flush()
+
+    def flush(self):
+        fd = self.sock.fileno()
+        base = ctypes.addressof(self._msgs)
+        done = 0
+        while done < self._n:
+            rc = _sendmmsg(fd, base + done * _MMSG_SIZE, self._n - done, 0)
+            if rc < 0:
+                err = ctypes.get_errno()
+                if err == errno.EINTR:
+                    continue
+                # same policy as a failed sendto: drop this datagram, keep going
+                done += 1
+            else:
+                done += rc
+        sent, self._n = self._n, 0
+        self._addr_cache.clear()
+        return sent
+
+
+class _PyDatagramReceiver:
+    """drain up to ``batch`` datagrams per call, one recvfrom per datagram"""
+
+    def __init__(self, sock, batch, bufsize):
+        sock.setblocking(False)
+        self.sock = sock
+        self.batch = batch
+        self.bufsize = bufsize
+        self._poll = select.poll()
+        self._poll.register(sock, select.POLLIN)
+
+    def recv(self, timeout):
+        """return a list of ``(payload, ip)``; empty on timeout"""
+        if not self._poll.poll(int(timeout * 1000)):
+            return []
+        out = []
+        recvfrom = self.sock.recvfrom
+        for _ in range(self.batch):
+            try:
+                data, (ip, _p) = recvfrom(self.bufsize)
+            except (BlockingIOError, InterruptedError):
+                break
+            out.append((data, ip))
+        return out
+
+
+class _MMsgDatagramReceiver:
+    """drain up to ``batch`` datagrams per call with a single recvmmsg"""
+
+    def __init__(self, sock, batch, bufsize):
+        sock.setblocking(False)
+        self.sock = sock
+        self.batch = batch
+        self.bufsize = bufsize
+        self._buf = bytearray(batch * bufsize)
+        self._view = memoryview(self._buf)
+        self._msgs  = (_MMsgHdr * batch)()
+        self._iov   = (_IoVec * batch)()
+        self._addrs = (_SockAddrIn * batch)()
+        self._msgs_mem  = memoryview(self._msgs).cast('B')
+        self._addrs_mem = memoryview(self._addrs).cast('B')
+        buf_base = ctypes.addressof(ctypes.c_char.from_buffer(self._buf))
+        for i in range(batch):
+            self._iov[i].iov_base = buf_base + i * bufsize
+            self._iov[i].iov_len = bufsize
+            hdr = self._msgs[i].msg_hdr
+            hdr.msg_name = ctypes.addressof(self._addrs[i])
+            # the kernel writes back the address length, which for AF_INET
+            # is always the full sockaddr_in, so this is set only once
+            hdr.msg_namelen = _SADDR_SIZE
+            hdr.msg_iov = ctypes.pointer(self._iov[i])
+            hdr.msg_iovlen = 1
+        self._ip_cache = {}
+        self._poll = select.poll()
+        self._poll.register(sock, select.POLLIN)
+
+    def recv(self, timeout):
+        """return a list of ``(payload, ip)``; empty on timeout"""
+        if not self._poll.poll(int(timeout * 1000)):
+            return []
+        n = _recvmmsg(self.sock.fileno(), ctypes.addressof(self._msgs), self.batch,
+                      MSG_DONTWAIT, None)
+        if n < 0:
+            err = ctypes.get_errno()
+            if err in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR):
+                return []
+            raise OSError(err, 'recvmmsg failed')
+        out = []
+        view, size, ips = self._view, self.bufsize, self._ip_cache
+        msgs, addrs = self._msgs_mem, self._addrs_mem
+        for i in range(n):
+            raw = bytes(addrs[i * _SADDR_SIZE + _SADDR_OFF:i * _SADDR_SIZE + _SADDR_OFF + 4])
+            ip = ips.get(raw)
+            if ip is None:
+                ip = ips[raw] = socket.inet_ntoa(raw)
+            length = _UINT.unpack_from(msgs, i * _MMSG_SIZE + _MSGLEN_OFF)[0]
+            off = i * size
+            out.append((bytes(view[off:off + length]), ip))
+        return out
+
+
+def DatagramBatch(sock, capacity, max_parts=2, native=True):
+    """return the fastest available outgoing datagram batch for ``sock``"""
+    if native and MMSG_AVAILABLE:
+        return _MMsgDatagramBatch(sock, capacity, max_parts)
+    return _PyDatagramBatch(sock, capacity, max_parts)
+
+
+def DatagramReceiver(sock, batch, bufsize, native=True):
+    """return the fastest available batched receiver for ``sock``"""
+    if native and MMSG_AVAILABLE:
+        return _MMsgDatagramReceiver(sock, batch, bufsize)
+    return _PyDatagramReceiver(sock, batch, bufsize)
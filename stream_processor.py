@@ -1,63 +1,520 @@
-import collections, time, struct, config
-from codec_utils import decode_jpeg_to_bgr
+import collections, threading, time, config, telemetry
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from buffer_pool import BufferPool
+from codec_utils import decoded_shape, decode_jpeg_into
+from decode_pool import DecodePool
+from fec_utils import FEC_HDR, recover_rows
+from protocol import (HDR_V1, HDR_V2, CTRL_PING, CTRL_PONG, ClockSync, is_v2, now_us,
+                      pack_ping, pack_pong)
+from quality_controller import pack_report
 
 
-_HDR = struct.Struct('!HHH')
-
 #  datagrams that would lead to excessive memory use or invalid indices are now rejected
 _MAX_CHUNKS = 128  # With 1.3 kB chunks and 480p/50 % quality JPEG, 64 is plenty
+_MAX_PARITY = 32   # parity chunks accepted per frame (sender caps at FEC_MAX_PARITY)
+_DEADLINE   = 1.0  # seconds an incomplete frame may hold its slot before it is considered stale
+_REORDER    = 64   # completions up to this many fids behind the newest are stale; further back means the sender restarted
+_PONGS      = 16   # unanswered pings held per round of outgoing()
+
+
+class _FrameSlot:
+    """one in-flight frame: chunks are written straight to their offset in a
+    preallocated buffer and tracked with a bitmap"""
+
+    __slots__ = ('fid', 'total', 'mask', 'left', 'chunk', 'tail', 'tail_len', 'deadline',
+                 'buf', 'parity', 'pmask', 'n_parity', 'n_parity_got', 'frame_len', 't_first', 't_capture', 'repaired')
+
+    def __init__(self):
+        self.buf = bytearray(_MAX_CHUNKS * config.MAX_DATAGRAM)
+        self.parity = bytearray(_MAX_PARITY * config.MAX_DATAGRAM)
+        self.fid = -1
+        self.left = 0
+        self.deadline = 0.0
+
+    def reset(self, fid, total, now, t_capture=0):
+        self.fid = fid
+        self.t_first = now
+        self.t_capture = t_capture   # sender clock, us; 0 from v1 peers
+        self.total = total
+        self.mask = 0
+        self.left = total
+        self.chunk = 0          # data chunk size, learned from any non-last chunk or parity
+        self.tail = None        # last chunk held back until the chunk size is known
+        self.tail_len = 0
+        self.deadline = now + _DEADLINE
+        self.pmask = 0
+        self.n_parity = 0
+        self.n_parity_got = 0
+        self.frame_len = 0
+        self.repaired = False   # parity rebuilt at least one chunk
+
+    def set_chunk(self, chunk):
+        self.chunk = chunk
+        if self.tail is not None:
+            if len(self.tail) > chunk:
+                # inconsistent with the other chunks; forget it
+                self.mask &= ~(1 << (self.total - 1))
+                self.left += 1
+            else:
+                self.place_tail(self.tail)
+            self.tail = None
+
+    def place_tail(self, payload):
+        off = (self.total - 1) * self.chunk
+        n = len(payload)
+        self.tail_len = n
+        self.buf[off:off + n] = payload
+        # zero padding keeps the XOR parity of the last stride valid
+        self.buf[off + n:off + self.chunk] = bytes(self.chunk - n)
+
+
+class _PeerSlots:
+    """fixed ring of frame slots for one peer, indexed by fid"""
+
+    def __init__(self, ring, window):
+        self.ring = ring
+        self.slots = [_FrameSlot() for _ in range(ring)]
+        self.version = 1
+        self.wrap = 0xFFFF      # fid mask: 16-bit in v1 headers, 32-bit in v2
+        self.half = 0x8000
+        self.last_fid = -1
+        self.completed = 0
+        self.expired = 0
+        self.stale = 0
+        self.fec_recovered = 0
+        self.seen_fid = -1      # newest fid any chunk arrived for
+        self.unseen = 0         # fids below seen_fid no chunk ever arrived for
+        self.latency_sum = 0.0  # first chunk -> complete, since the last report
+        self.latency_n = 0
+        self.rep = (-1, 0, 0, 0)  # seen_fid, unseen, expired, completed at the last report
+        self.clock = ClockSync()
+        self.e2e = collections.deque(maxlen=window)  # capture -> complete, ms, v2 peers only
+
+    def set_version(self, version):
+        """the peer switched header format (restarted with other settings):
+        fids from the old numbering mean nothing any more"""
+        self.version = version
+        self.wrap = 0xFFFFFFFF if version == 2 else 0xFFFF
+        self.half = (self.wrap >> 1) + 1
+        self.last_fid = self.seen_fid = -1
+        self.rep = (-1, self.unseen, self.expired, self.completed)
+        for slot in self.slots:
+            slot.fid = -1
+            slot.left = 0
 
 
 class StreamProcessor:
-    def __init__(self, peer_ips):
+    def __init__(self, peer_ips, pool=None, mailbox=None, control=None):
+        # decoded frames are FrameBuffers from the shared pool; the deques
+        # hold one reference each, released when a frame falls out
+        self.pool = pool or BufferPool()
+        # posted with the peer ip whenever a new frame can be shown
+        self.mailbox = mailbox
+        self._lock = threading.Lock()
         self.deques = {ip: collections.deque(maxlen=config.FRAME_DEQUE_LEN) for ip in peer_ips}
-        self._assem = {}
+        ring = getattr(config, 'REASSEMBLY_SLOTS', 8)
+        window = getattr(config, 'LATENCY_WINDOW', 256)
+        self._peers = {ip: _PeerSlots(ring, window) for ip in peer_ips}
+        # latency samples are appended by the receiver thread and read by
+        # stats() from any thread (the telemetry exporter among them)
+        self._e2e_lock = threading.Lock()
+
+        # control datagrams (total == 0) go to control(ip, data), except
+        # pings and pongs, which keep the peers' clock offsets here;
+        # outgoing() builds the reports, pings and pongs to send back
+        self._control = control
+        self._report_sec = getattr(config, 'QC_REPORT_SEC', 0.5)
+        self._next_report = 0.0
+        self._report_seq = 0
+        self._ping_sec = getattr(config, 'PING_SEC', 1.0)
+        self._next_ping = 0.0
+        self._ping_seq = 0
+        self._pongs = collections.deque(maxlen=_PONGS)   # (ip, ping, t received)
+
+        # lazy mode: only the newest compressed frame per peer is kept and it
+        # is decoded when the render loop asks for that peer, so peers that
+        # are off screen cost no decode at all
+        mode = getattr(config, 'DECODE_MODE', 'eager')
+        self.lazy = mode == 'lazy'
+        self._jpeg = {}     # ip -> (fid, jpeg bytes), written by the receiver thread
+        self._decoded = {}  # ip -> (fid, size, FrameBuffer), replaced under _lock by the render thread / its helpers
+        self.decodes = 0
+        # acquire_many() decodes the tiles of a multi-peer view side by side
+        workers = getattr(config, 'DECODE_WORKERS', 2)
+        self._executor = ThreadPoolExecutor(workers, 'lazy-decode') if self.lazy and workers > 1 else None
+
+        # eager / pool mode: (w, h) the render loop last asked for per peer;
+        # later frames are decoded at the smallest DCT scale covering it
+        self._decode_size = {}
+
+        # pool mode: completed frames are handed to decode workers so the
+        # receiver thread goes straight back to draining the socket
+        self._pool = None
+        if mode == 'pool':
+            self._pool = DecodePool(peer_ips, getattr(config, 'DECODE_WORKERS', 2),
+                                    getattr(config, 'DECODE_QUEUE_LEN', 2), self._publish,
+                                    decode=lambda ip, jpeg: self._decode(jpeg, self._decode_size.get(ip)))
+
 
+    @property
+    def fec_recovered(self):
+        """frames completed only thanks to parity chunks, all peers"""
+        return sum(p.fec_recovered for p in self._peers.values())
 
-    def _expire_old(self):
-        t = time.time()
-        for k in list(self._assem.keys()):
-            if self._assem[k]['deadline'] < t:
-                del self._assem[k]
+
+    def stats(self):
+        """per peer reassembly counters and end-to-end latency, plus decode
+        queue stats in pool mode"""
+        out = {ip: {'completed': p.completed, 'expired': p.expired, 'stale': p.stale,
+                    'fec_recovered': p.fec_recovered, 'version': p.version}
+               for ip, p in self._peers.items()}
+        for ip in self._peers:
+            out[ip].update(self.latency(ip))
+        if self._pool is not None:
+            for ip, st in self._pool.stats().items():
+                out[ip].update(st)
+        return out
+
+
+    def latency(self, ip):
+        """capture -> frame complete percentiles in ms over the last
+        LATENCY_WINDOW frames of ``ip``, with the clock offset and round trip
+        they rest on; empty for v1 peers and before the first pong"""
+        p = self._peers[ip]
+        with self._e2e_lock:
+            samples = np.array(p.e2e)
+        if not len(samples):
+            return {}
+        p50, p90, p99 = np.percentile(samples, (50, 90, 99))
+        return {'e2e_p50_ms': round(float(p50), 2), 'e2e_p90_ms': round(float(p90), 2),
+                'e2e_p99_ms': round(float(p99), 2), 'e2e_max_ms': round(float(samples.max()), 2),
+                'clock_offset_ms': round(p.clock.offset_us / 1e3, 3),
+                'rtt_ms': round(p.clock.rtt_us / 1e3, 3)}
+
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.close()
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+        with self._lock:
+            for dq in self.deques.values():
+                while dq:
+                    dq.popleft().release()
+        for entry in self._decoded.values():
+            if entry[2] is not None:
+                entry[2].release()
+        self._decoded.clear()
 
 
     def process_datagram(self, data, ip):
-        if ip not in self.deques or len(data) < _HDR.size:
-            return
-        fid, cid, total = _HDR.unpack_from(data)
-        payload = data[_HDR.size:]
-        key = (ip, fid)
-        rec = self._assem.get(key)
-
-        # sanitycheck for header values
-        if total == 0 or total > _MAX_CHUNKS or cid >= total:
-            return  
-
-        if rec is None:
-            rec = {
-                'chunks': [None] * total,
-                'left': total,
-                'deadline': time.time() + 1.0,
-            }
-            self._assem[key] = rec
-        if cid < total and rec['chunks'][cid] is None:
-            rec['chunks'][cid] = payload
-            rec['left'] -= 1
-        if rec['left'] == 0:
-            jpeg = b"".join(rec['chunks'])
-            frame = decode_jpeg_to_bgr(jpeg)
-            if frame is not None:
-                self.deques[ip].append(frame)
-            del self._assem[key]
-        self._expire_old()
-
-
-    def latest(self, ip):
-        dq = self.deques.get(ip)
-        if not dq:
+        self._ingest(data, ip, time.monotonic())
+
+
+    def process_datagrams(self, batch):
+        """ingest a batch of ``(payload, ip)`` tuples from NetworkManager.recv_batch"""
+        now = time.monotonic()
+        for data, ip in batch:
+            self._ingest(data, ip, now)
+
+
+    def _ingest(self, data, ip, now):
+        peer = self._peers.get(ip)
+        if peer is None or len(data) < HDR_V1.size:
+            return
+        if is_v2(data):
+            _magic, version, _flags, fid, cid, total, t_capture = HDR_V2.unpack_from(data)
+            hs = HDR_V2.size
+        else:
+            fid, cid, total = HDR_V1.unpack_from(data)
+            if total == 0:
+                self._on_control(ip, peer, cid, data)
+                return
+            version, t_capture, hs = 1, 0, HDR_V1.size
+        if version != peer.version:
+            peer.set_version(version)
+        wrap, half = peer.wrap, peer.half
+
+        # sanitycheck for header values; cid >= total marks an FEC parity chunk
+        if total == 0 or total > _MAX_CHUNKS or cid >= total + _MAX_PARITY:
+            return
+        size = len(data) - hs
+
+        # no expiry scan: a slot is reclaimed when a newer fid maps onto it
+        # or its deadline has passed
+        slot = peer.slots[fid % peer.ring]
+        if slot.fid != fid or slot.deadline < now:
+            if slot.deadline >= now and ((slot.fid - fid) & wrap) < half:
+                # late chunk of a frame older than the slot's occupant
+                return
+            if slot.left:
+                peer.expired += 1
+                telemetry.count('frames_expired')
+            slot.reset(fid, total, now, t_capture)
+            ahead = (fid - peer.seen_fid) & wrap
+            if peer.seen_fid < 0 or 0 < ahead < half:
+                if 0 <= peer.seen_fid and ahead < _REORDER:
+                    # fids skipped over: not a single chunk of them arrived
+                    peer.unseen += ahead - 1
+                peer.seen_fid = fid
+        elif slot.left == 0 or slot.total != total:
+            return
+
+        payload = memoryview(data)[hs:]
+        if cid < total:
+            bit = 1 << cid
+            if slot.mask & bit:
+                return
+            if cid == total - 1:
+                if total == 1:
+                    slot.chunk = size
+                if slot.chunk:
+                    if size > slot.chunk:
+                        return
+                    slot.place_tail(payload)
+                else:
+                    slot.tail = payload
+            else:
+                if slot.chunk == 0:
+                    slot.set_chunk(size)
+                elif size != slot.chunk:
+                    return
+                off = cid * size
+                slot.buf[off:off + size] = payload
+            slot.mask |= bit
+            slot.left -= 1
+        else:
+            j = cid - total
+            plen = size - FEC_HDR.size
+            if plen <= 0 or slot.pmask >> j & 1:
+                return
+            n_parity, frame_len = FEC_HDR.unpack_from(payload)
+            if j >= n_parity or n_parity > _MAX_PARITY:
+                return
+            if slot.chunk == 0:
+                slot.set_chunk(plen)
+            elif plen != slot.chunk:
+                return
+            slot.parity[j * plen:(j + 1) * plen] = payload[FEC_HDR.size:]
+            slot.pmask |= 1 << j
+            slot.n_parity = n_parity
+            slot.frame_len = frame_len
+            slot.n_parity_got += 1
+
+        # every missing chunk needs a parity chunk of its own, so only try a
+        # rebuild once enough parity has arrived
+        if 0 < slot.left <= slot.n_parity_got and slot.tail is None:
+            self._recover(slot)
+        if slot.left == 0:
+            self._complete(slot, peer, ip, now)
+
+
+    def _recover(self, slot):
+        total, chunk = slot.total, slot.chunk
+        if not (total - 1) * chunk < slot.frame_len <= total * chunk:
+            return
+        rows = np.frombuffer(slot.buf, np.uint8, count=total * chunk).reshape(total, chunk)
+        prows = np.frombuffer(slot.parity, np.uint8,
+                              count=slot.n_parity * chunk).reshape(slot.n_parity, chunk)
+        rebuilt = recover_rows(rows, slot.mask, prows, slot.pmask, slot.n_parity)
+        if not rebuilt:
+            return
+        if rebuilt >> (total - 1) & 1:
+            slot.tail_len = slot.frame_len - (total - 1) * chunk
+        slot.mask |= rebuilt
+        slot.left -= bin(rebuilt).count('1')
+        # counted on completion: the last holes may still be filled by data chunks
+        slot.repaired = True
+
+
+    def _complete(self, slot, peer, ip, now):
+        fid = slot.fid
+        # completions can arrive out of order; never replace a newer frame
+        if peer.last_fid >= 0 and ((peer.last_fid - fid) & peer.wrap) < _REORDER:
+            peer.stale += 1
+            telemetry.count('frames_stale')
+            return
+        peer.last_fid = fid
+        peer.completed += 1
+        if slot.repaired:
+            peer.fec_recovered += 1
+        peer.latency_sum += now - slot.t_first
+        # first chunk -> complete: the frame's spread on the wire plus reassembly
+        telemetry.observe('reassembly', (now - slot.t_first) * 1e3)
+        peer.latency_n += 1
+        if slot.t_capture:
+            t_capture = peer.clock.to_local(slot.t_capture)
+            if t_capture is not None:
+                ms = (now_us() - t_capture) / 1e3
+                with self._e2e_lock:
+                    peer.e2e.append(ms)
+        # one copy out of the slot: slicing the bytearray itself would make a second
+        jpeg = bytes(memoryview(slot.buf)[:(slot.total - 1) * slot.chunk + slot.tail_len])
+        if self.lazy:
+            # latest wins: an undisplayed older frame is simply replaced
+            self._jpeg[ip] = (fid, jpeg)
+            if self.mailbox is not None:
+                self.mailbox.post(ip)
+            return
+        if self._pool is not None:
+            self._pool.submit(ip, fid, jpeg)
+            return
+        self.decodes += 1
+        fb = self._decode(jpeg, self._decode_size.get(ip))
+        if fb is not None:
+            self._publish(ip, fid, fb)
+
+
+    def _on_control(self, ip, peer, kind, data):
+        if kind == CTRL_PING:
+            # answered from outgoing(), which stamps the send time
+            self._pongs.append((ip, data, now_us()))
+        elif kind == CTRL_PONG:
+            peer.clock.on_pong(data, now_us())
+        elif self._control is not None:
+            self._control(ip, data)
+
+
+    def outgoing(self, now=None):
+        """[(ip, datagram)] control datagrams due for the peers: pongs for
+        the pings received, a ping every PING_SEC and receiver reports every
+        QC_REPORT_SEC; call from the receiver thread"""
+        now = time.monotonic() if now is None else now
+        out = []
+        while self._pongs:
+            ip, ping, t_recv = self._pongs.popleft()
+            pong = pack_pong(ping, t_recv)
+            if pong is not None:
+                out.append((ip, pong))
+        if self._ping_sec and now >= self._next_ping:
+            self._next_ping = now + self._ping_sec
+            self._ping_seq += 1
+            for ip in self._peers:
+                out.append((ip, pack_ping(self._ping_seq)))
+        if now >= self._next_report:
+            self._next_report = now + self._report_sec
+            self._report_seq += 1
+            self._reports(out)
+        return out
+
+
+    def _reports(self, out):
+        for ip, peer in self._peers.items():
+            if peer.seen_fid < 0:
+                continue
+            fid, unseen, expired, completed = peer.rep
+            peer.rep = (peer.seen_fid, peer.unseen, peer.expired, peer.completed)
+            expected = (peer.seen_fid - fid) & peer.wrap
+            # an incomplete frame counts as lost once its slot is reclaimed,
+            # so a frame still arriving now is not reported as lost
+            lost = peer.unseen - unseen + peer.expired - expired
+            lat = peer.latency_sum / peer.latency_n * 1e3 if peer.latency_n else 0.0
+            peer.latency_sum, peer.latency_n = 0.0, 0
+            # nothing to compare against yet, or the sender restarted
+            if fid < 0 or expected == 0 or expected >= 0x8000:
+                continue
+            out.append((ip, pack_report(self._report_seq, expected, lost,
+                                        peer.completed - completed, lat)))
+
+
+    def _decode(self, jpeg, size=None):
+        """decode into a pooled buffer; FrameBuffer or None"""
+        t0 = telemetry.start()
+        info = decoded_shape(jpeg, size)
+        if info is None:
+            telemetry.count('decode_failed')
             return None
-        try:
-            return dq[-1]
-        except IndexError:
-            # deque was emptied between len() and index due to another thread
+        shape, sf = info
+        fb = self.pool.acquire(shape)
+        if decode_jpeg_into(jpeg, fb.array, sf) is None:
+            fb.release()
+            telemetry.count('decode_failed')
             return None
+        telemetry.stop('decode', t0)
+        return fb
+
+
+    def _publish(self, ip, fid, fb):
+        # receiver thread in eager mode, a decode worker in pool mode
+        with self._lock:
+            dq = self.deques[ip]
+            old = dq[0] if len(dq) == dq.maxlen else None
+            dq.append(fb)
+        if old is not None:
+            old.release()
+        if self.mailbox is not None:
+            self.mailbox.post(ip)
+
+
+    def _stale(self, ip, size):
+        """lazy mode: the newest JPEG of ``ip`` is not decoded at ``size`` yet"""
+        entry = self._jpeg.get(ip)
+        cached = self._decoded.get(ip)
+        return entry is not None and (cached is None or cached[0] != entry[0] or cached[1] != size)
+
+
+    def _refresh_lazy(self, ip, size):
+        # the decode runs outside _lock, so acquire_many() can decode
+        # several peers at once; each peer is refreshed by one thread only
+        if not self._stale(ip, size):
+            return
+        fid, jpeg = self._jpeg[ip]
+        fb = self._decode(jpeg, size)
+        with self._lock:
+            self.decodes += 1
+            cached = self._decoded.get(ip)
+            if fb is None:
+                # corrupt frame: keep showing the previous one, and don't retry it
+                fb = cached[2] if cached is not None else None
+            elif cached is not None and cached[2] is not None:
+                cached[2].release()
+            self._decoded[ip] = (fid, size, fb)
+
+
+    def _newest(self, ip):
+        if self.lazy:
+            entry = self._decoded.get(ip)
+            return entry[2] if entry is not None else None
+        dq = self.deques.get(ip)
+        return dq[-1] if dq else None
+
+
+    def acquire(self, ip, size=None):
+        """newest frame of ``ip`` as a retained FrameBuffer (or None); the
+        caller releases it once the frame has been drawn
+
+        ``size`` = (w, h) is the size the layout will draw it at; the JPEG
+        is decoded at the smallest DCT scale covering it, right away in lazy
+        mode, from the next frame on in eager / pool mode
+        """
+        if self.lazy:
+            self._refresh_lazy(ip, size)
+        else:
+            self._decode_size[ip] = size
+        with self._lock:
+            fb = self._newest(ip)
+            return fb.retain() if fb is not None else None
+
+
+    def acquire_many(self, ips, size=None):
+        """acquire() for each of ``ips``; in lazy mode the peers with a new
+        frame are first decoded side by side on DECODE_WORKERS threads
+        (TurboJPEG releases the GIL), not one after another on the render thread"""
+        if self._executor is not None:
+            todo = [ip for ip in ips if self._stale(ip, size)]
+            if len(todo) > 1:
+                for _ in self._executor.map(lambda ip: self._refresh_lazy(ip, size), todo):
+                    pass
+        return [self.acquire(ip, size) for ip in ips]
+
+
+    def latest(self, ip, size=None):
+        """newest frame of ``ip`` as a plain array, without holding it; the
+        buffer may be recycled a few frames later, so long-lived users should
+        go through acquire()"""
+        if self.lazy:
+            self._refresh_lazy(ip, size)
+        with self._lock:
+            fb = self._newest(ip)
+            return fb.array if fb is not None else None
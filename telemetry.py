@@ -0,0 +1,225 @@
+"""pipeline timing: monotonic spans into fixed-bucket histograms, plus counters
+
+    t0 = telemetry.start()
+    ...
+    telemetry.stop('encode', t0)
+    telemetry.count('frames_expired')
+
+with TELEMETRY off, start() returns 0 and stop() / count() / observe()
+return at once, so instrumented code pays a function call and a test.  On,
+a span costs two clock reads, a bisect and a locked increment, under two
+microseconds (python test_script/bench_telemetry.py).  snapshot() gives
+every histogram and counter, plus whatever the functions registered with
+provide() return; serve() writes it to TELEMETRY_FILE every
+TELEMETRY_DUMP_SEC and / or answers GET on 127.0.0.1:TELEMETRY_HTTP_PORT
+"""
+import bisect, json, os, threading, time, config
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Optional
+
+
+# bucket upper bounds in ms; one more bucket takes everything slower
+BUCKETS_MS = (0.05, 0.1, 0.2, 0.5, 1.0, 2.0, 5.0, 10.0, 20.0, 50.0, 100.0, 200.0, 500.0, 1000.0)
+
+_clock = time.perf_counter
+_enabled = bool(getattr(config, 'TELEMETRY', False))
+_lock = threading.Lock()
+_hists: Dict[str, 'Histogram'] = {}
+_counters: Dict[str, int] = {}
+_providers: Dict[str, Callable] = {}
+_t0 = time.monotonic()
+
+
+class Histogram:
+    """counts per BUCKETS_MS bucket, with exact count, sum and max"""
+
+    __slots__ = ('counts', 'n', 'sum', 'max', '_lock')
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS_MS) + 1)
+        self.n = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, ms):
+        i = bisect.bisect_left(BUCKETS_MS, ms)
+        with self._lock:
+            self.counts[i] += 1
+            self.n += 1
+            self.sum += ms
+            if ms > self.max:
+                self.max = ms
+
+    def quantile(self, q):
+        """upper bound of the bucket holding quantile ``q`` (the max for the last)"""
+        rank = q * self.n
+        seen = 0
+        for i, c in enumerate(self.counts):
+            seen += c
+            if c and seen >= rank:
+                return round(min(BUCKETS_MS[i], self.max) if i < len(BUCKETS_MS) else self.max, 3)
+        return round(self.max, 3)
+
+    def snapshot(self):
+        with self._lock:
+            if not self.n:
+                return {'n': 0}
+            return {'n': self.n, 'mean_ms': round(self.sum / self.n, 3), 'max_ms': round(self.max, 3),
+                    'p50_ms': self.quantile(0.5), 'p90_ms': self.quantile(0.9),
+                    'p99_ms': self.quantile(0.99), 'counts': list(self.counts)}
+
+
+def enabled() -> bool:
+    return _enabled
+
+
+def enable(on=True):
+    """switch recording on or off at run time (config.TELEMETRY sets the default)"""
+    global _enabled
+    _enabled = bool(on)
+
+
+def start() -> float:
+    """span start for stop(); 0 when telemetry is off"""
+    return _clock() if _enabled else 0.0
+
+
+def stop(name, t0):
+    """close the span opened by ``t0 = start()`` into histogram ``name``"""
+    if t0:
+        _hist(name).add((_clock() - t0) * 1e3)
+
+
+def observe(name, ms):
+    """add a duration measured elsewhere (e.g. spanning threads)"""
+    if _enabled:
+        _hist(name).add(ms)
+
+
+def count(name, n=1):
+    if _enabled:
+        with _lock:
+            _counters[name] = _counters.get(name, 0) + n
+
+
+def provide(name, fn: Callable):
+    """include ``fn()`` (a stats() method, say) in every snapshot under ``name``"""
+    _providers[name] = fn
+
+
+def _hist(name):
+    h = _hists.get(name)
+    if h is None:
+        with _lock:
+            h = _hists.setdefault(name, Histogram())
+    return h
+
+
+def snapshot():
+    with _lock:
+        hists = dict(_hists)
+        counters = dict(_counters)
+    out = {'time': time.time(), 'uptime_s': round(time.monotonic() - _t0, 3), 'enabled': _enabled,
+           'buckets_ms': list(BUCKETS_MS),
+           'spans': {name: h.snapshot() for name, h in sorted(hists.items())},
+           'counters': counters}
+    for name, fn in list(_providers.items()):
+        try:
+            out[name] = fn()
+        except Exception as e:
+            out[name] = {'error': repr(e)}
+    return out
+
+
+def reset():
+    with _lock:
+        _hists.clear()
+        _counters.clear()
+
+
+def dump(path):
+    """write a snapshot to ``path``, replaced atomically"""
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(snapshot(), f, indent=1, default=str)
+    os.replace(tmp, path)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = json.dumps(snapshot(), default=str).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class _Exporter:
+    """periodic file dump and / or the localhost HTTP endpoint"""
+
+    def __init__(self, path, period, port):
+        self._path = path
+        self._period = period
+        self._stop = threading.Event()
+        self._threads = []
+        self._server = None
+        if port:
+            # loopback only: the snapshot is for this machine's tools
+            self._server = ThreadingHTTPServer(('127.0.0.1', port), _Handler)
+            self._server.daemon_threads = True
+            self._threads.append(threading.Thread(target=self._server.serve_forever,
+                                                  name='telemetry-http', daemon=True))
+        if path:
+            self._threads.append(threading.Thread(target=self._dump_loop, name='telemetry-dump', daemon=True))
+        for t in self._threads:
+            t.start()
+
+    def _dump_loop(self):
+        while not self._stop.wait(self._period):
+            self._dump()
+
+    def _dump(self):
+        try:
+            dump(self._path)
+        except OSError as e:
+            print(f"[WARN] telemetry: cannot write {self._path}: {e}")
+
+    def close(self):
+        self._stop.set()
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+        for t in self._threads:
+            t.join(timeout=1.0)
+        if self._path:
+            self._dump()
+
+
+_exporter: Optional[_Exporter] = None
+
+
+def serve(path=None, period=None, port=None):
+    """start exporting snapshots; arguments default to the TELEMETRY_* config"""
+    global _exporter
+    path = path or getattr(config, 'TELEMETRY_FILE', None)
+    period = period or getattr(config, 'TELEMETRY_DUMP_SEC', 5.0)
+    port = port if port is not None else getattr(config, 'TELEMETRY_HTTP_PORT', 0)
+    if _exporter is not None or not (path or port):
+        return
+    try:
+        _exporter = _Exporter(path, period, port)
+    except OSError as e:
+        print(f"[WARN] telemetry: cannot serve on 127.0.0.1:{port}: {e}")
+
+
+def close():
+    """stop exporting; a file export gets one last dump"""
+    global _exporter
+    if _exporter is not None:
+        _exporter.close()
+        _exporter = None
@@ -0,0 +1,146 @@
+"""adaptive quality against a link whose capacity changes, over loopback
+
+    python test_script/bench_adaptive.py --kbps 6000 1500 600 6000 --phase 8
+
+one NetworkManager sends a 640x480 test scene to itself; the receive side
+drops video datagrams beyond the current link capacity (a byte token
+bucket, the phases given by --kbps, queueing --buffer-ms of it), reassembles with StreamProcessor and
+sends its receiver reports back over the socket to the sender's
+QualityController.  The same run with the controller off shows what fixed
+settings lose.  When the last phase gives the link back its first
+capacity, the adaptive run must climb back to full quality, scale and
+frame rate within that phase (exit status 1 if not).  JPEGs are made with
+cv2.imencode; no decode, no window
+"""
+import argparse, os, sys, threading, time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import cv2
+import numpy as np
+import config
+from network_manager import NetworkManager
+from protocol import control_kind
+from quality_controller import QualityController
+from stream_processor import StreamProcessor
+
+
+class Link:
+    """receive-side byte token bucket standing in for a narrow link"""
+
+    def __init__(self, kbps, buffer_ms):
+        self.buffer = buffer_ms / 1e3
+        self.set(kbps)
+        self.tokens = self.burst
+        self.t = time.monotonic()
+
+    def set(self, kbps):
+        self.rate = kbps * 125.0
+        self.burst = self.rate * self.buffer
+
+    def passes(self, n):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.t) * self.rate)
+        self.t = now
+        if self.tokens < n:
+            return False
+        self.tokens -= n
+        return True
+
+
+def run(args, adaptive, frame):
+    config.DECODE_MODE = 'lazy'
+    qc = QualityController() if adaptive else None
+    net = NetworkManager(args.port, [{'ip': '127.0.0.1'}])
+    proc = StreamProcessor(['127.0.0.1'], mailbox=None, control=qc.on_control if qc else None)
+    link = Link(args.kbps[0], args.buffer_ms)
+    stop = threading.Event()
+    passed = [0]
+
+    def receive():
+        while not stop.is_set():
+            batch = net.recv_batch()
+            # control datagrams are not throttled
+            batch = [(d, ip) for d, ip in batch if control_kind(d) is not None or link.passes(len(d) + 28)]
+            if batch:
+                proc.process_datagrams(batch)
+                passed[0] += sum(len(d) for d, _ in batch)
+            for ip, data in proc.outgoing():
+                net.send_control(ip, data)
+    rx = threading.Thread(target=receive, daemon=True)
+    rx.start()
+
+    sent = frames = 0
+    t0 = time.monotonic()
+    next_frame = t0
+    next_print = t0 + 1.0
+    h, w = frame.shape[:2]
+    rows = []
+    phase = -1
+    t_phase = recovered = None
+    while True:
+        now = time.monotonic()
+        p = int((now - t0) // args.phase)
+        if p >= len(args.kbps):
+            break
+        if p != phase:
+            phase, t_phase = p, now
+            link.set(args.kbps[p])
+        quality, scale, fps = qc.settings() if qc else (config.JPEG_QUALITY, 1.0, config.FPS_LIMIT)
+        if qc and p == len(args.kbps) - 1 and recovered is None and \
+                (quality, scale, fps) == (qc.q_max, qc.scales[0], qc.fps_max):
+            recovered = now - t_phase
+        img = frame if scale >= 1.0 else cv2.resize(frame, (int(w * scale), int(h * scale)),
+                                                    interpolation=cv2.INTER_AREA)
+        jpeg = cv2.imencode('.jpg', np.roll(img, frames * 3, axis=1), [cv2.IMWRITE_JPEG_QUALITY, quality])[1].tobytes()
+        net.send_jpeg(jpeg)
+        sent += len(jpeg)
+        frames += 1
+        next_frame = max(next_frame + 1.0 / fps, now)
+        if now >= next_print:
+            st = proc.stats()['127.0.0.1']
+            rows.append((now - t0, args.kbps[p], quality, scale, fps, frames, st['completed']))
+            next_print += 1.0
+        time.sleep(max(0.0, next_frame - time.monotonic()))
+    stop.set()
+    rx.join(timeout=2.0)
+    st = proc.stats()['127.0.0.1']
+    net.close()
+    proc.close()
+    return rows, frames, st['completed'], recovered
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--kbps', type=float, nargs='+', default=[8000, 3000, 1200, 8000])
+    ap.add_argument('--phase', type=float, default=8.0, help='seconds per capacity step')
+    ap.add_argument('--buffer-ms', type=float, default=150.0, help='link queue, in time at its rate')
+    ap.add_argument('--port', type=int, default=5907)
+    args = ap.parse_args()
+
+    # gradients plus light grain: ~18 KB at quality 45, like a plain room on camera
+    h, w = config.FRAME_HEIGHT, config.FRAME_WIDTH
+    ramp = np.tile(np.linspace(0, 255, w, dtype=np.float32), (h, 1))
+    frame = np.dstack([ramp, ramp[::-1, ::-1], np.full_like(ramp, 90)]).astype(np.uint8)
+    grain = np.random.default_rng(0).integers(0, 60, (h, w, 3), dtype=np.uint8)
+    frame = cv2.add(frame, cv2.GaussianBlur(grain, (3, 3), 0.8))
+    for adaptive in (False, True):
+        rows, frames, done, recovered = run(args, adaptive, frame)
+        print(f'\n{"adaptive" if adaptive else "fixed"}: {frames} frames sent, {done} completed, '
+              f'{(1 - done / max(frames, 1)) * 100:.1f} % lost')
+        last = (0, 0)
+        for t, kbps, q, s, fps, n, c in rows:
+            dn, dc = n - last[0], c - last[1]
+            last = (n, c)
+            if int(t) % 2 == 0:
+                print(f'  t {t:5.1f} s  link {kbps:6.0f} kbps  quality {q:3d}  scale {s:4.2f}  '
+                      f'fps {fps:4.1f}  lost {(1 - dc / max(dn, 1)) * 100:5.1f} %')
+    # recovery phase: the link is back at its first capacity after running narrower
+    if len(args.kbps) > 1 and args.kbps[-1] >= args.kbps[0] > min(args.kbps):
+        if recovered is None:
+            print(f'\nnot recovered: settings below their maximum {args.phase:.0f} s after the link came back')
+            sys.exit(1)
+        print(f'\nrecovered: full quality, scale and fps {recovered:.1f} s after the link came back')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+"""steady-state allocations per frame in capture and decode, with and without the buffer pool
+
+    python test_script/bench_buffer_pool.py --frames 300
+
+capture reads a generated MJPEG .avi through cv2.VideoCapture (no camera
+needed); decode feeds single-chunk frames of the same JPEGs through a
+StreamProcessor in eager mode, the receiver path of main.py
+"""
+import argparse, os, struct, sys, tempfile, time, tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import cv2
+import numpy as np
+import config
+from buffer_pool import BufferPool
+from codec_utils import decode_jpeg_to_bgr
+from stream_processor import StreamProcessor
+
+
+def make_clip(path, frames, w, h):
+    rng = np.random.default_rng(0)
+    base = cv2.GaussianBlur(rng.integers(0, 256, (h, w, 3), dtype=np.uint8), (9, 9), 3)
+    out = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'MJPG'), 30, (w, h))
+    jpegs = []
+    for i in range(frames):
+        frame = np.roll(base, i, axis=1)
+        out.write(frame)
+        jpegs.append(cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 45])[1].tobytes())
+    out.release()
+    return jpegs
+
+
+def measure(label, step, frames):
+    for i in range(10):
+        step(i)  # warm up: pool fills, thread-local decoders appear
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    base, _ = tracemalloc.get_traced_memory()
+    t0 = time.perf_counter()
+    for i in range(frames):
+        step(i)
+    dt = (time.perf_counter() - t0) / frames * 1e3
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f'{label:<16} {dt:7.3f} ms/frame  peak transient {(peak - base) / 1024:9.1f} KiB')
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--frames', type=int, default=300)
+    args = ap.parse_args()
+    w, h = config.FRAME_WIDTH, config.FRAME_HEIGHT
+
+    path = os.path.join(tempfile.mkdtemp(), 'clip.avi')
+    jpegs = make_clip(path, 60, w, h)
+
+    cap = cv2.VideoCapture(path)
+    def capture_plain(i):
+        ok, frame = cap.read()
+        if not ok:
+            cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+    measure('capture', capture_plain, args.frames)
+
+    pool = BufferPool()
+    def capture_pooled(i):
+        fb = pool.acquire((h, w, 3))
+        ok, _ = cap.read(image=fb.array)
+        if not ok:
+            cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+        fb.release()
+    measure('capture pooled', capture_pooled, args.frames)
+    print('  pool', pool.stats())
+
+    def decode_plain(i):
+        decode_jpeg_to_bgr(jpegs[i % len(jpegs)])
+    measure('decode', decode_plain, args.frames)
+
+    pool = BufferPool()
+    config.DECODE_MODE = 'eager'
+    proc = StreamProcessor(['peer'], pool)
+    def decode_pooled(i):
+        proc.process_datagram(struct.pack('!HHH', i & 0xFFFF, 0, 1) + jpegs[i % len(jpegs)], 'peer')
+        fb = proc.acquire('peer')
+        if fb is not None:
+            fb.release()
+    measure('decode pooled', decode_pooled, args.frames)
+    print('  pool', pool.stats())
+    proc.close()
+    cap.release()
+
+
+if __name__ == '__main__':
+    main()
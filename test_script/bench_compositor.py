@@ -0,0 +1,62 @@
+"""DUAL composition cost: resize + concatenate per frame vs the preallocated compositor canvas
+
+    python test_script/bench_compositor.py --frames 500 --pane-height 360
+
+no window is opened; only the work done before cv2.imshow is timed
+"""
+import argparse, os, sys, time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import cv2
+import numpy as np
+from compositor import Compositor
+
+
+def concat_dual(f1, f2, h, pw):
+    # the pre-compositor DisplayManager.show_dual
+    if f1 is None:
+        f1 = np.zeros((h, pw, 3), np.uint8)
+        cv2.putText(f1, 'No peer', (40, h//2), cv2.FONT_HERSHEY_SIMPLEX, 1, (255,255,255), 2)
+    if f2 is None:
+        f2 = np.zeros((h, pw, 3), np.uint8)
+        cv2.putText(f2, 'No peer', (40, h//2), cv2.FONT_HERSHEY_SIMPLEX, 1, (255,255,255), 2)
+    if f1.shape[0] != h:
+        f1 = cv2.resize(f1, (int(f1.shape[1]*h/f1.shape[0]), h))
+    if f2.shape[0] != h:
+        f2 = cv2.resize(f2, (int(f2.shape[1]*h/f2.shape[0]), h))
+    return np.concatenate([f1, f2], axis=1)
+
+
+def measure(label, fn, frames):
+    fn()
+    t0 = time.perf_counter()
+    for _ in range(frames):
+        fn()
+    print(f'{label:<22} {(time.perf_counter() - t0) / frames * 1e3:7.3f} ms/frame')
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--frames', type=int, default=500)
+    ap.add_argument('--width', type=int, default=640)
+    ap.add_argument('--height', type=int, default=480)
+    ap.add_argument('--pane-height', type=int, default=360)
+    args = ap.parse_args()
+
+    h = args.pane_height
+    pw = args.width * h // args.height
+    rng = np.random.default_rng(0)
+    frame = rng.integers(0, 256, (args.height, args.width, 3), dtype=np.uint8)
+
+    comp = Compositor()
+    comp.add_layout('DUAL', (2 * pw, h), [(0, 0, pw, h), (pw, 0, pw, h)])
+
+    measure('concat two frames', lambda: concat_dual(frame, frame, h, pw), args.frames)
+    measure('compose two frames', lambda: comp.compose('DUAL', [frame, frame], ['', '']), args.frames)
+    measure('concat one missing', lambda: concat_dual(frame, None, h, pw), args.frames)
+    measure('compose one missing', lambda: comp.compose('DUAL', [frame, None], ['', 'No peer']), args.frames)
+    print('compositor', comp.stats())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+"""per-frame cost of the CPU glitch effects against a per-frame budget
+
+    python test_script/bench_effects.py --frames 300 --budget-ms 3
+
+'before' rows are the commented-out fallbacks the CPU path used to have
+(np.roll per channel / per row, fresh noise every frame); 'after' rows are
+the registered effect plugins with CUDA disabled.  The ladder section runs
+every effect chained under a deliberately tight EffectManager budget and
+shows the levels it degrades to.  The last section times one render of a
+glitched DUAL / GRID view: apply() per pane in turn vs apply_many() on
+EFFECT_WORKERS threads (no gain to expect on a single core)
+"""
+import argparse, os, random, sys, time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import cv2
+import numpy as np
+import config
+import effect_manager
+from effect_manager import EFFECTS, EffectManager
+
+
+def old_channel_shift(frame):
+    shift_x = random.randint(-5, 5)
+    shift_y = random.randint(-5, 5)
+    g = np.roll(frame[:, :, 1], shift_x, axis=1)
+    g = np.roll(g, shift_y, axis=0)
+    out = frame.copy()
+    out[:, :, 1] = g
+    return out
+
+
+def old_scan_line_offset(frame):
+    h = frame.shape[0]
+    out = np.empty_like(frame)
+    for y in range(h):
+        dx = random.randint(-5, 5)
+        out[y] = np.roll(frame[y], dx, axis=1)
+    return out
+
+
+def old_noise_overlay(frame):
+    noise = np.random.randint(0, 256, frame.shape[:2], dtype=np.uint8)
+    noise_bgr = cv2.cvtColor(noise, cv2.COLOR_GRAY2BGR)
+    return cv2.addWeighted(frame, 1.0, noise_bgr, 0.5, 0.0)
+
+
+def measure(fn, frames):
+    fn()
+    t0 = time.perf_counter()
+    worst = 0.0
+    for _ in range(frames):
+        t1 = time.perf_counter()
+        fn()
+        worst = max(worst, time.perf_counter() - t1)
+    return (time.perf_counter() - t0) / frames * 1e3, worst * 1e3
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--frames', type=int, default=300)
+    ap.add_argument('--width', type=int, default=640)
+    ap.add_argument('--height', type=int, default=480)
+    ap.add_argument('--budget-ms', type=float, default=3.0)
+    ap.add_argument('--panes', type=int, nargs='+', default=[2, 4])
+    args = ap.parse_args()
+
+    effect_manager._GPU_AVAILABLE = False
+    rng = np.random.default_rng(0)
+    frame = rng.integers(0, 256, (args.height, args.width, 3), dtype=np.uint8)
+    out = np.empty_like(frame)
+    em = EffectManager()
+    plugins = {name: cls(em.assets) for name, cls in EFFECTS.items()}
+    effects = [('channel_shift', old_channel_shift, plugins['channel_shift'].apply),
+               ('scan_line_offset', old_scan_line_offset, plugins['scan_line_offset'].apply),
+               ('noise_overlay', old_noise_overlay, plugins['noise_overlay'].apply)]
+
+    print(f'{args.width}x{args.height}, {args.frames} frames, budget {args.budget_ms} ms')
+    over = 0
+    for name, old, new in effects:
+        b_avg, _ = measure(lambda: old(frame), args.frames)
+        a_avg, a_max = measure(lambda: new(frame, out, 1.0), args.frames)
+        ok = a_avg <= args.budget_ms
+        over += not ok
+        print(f'{name:<18} before {b_avg:7.3f} ms  after {a_avg:7.3f} ms (max {a_max:6.3f})  '
+              f'{"ok" if ok else "OVER BUDGET"}')
+
+    # degrade ladder: the whole chain must fit in a budget well below its cost
+    chain = list(EFFECTS)
+    config.EFFECT_CHAINS = [chain]
+    config.EFFECT_BUDGET_MS = args.budget_ms / 4
+    em = EffectManager()
+    em.start_glitch(['peer'], 3600)
+    avg, worst = measure(lambda: em.apply('peer', frame), args.frames)
+    print(f'\nchain {"+".join(chain)} under {config.EFFECT_BUDGET_MS} ms: {avg:.3f} ms/frame (max {worst:.3f})')
+    for name, st in em.stats().items():
+        print(f'  {name:<18} level {st["level"]}  applied {st["frames"]:4d}  skipped {st["skipped"]:4d}  '
+              f'{st["ms_avg"]:.3f} ms  per level {st["level_ms"]}  skipped levels {st["slower"]}')
+
+    # multi-pane views: every pane glitched with the full chain, no degrading
+    config.EFFECT_BUDGET_MS = 1e9
+    em = EffectManager()
+    print(f'\nrender thread per view, {os.cpu_count()} cpus, EFFECT_WORKERS {config.EFFECT_WORKERS}')
+    for n in args.panes:
+        ips = [f'peer{i}' for i in range(n)]
+        frames = [frame.copy() for _ in ips]
+        em.start_glitch(ips, 3600)
+        seq, _ = measure(lambda: [em.apply(ip, f) for ip, f in zip(ips, frames)], args.frames)
+        par, _ = measure(lambda: em.apply_many(ips, frames), args.frames)
+        print(f'{n} panes  sequential {seq:7.3f} ms  apply_many {par:7.3f} ms')
+    em.close()
+    sys.exit(1 if over else 0)
+
+
+if __name__ == '__main__':
+    main()
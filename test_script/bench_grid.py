@@ -0,0 +1,175 @@
+"""GRID view frame rate and render cost as the number of peers grows, over loopback
+
+    python test_script/bench_grid.py --peers 3 5 7 9 --seconds 5 --fps 30
+
+every simulated peer sends pre-encoded 640x480 JPEGs from its own 127.0.0.x
+address; the receive side is the app's: NetworkManager -> StreamProcessor ->
+FrameMailbox -> tile-size decode -> grid compose, redrawing at most
+RENDER_FPS times a second.  No window is opened.  The bench stops if the
+TurboJPEG decode fails (no native libturbojpeg); --cv2-decode then
+decodes with cv2.imdecode at the nearest IMREAD_REDUCED scale instead,
+which is slower than TurboJPEG's DCT scaling
+"""
+import argparse, os, socket, struct, sys, threading, time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import cv2
+import numpy as np
+import config
+from buffer_pool import BufferPool
+from compositor import Compositor, grid_regions
+from frame_mailbox import FrameMailbox
+from network_manager import NetworkManager
+import stream_processor
+from stream_processor import StreamProcessor
+
+
+_HDR = struct.Struct('!HHH')
+
+
+def make_jpegs(count, w, h, quality):
+    rng = np.random.default_rng(0)
+    base = cv2.GaussianBlur(rng.integers(0, 256, (h, w, 3), dtype=np.uint8), (9, 9), 3)
+    return [cv2.imencode('.jpg', np.roll(base, 7 * i, axis=1), [cv2.IMWRITE_JPEG_QUALITY, quality])[1].tobytes()
+            for i in range(count)]
+
+
+_REDUCED = {1: cv2.IMREAD_COLOR, 2: cv2.IMREAD_REDUCED_COLOR_2,
+            4: cv2.IMREAD_REDUCED_COLOR_4, 8: cv2.IMREAD_REDUCED_COLOR_8}
+
+
+def use_cv2_decode():
+    """decode with cv2 in place of TurboJPEG; every bench frame is FRAME_WIDTH x FRAME_HEIGHT"""
+    def decoded_shape(jpeg, size=None):
+        w, h = config.FRAME_WIDTH, config.FRAME_HEIGHT
+        r = 1
+        while size is not None and r < 8 and w // (2 * r) >= size[0] and h // (2 * r) >= size[1]:
+            r *= 2
+        return ((h + r - 1) // r, (w + r - 1) // r, 3), r
+
+    def decode_into(jpeg, dst, r=None):
+        img = cv2.imdecode(np.frombuffer(jpeg, np.uint8), _REDUCED[r or 1])
+        if img is None or img.shape != dst.shape:
+            return None
+        np.copyto(dst, img)
+        return dst
+
+    stream_processor.decoded_shape = decoded_shape
+    stream_processor.decode_jpeg_into = decode_into
+
+
+def check_decoder(jpeg):
+    proc = StreamProcessor([])
+    fb = proc._decode(jpeg, (160, 120))
+    if fb is None:
+        sys.exit('JPEG decode fails (is the native libturbojpeg installed?); '
+                 'rerun with --cv2-decode to measure with cv2.imdecode')
+    fb.release()
+    proc.close()
+
+
+def sender(ip, port, jpegs, fps, stop):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind((ip, 0))
+    payload = config.MAX_DATAGRAM - _HDR.size
+    period = 1.0 / fps
+    due = time.monotonic()
+    fid = 0
+    while not stop.is_set():
+        jpeg = jpegs[fid % len(jpegs)]
+        total = (len(jpeg) + payload - 1) // payload
+        for cid in range(total):
+            sock.sendto(_HDR.pack(fid & 0xFFFF, cid, total) + jpeg[cid * payload:(cid + 1) * payload],
+                        ('127.0.0.1', port))
+        fid += 1
+        due += period
+        delay = due - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+    sock.close()
+
+
+def run(n, args, jpegs):
+    ips = [f'127.0.0.{10 + i}' for i in range(n)]
+    mail = FrameMailbox(ips)
+    net = NetworkManager(args.port, [{'ip': ip} for ip in ips])
+    proc = StreamProcessor(ips, BufferPool(), mail)
+    h = config.GRID_HEIGHT
+    comp = Compositor()
+    comp.add_layout('GRID', *grid_regions(n, int(config.FRAME_WIDTH * h / config.FRAME_HEIGHT), h))
+    size = comp.region_size('GRID')
+
+    stop = threading.Event()
+    def receive():
+        while not stop.is_set():
+            batch = net.recv_batch()
+            if batch:
+                proc.process_datagrams(batch)
+    threads = [threading.Thread(target=receive, daemon=True)]
+    threads += [threading.Thread(target=sender, args=(ip, args.port, jpegs, args.fps, stop), daemon=True)
+                for ip in ips]
+    for t in threads:
+        t.start()
+
+    min_interval = 1.0 / config.RENDER_FPS if config.RENDER_FPS else 0.0
+    seen, draws, render_ms, last, empty = (), 0, 0.0, 0.0, 0
+    c0 = time.process_time()
+    t_end = time.monotonic() + args.seconds
+    while time.monotonic() < t_end:
+        hold = last + min_interval - time.monotonic()
+        if hold > 0:
+            time.sleep(hold)
+        if not mail.wait(ips, seen, 0.05):
+            continue
+        gens = mail.generations(ips)
+        t0 = time.perf_counter()
+        held = proc.acquire_many(ips, size)
+        empty += sum(fb is None for fb in held)
+        comp.compose('GRID', [fb.array if fb else None for fb in held], [''] * n)
+        for fb in held:
+            if fb is not None:
+                fb.release()
+        render_ms += (time.perf_counter() - t0) * 1e3
+        mail.drawn(ips, seen, gens)
+        seen, last = gens, time.monotonic()
+        draws += 1
+    cpu = time.process_time() - c0
+
+    stop.set()
+    for t in threads:
+        t.join(timeout=2.0)
+    st = proc.stats()
+    done = sum(s['completed'] for s in st.values())
+    print(f'{n:2d} peers  tile {size[0]}x{size[1]}  redraw {draws / args.seconds:5.1f} fps  '
+          f'render {render_ms / max(draws, 1):6.2f} ms  frames in {done / args.seconds / n:5.1f} fps/peer  '
+          f'decodes {proc.decodes}  latency {mail.latency_ms_avg:6.2f} ms  cpu {cpu / args.seconds * 100:5.1f} %')
+    if empty:
+        print(f'          {empty} tiles drawn without a frame')
+    proc.close()
+    net.close()
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--peers', type=int, nargs='+', default=[3, 5, 7, 9])
+    ap.add_argument('--seconds', type=float, default=5.0)
+    ap.add_argument('--fps', type=float, default=30.0)
+    ap.add_argument('--quality', type=int, default=config.JPEG_QUALITY)
+    ap.add_argument('--port', type=int, default=5905)
+    ap.add_argument('--decode-mode', default='lazy', choices=['eager', 'lazy', 'pool'])
+    ap.add_argument('--cv2-decode', action='store_true', help='decode with cv2.imdecode instead of TurboJPEG')
+    args = ap.parse_args()
+    config.DECODE_MODE = args.decode_mode
+
+    jpegs = make_jpegs(30, config.FRAME_WIDTH, config.FRAME_HEIGHT, args.quality)
+    if args.cv2_decode:
+        use_cv2_decode()
+    check_decoder(jpegs[0])
+    print(f'{args.decode_mode} decode{" (cv2)" if args.cv2_decode else ""}, senders at {args.fps} fps, '
+          f'JPEG ~{len(jpegs[0]) // 1024} KiB')
+    for n in args.peers:
+        run(n, args, jpegs)
+
+
+if __name__ == '__main__':
+    main()
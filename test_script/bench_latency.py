@@ -0,0 +1,97 @@
+"""end-to-end latency percentiles and v1 / v2 header interop, over loopback
+
+    python test_script/bench_latency.py --seconds 5 --delay-ms 0 20
+
+NetworkManager sends ~20 KB frames at FPS_LIMIT to its own receive socket,
+stamped with a capture time --encode-ms before the send.  The receive side
+holds every datagram --delay-ms (a one-way link delay; pongs go through it
+too, so the round trip grows) before StreamProcessor reassembles it, and
+its control datagrams are sent back as in main.  Prints the capture ->
+complete percentiles the processor reports, then repeats with
+PROTOCOL_VERSION = 1 and with the sender switching version halfway to show
+old-format frames are still completed
+"""
+import argparse, collections, os, sys, threading, time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import numpy as np
+import config
+from network_manager import NetworkManager
+from stream_processor import StreamProcessor
+
+
+def run(args, version, delay_ms, frames, switch=False):
+    config.PROTOCOL_VERSION = version
+    config.DECODE_MODE = 'lazy'
+    net = NetworkManager(args.port, [{'ip': '127.0.0.1'}])
+    proc = StreamProcessor(['127.0.0.1'])
+    stop = threading.Event()
+    held = collections.deque()   # (due, data, ip)
+
+    def receive():
+        while not stop.is_set():
+            now = time.monotonic()
+            for data, ip in net.recv_batch():
+                held.append((now + delay_ms / 1e3, data, ip))
+            while held and held[0][0] <= time.monotonic():
+                _due, data, ip = held.popleft()
+                proc.process_datagram(data, ip)
+            for ip, data in proc.outgoing():
+                net.send_control(ip, data)
+    net._recv.settimeout(0.001)
+    rx = threading.Thread(target=receive, daemon=True)
+    rx.start()
+
+    period = 1.0 / config.FPS_LIMIT
+    n = int(args.seconds * config.FPS_LIMIT)
+    t_next = time.monotonic()
+    tx = net
+    for i in range(n):
+        if switch and i == n // 2:
+            # the peer restarts with the other header format
+            config.PROTOCOL_VERSION = 1 if version == 2 else 2
+            tx = NetworkManager(args.port + 1, [{'ip': '127.0.0.1'}])
+            tx.targets = [('127.0.0.1', args.port)]
+        tx.send_jpeg(frames[i % len(frames)], time.monotonic() - args.encode_ms / 1e3)
+        t_next += period
+        time.sleep(max(0.0, t_next - time.monotonic()))
+    time.sleep(0.2 + delay_ms / 1e3)
+    stop.set()
+    rx.join(timeout=2.0)
+    if tx is not net:
+        tx.close()
+    net.close()
+    st = proc.stats()['127.0.0.1']
+    proc.close()
+    return n, st
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--seconds', type=float, default=5.0)
+    ap.add_argument('--frame-kb', type=float, default=20.0)
+    ap.add_argument('--encode-ms', type=float, default=5.0, help='capture -> send time stamped into each frame')
+    ap.add_argument('--delay-ms', type=float, nargs='*', default=[0.0, 20.0])
+    ap.add_argument('--port', type=int, default=5911)
+    args = ap.parse_args()
+
+    rng = np.random.default_rng(0)
+    size = int(args.frame_kb * 1024)
+    frames = [rng.integers(0, 256, size, dtype=np.uint8).tobytes() for _ in range(8)]
+    print(f'{config.FPS_LIMIT} fps, {args.frame_kb:.0f} KB frames, {args.encode_ms:.0f} ms capture -> send')
+    for delay in args.delay_ms:
+        n, st = run(args, 2, delay, frames)
+        print(f'v2  delay {delay:4.0f} ms  {st["completed"]:4d}/{n} frames  '
+              f'e2e p50 {st.get("e2e_p50_ms", float("nan")):6.2f}  p90 {st.get("e2e_p90_ms", float("nan")):6.2f}  '
+              f'p99 {st.get("e2e_p99_ms", float("nan")):6.2f}  max {st.get("e2e_max_ms", float("nan")):6.2f} ms  '
+              f'offset {st.get("clock_offset_ms", float("nan")):6.3f}  rtt {st.get("rtt_ms", float("nan")):6.2f} ms')
+    n, st = run(args, 1, 0.0, frames)
+    print(f'v1  {st["completed"]:4d}/{n} frames completed, latency figures: {"e2e_p50_ms" in st}')
+    for version in (2, 1):
+        n, st = run(args, version, 0.0, frames, switch=True)
+        print(f'v{version} -> v{3 - version} halfway  {st["completed"]:4d}/{n} frames completed, '
+              f'receiver now on v{st["version"]}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+"""loopback benchmark for NetworkManager: per-datagram vs batched (sendmmsg/recvmmsg) I/O
+
+    python test_script/bench_net_batch.py --frames 600 --size 45000
+
+reports received packets/s and sender/receiver CPU time per frame for both paths
+"""
+import argparse, os, socket, sys, threading, time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import config
+import socket_utils
+from network_manager import NetworkManager
+
+
+def run(label, batched, native, frames, size, port, fps):
+    config.NET_BATCH_IO = batched
+    real_mmsg = socket_utils.MMSG_AVAILABLE
+    socket_utils.MMSG_AVAILABLE = real_mmsg and native
+    try:
+        net = NetworkManager(port, [{'ip': '127.0.0.1', 'name': 'loop'}])
+    finally:
+        socket_utils.MMSG_AVAILABLE = real_mmsg
+    net._recv.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 8 << 20)
+
+    stop = threading.Event()
+    rx = {'packets': 0, 'calls': 0, 'first': None, 'last': None, 'cpu': 0.0}
+
+    def receiver():
+        t_cpu = time.thread_time()
+        while not stop.is_set():
+            batch = net.recv_batch()
+            if batch:
+                now = time.perf_counter()
+                if rx['first'] is None:
+                    rx['first'] = now
+                rx['last'] = now
+                rx['packets'] += len(batch)
+                rx['calls'] += 1
+        rx['cpu'] = time.thread_time() - t_cpu
+
+    t = threading.Thread(target=receiver, daemon=True)
+    t.start()
+    time.sleep(0.1)
+
+    payload = os.urandom(size)
+    period = 1.0 / fps if fps else 0.0
+    t_cpu = time.thread_time()
+    t_next = time.perf_counter()
+    for _ in range(frames):
+        net.send_jpeg(payload)
+        if period:
+            t_next += period
+            delay = t_next - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+    tx_cpu = time.thread_time() - t_cpu
+
+    time.sleep(0.3)
+    stop.set()
+    t.join()
+    net.close()
+
+    # chunk payload depends on the header version (and FEC) the manager sends with
+    chunk = net._chunk
+    chunks = (size + chunk - 1) // chunk
+    sent = frames * chunks
+    span = (rx['last'] - rx['first']) if rx['first'] is not None and rx['last'] > rx['first'] else float('nan')
+    print(f"{label:<22} pkts/s {rx['packets'] / span:10.0f}   "
+          f"tx cpu/frame {tx_cpu / frames * 1e3:6.3f} ms   "
+          f"rx cpu/frame {rx['cpu'] / frames * 1e3:6.3f} ms   "
+          f"pkts/recv {rx['packets'] / max(rx['calls'], 1):5.1f}   "
+          f"loss {100.0 * (sent - rx['packets']) / sent:5.1f} %")
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--frames', type=int, default=600)
+    ap.add_argument('--size', type=int, default=45000, help='bytes per synthetic JPEG')
+    ap.add_argument('--fps', type=float, default=0, help='0 = send as fast as possible')
+    ap.add_argument('--port', type=int, default=5099)
+    args = ap.parse_args()
+
+    print(f"{args.frames} frames x {args.size} B, mmsg available: {socket_utils.MMSG_AVAILABLE}")
+    run('per-datagram (old)', False, False, args.frames, args.size, args.port, args.fps)
+    run('batched, pure python', True, False, args.frames, args.size, args.port + 1, args.fps)
+    run('batched, mmsg', True, True, args.frames, args.size, args.port + 2, args.fps)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,122 @@
+"""burst size and loss with and without send pacing, over loopback
+
+    python test_script/bench_pacing.py --seconds 6 --link-mbps 20 --rcvbuf 12000
+
+NetworkManager sends ~20 KB frames at FPS_LIMIT to its own receive socket.
+The socket gets a small SO_RCVBUF and is drained at --link-mbps, so it
+behaves like a switch port with a shallow buffer: datagrams arriving while
+it is full are dropped by the kernel.  Bursts are measured on the send side
+(most datagrams sent within any 1 ms); frames are reassembled by
+StreamProcessor to count the ones lost.  Run once unpaced, then with
+PACE_FRACTION at each --pace value
+"""
+import argparse, os, socket, sys, threading, time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import numpy as np
+import config
+from network_manager import NetworkManager
+from stream_processor import StreamProcessor
+
+
+class StampedSocket:
+    """send socket wrapper recording when each datagram left"""
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.stamps = []
+
+    def sendmsg(self, *args):
+        self.stamps.append(time.perf_counter())
+        return self.sock.sendmsg(*args)
+
+    def __getattr__(self, name):
+        return getattr(self.sock, name)
+
+
+def run(args, pace, frames):
+    config.PACE_FRACTION = pace
+    config.DECODE_MODE = 'lazy'
+    config.NET_BATCH_IO = False
+    net = NetworkManager(args.port, [{'ip': '127.0.0.1'}])
+    net._recv.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, args.rcvbuf)
+    stamped = StampedSocket(net._send)
+    net._send = stamped
+    if net._pacer is not None:
+        net._pacer._sock = stamped
+    proc = StreamProcessor(['127.0.0.1'])
+
+    stop = threading.Event()
+    got = [0]
+    def drain():
+        # serialise at the link rate: sleep whenever the link is ahead of real time
+        rate = args.link_mbps * 1e6 / 8
+        link_t = time.monotonic()
+        while not stop.is_set():
+            data, ip = net.recv_datagram()
+            if data is None:
+                continue
+            got[0] += 1
+            proc.process_datagram(data, ip)
+            link_t = max(link_t, time.monotonic()) + (len(data) + 28) / rate
+            ahead = link_t - time.monotonic()
+            if ahead > 0.0005:
+                time.sleep(ahead)
+    rx = threading.Thread(target=drain, daemon=True)
+    rx.start()
+
+    period = 1.0 / config.FPS_LIMIT
+    t_next = time.monotonic()
+    starts = []
+    sent = 0
+    n = int(args.seconds * config.FPS_LIMIT)
+    for i in range(n):
+        starts.append(time.perf_counter())
+        net.send_jpeg(frames[i % len(frames)])
+        sent += 1
+        t_next += period
+        time.sleep(max(0.0, t_next - time.monotonic()))
+    time.sleep(0.3)
+    stop.set()
+    rx.join(timeout=2.0)
+    net.close()
+
+    # per frame: most datagrams inside any 1 ms, and first -> last datagram
+    stamps = np.array(stamped.stamps)
+    bounds = np.searchsorted(stamps, starts + [float('inf')])
+    bursts, spreads = [], []
+    for a, b in zip(bounds[:-1], bounds[1:]):
+        ts = stamps[a:b]
+        if len(ts):
+            bursts.append(int((np.searchsorted(ts, ts + 1e-3) - np.arange(len(ts))).max()))
+            spreads.append((ts[-1] - ts[0]) * 1e3)
+    done = proc.stats()['127.0.0.1']['completed']
+    label = f'paced {pace:.2f}' if pace else 'unpaced   '
+    print(f'{label}  burst {np.mean(bursts):5.1f} avg {max(bursts):3d} max datagrams/ms  '
+          f'spread {np.mean(spreads):5.1f} ms  datagrams lost {(1 - got[0] / max(len(stamps), 1)) * 100:5.1f} %  '
+          f'frames lost {(1 - done / sent) * 100:5.1f} %')
+    proc.close()
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--seconds', type=float, default=6.0)
+    ap.add_argument('--frame-kb', type=float, default=20.0)
+    ap.add_argument('--link-mbps', type=float, default=20.0)
+    ap.add_argument('--rcvbuf', type=int, default=12000, help='receive buffer bytes (the kernel doubles it)')
+    ap.add_argument('--pace', type=float, nargs='*', default=[0.25, 0.5])
+    ap.add_argument('--port', type=int, default=5909)
+    args = ap.parse_args()
+
+    rng = np.random.default_rng(0)
+    size = int(args.frame_kb * 1024)
+    frames = [rng.integers(0, 256, size + int(rng.integers(-size // 5, size // 5)), dtype=np.uint8).tobytes()
+              for _ in range(16)]
+    print(f'{config.FPS_LIMIT} fps, ~{args.frame_kb:.0f} KB frames, link {args.link_mbps} Mbit/s, '
+          f'rcvbuf {args.rcvbuf} B')
+    for pace in [0.0] + args.pace:
+        run(args, pace, frames)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+"""sender-side allocations per frame: header+slice concatenation vs zero-copy send_jpeg
+
+    python test_script/bench_send_alloc.py --frames 300 --size 45000
+
+datagrams go to a loopback port nobody listens on; only the sender is measured
+"""
+import argparse, os, socket, struct, sys, time, tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import config
+from network_manager import NetworkManager
+
+
+_HDR = struct.Struct('!HHH')
+
+
+def concat_send(sock, targets, fid, jpeg_bytes):
+    # the pre zero-copy implementation of send_jpeg
+    payload = config.MAX_DATAGRAM - _HDR.size
+    total = (len(jpeg_bytes) + payload - 1) // payload
+    for cid in range(total):
+        start = cid * payload
+        chunk = _HDR.pack(fid, cid, total) + jpeg_bytes[start:start + payload]
+        for addr in targets:
+            try:
+                sock.sendto(chunk, addr)
+            except Exception:
+                pass
+
+
+def measure(label, send, frames):
+    send()  # warm caches and lazily created buffers
+    tracemalloc.start()
+    peak_sum = 0
+    blocks = sys.getallocatedblocks()
+    t0 = time.perf_counter()
+    for _ in range(frames):
+        tracemalloc.reset_peak()
+        base, _ = tracemalloc.get_traced_memory()
+        send()
+        _, peak = tracemalloc.get_traced_memory()
+        peak_sum += peak - base
+    dt = time.perf_counter() - t0
+    leaked = sys.getallocatedblocks() - blocks
+    tracemalloc.stop()
+    print(f"{label:<24} peak transient alloc/frame {peak_sum / frames:8.0f} B   "
+          f"retained blocks {leaked:4d}   {dt / frames * 1e3:6.3f} ms/frame (traced)")
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--frames', type=int, default=300)
+    ap.add_argument('--size', type=int, default=45000, help='bytes per synthetic JPEG')
+    ap.add_argument('--peers', type=int, default=2)
+    ap.add_argument('--port', type=int, default=5098)
+    args = ap.parse_args()
+
+    jpeg = os.urandom(args.size)
+    peers = [{'ip': '127.0.0.1', 'name': f'loop{i}'} for i in range(args.peers)]
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    targets = [(p['ip'], args.port) for p in peers]
+    measure('concatenate (old)', lambda: concat_send(sock, targets, 0, jpeg), args.frames)
+    sock.close()
+
+    for batched in (False, True):
+        config.NET_BATCH_IO = batched
+        net = NetworkManager(args.port + 1 + batched, peers)
+        net.targets = targets
+        measure('zero-copy, batched' if batched else 'zero-copy, sendmsg',
+                lambda: net.send_jpeg(jpeg), args.frames)
+        net.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+"""cost of telemetry spans, on and off, against the frame time
+
+    python test_script/bench_telemetry.py --peers 3 --threads 4
+
+times start()/stop() pairs and count() calls with TELEMETRY off and on,
+single threaded and from --threads threads at once (encode workers,
+effect workers and the decode pool all record concurrently).  A frame
+records about 6 + 2 * peers spans (capture, encode, send, composite,
+imshow, effects, and reassembly + decode per peer); the per-frame total
+is compared with 1 / FPS_LIMIT.  Finally a snapshot is written to a file
+and fetched from the localhost endpoint
+"""
+import argparse, json, os, sys, tempfile, threading, time, urllib.request
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import config
+import telemetry
+
+
+def span_ns(n):
+    start, stop = telemetry.start, telemetry.stop
+    t = time.perf_counter()
+    for _ in range(n):
+        stop('bench', start())
+    return (time.perf_counter() - t) / n * 1e9
+
+
+def count_ns(n):
+    count = telemetry.count
+    t = time.perf_counter()
+    for _ in range(n):
+        count('bench')
+    return (time.perf_counter() - t) / n * 1e9
+
+
+def threaded_ns(n, threads):
+    # wall time per span with every thread recording into the same histogram
+    ts = [threading.Thread(target=span_ns, args=(n,)) for _ in range(threads)]
+    t = time.perf_counter()
+    for th in ts:
+        th.start()
+    for th in ts:
+        th.join()
+    return (time.perf_counter() - t) / (n * threads) * 1e9
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--calls', type=int, default=200000)
+    ap.add_argument('--threads', type=int, default=4)
+    ap.add_argument('--peers', type=int, default=3)
+    ap.add_argument('--port', type=int, default=8765)
+    args = ap.parse_args()
+
+    frame_us = 1e6 / (config.FPS_LIMIT or 30)
+    spans = 6 + 2 * args.peers
+    for on in (False, True):
+        telemetry.enable(on)
+        telemetry.reset()
+        s = span_ns(args.calls)
+        c = count_ns(args.calls)
+        m = threaded_ns(args.calls // args.threads, args.threads)
+        per_frame = spans * s / 1e3
+        print(f'telemetry {"on " if on else "off"}  span {s:6.0f} ns  count {c:5.0f} ns  '
+              f'span x{args.threads} threads {m:6.0f} ns  '
+              f'{spans} spans/frame {per_frame:6.2f} us = {per_frame / frame_us * 100:.3f} % of a '
+              f'{frame_us / 1e3:.1f} ms frame')
+
+    h = telemetry.snapshot()['spans']['bench']
+    expected = args.calls + args.calls // args.threads * args.threads
+    print(f'recorded {h["n"]} spans of {expected} (none lost to races)')
+
+    path = os.path.join(tempfile.mkdtemp(), 'telemetry.json')
+    telemetry.serve(path, 0.2, args.port)
+    time.sleep(0.5)
+    with open(path) as f:
+        on_disk = json.load(f)
+    with urllib.request.urlopen(f'http://127.0.0.1:{args.port}/', timeout=2) as r:
+        served = json.load(r)
+    telemetry.close()
+    print(f'file dump: {sorted(on_disk["spans"])}  http: {served["spans"]["bench"]["n"]} spans')
+
+
+if __name__ == '__main__':
+    main()
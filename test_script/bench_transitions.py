@@ -0,0 +1,138 @@
+"""time spent in the key handler arming a transition, and clip playback timing
+
+    python test_script/bench_transitions.py --clips 4 --arms 10
+
+writes short 640x480 test clips to a temp dir (or uses --clip-dir), then
+compares the old synchronous arm (open the clip + warm-up read on the UI
+thread) with TransitionManager's prefetched one.  The playback section
+plays a clip with the render loop calling next_frame() at different rates
+(``--loop-ms``; a slow loop stands in for a loaded box) and compares the
+wall-clock duration with the clip's own length.  The last section plays
+every clip once from the clip folder and from clip stores built from it
+(build_clip_store.py, raw and JPEG) and reports CPU time per frame shown,
+decoder threads included.  No window is opened
+"""
+import argparse, os, sys, tempfile, time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import cv2
+import numpy as np
+import build_clip_store
+from clip_reader import open_clip
+from transition_manager import TransitionManager
+
+
+def make_clips(folder, count, seconds, fps, w=640, h=480):
+    rng = np.random.default_rng(0)
+    for i in range(count):
+        out = cv2.VideoWriter(os.path.join(folder, f'clip{i}.avi'), cv2.VideoWriter_fourcc(*'MJPG'), fps, (w, h))
+        base = cv2.GaussianBlur(rng.integers(0, 256, (h, w, 3), dtype=np.uint8), (9, 9), 3)
+        for f in range(int(seconds * fps)):
+            out.write(np.roll(base, 5 * f, axis=1))
+        out.release()
+
+
+def old_arm(path):
+    # the pre-prefetch arm_transition, minus the chance roll
+    cap = open_clip(path)
+    cap.read()
+    return cap
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--clip-dir')
+    ap.add_argument('--clips', type=int, default=4)
+    ap.add_argument('--seconds', type=float, default=3.0)
+    ap.add_argument('--fps', type=float, default=30.0)
+    ap.add_argument('--arms', type=int, default=10)
+    ap.add_argument('--prefetch-frames', type=int, default=60)
+    ap.add_argument('--loop-ms', type=float, nargs='+', default=[1.0, 16.7, 50.0])
+    ap.add_argument('--formats', nargs='*', default=['raw', 'jpeg'], help='clip store formats to compare')
+    args = ap.parse_args()
+
+    tmp = None
+    folder = args.clip_dir
+    if folder is None:
+        tmp = tempfile.TemporaryDirectory()
+        folder = tmp.name
+        make_clips(folder, args.clips, args.seconds, args.fps)
+    paths = sorted(os.path.join(folder, p) for p in os.listdir(folder))
+
+    worst = total = 0.0
+    for i in range(args.arms):
+        t0 = time.perf_counter()
+        cap = old_arm(paths[i % len(paths)])
+        ms = (time.perf_counter() - t0) * 1e3
+        cap.release()
+        worst, total = max(worst, ms), total + ms
+    print(f'synchronous arm   {total / args.arms:7.2f} ms avg  {worst:7.2f} ms max')
+
+    trans = TransitionManager(folder, 1.0, prefetch_frames=args.prefetch_frames)
+    worst = total = 0.0
+    armed = 0
+    for _ in range(args.arms):
+        # give the prefetch the time a view would normally stay up
+        time.sleep(1.0)
+        t0 = time.perf_counter()
+        armed += trans.arm_transition()
+        ms = (time.perf_counter() - t0) * 1e3
+        worst, total = max(worst, ms), total + ms
+        trans.abort()
+    trans.close()
+    print(f'prefetched arm    {total / args.arms:7.2f} ms avg  {worst:7.2f} ms max  ({armed}/{args.arms} armed)')
+
+    # playback clock: duration must not depend on how often the loop asks
+    for loop_ms in args.loop_ms:
+        # the old next_frame: one decoded frame per call
+        cap = open_clip(paths[0])
+        length = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        expect = length / (cap.get(cv2.CAP_PROP_FPS) or args.fps)
+        t0 = time.monotonic()
+        while cap.read()[0]:
+            time.sleep(loop_ms / 1e3)
+        old = time.monotonic() - t0
+        cap.release()
+
+        trans = TransitionManager(folder, 1.0, prefetch_frames=args.prefetch_frames)
+        while not trans.arm_transition():
+            time.sleep(0.05)
+        reader = trans.reader
+        t0 = time.monotonic()
+        while not trans.next_frame()[1]:
+            time.sleep(loop_ms / 1e3)
+        new = time.monotonic() - t0
+        print(f'loop {loop_ms:5.1f} ms  clip {expect:5.2f} s  per-call {old:5.2f} s  clocked {new:5.2f} s  '
+              f'(shown {trans.frames_shown}, dropped {trans.frames_dropped}, '
+              f'grabbed undecoded {reader.grabbed})')
+        trans.close()
+
+    # playback cost: clip folder vs clip stores
+    sources = [('clip folder', None)]
+    for fmt in args.formats:
+        store = os.path.join(tempfile.gettempdir(), f'bench_clips.{fmt}.store')
+        build_clip_store.build(folder, store, fmt, verbose=False)
+        sources.append((f'{fmt} store ({os.path.getsize(store) / 2**20:.0f} MB)', store))
+    for label, store in sources:
+        trans = TransitionManager(folder, 1.0, prefetch_frames=args.prefetch_frames, store=store)
+        shown = 0
+        cpu = 0.0
+        for _ in paths:
+            # prefetch included: every frame shown was decoded somewhere
+            c0 = time.process_time()
+            while not trans.arm_transition():
+                time.sleep(0.05)
+            while not trans.next_frame()[1]:
+                time.sleep(0.005)
+            cpu += time.process_time() - c0
+            shown += trans.frames_shown - shown
+        trans.close()
+        print(f'{label:<22} {cpu / max(shown, 1) * 1e3:6.2f} ms cpu per frame shown ({shown} frames)')
+        if store:
+            os.remove(store)
+    if tmp is not None:
+        tmp.cleanup()
+
+
+if __name__ == '__main__':
+    main()
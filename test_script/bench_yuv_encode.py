@@ -0,0 +1,58 @@
+"""per-frame cost of encoding a YUYV camera frame: via BGR vs TurboJPEG's YUV entry point
+
+    python test_script/bench_yuv_encode.py --frames 300 --width 640 --height 480
+
+the frame is synthetic (blurred noise converted to YUYV), so no camera is needed.
+'bgr' is what CAMERA_FORMAT 'BGR' costs: OpenCV converts YUYV to BGR, then
+TurboJPEG converts BGR back to YCbCr before the DCT.  'yuyv' is CAMERA_FORMAT
+'YUYV': a strided repack to 4:2:0 planes and a direct YUV encode
+"""
+import argparse, os, sys, time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import cv2
+import numpy as np
+from codec_utils import encode_bgr_to_jpeg, encode_yuyv_to_jpeg
+
+
+def measure(label, fn, frames):
+    out = fn()  # warm thread-local encoder and buffers
+    t0 = time.perf_counter()
+    c0 = time.process_time()
+    for _ in range(frames):
+        out = fn()
+    wall = (time.perf_counter() - t0) / frames * 1e3
+    cpu = (time.process_time() - c0) / frames * 1e3
+    print(f'{label:<14} {wall:7.3f} ms/frame  cpu {cpu:7.3f} ms/frame  {len(out):7d} bytes')
+    return wall
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--frames', type=int, default=300)
+    ap.add_argument('--width', type=int, default=640)
+    ap.add_argument('--height', type=int, default=480)
+    ap.add_argument('--quality', type=int, default=50)
+    args = ap.parse_args()
+
+    rng = np.random.default_rng(0)
+    bgr = rng.integers(0, 256, (args.height, args.width, 3), dtype=np.uint8)
+    bgr = cv2.GaussianBlur(bgr, (9, 9), 3)
+    yuyv = cv2.cvtColor(bgr, cv2.COLOR_BGR2YUV_YUYV)
+
+    def via_bgr():
+        return encode_bgr_to_jpeg(cv2.cvtColor(yuyv, cv2.COLOR_YUV2BGR_YUYV), args.quality)
+
+    def direct():
+        return encode_yuyv_to_jpeg(yuyv, args.width, args.height, args.quality)
+
+    print(f'{args.width}x{args.height} q={args.quality}, {args.frames} frames')
+    measure('convert only', lambda: cv2.cvtColor(yuyv, cv2.COLOR_YUV2BGR_YUYV).reshape(-1), args.frames)
+    measure('encode bgr', lambda: encode_bgr_to_jpeg(bgr, args.quality), args.frames)
+    old = measure('bgr', via_bgr, args.frames)
+    new = measure('yuyv', direct, args.frames)
+    print(f'speedup {old / new:.2f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""the effect degrade ladder never settles on a level slower than the one it left
+
+    python test_script/test_effect_ladder.py      (or: python -m pytest test_script)
+
+the first two checks feed _EffectStage made-up costs: a half resolution
+level dearer than full resolution is left again and skipped, and a level
+that does pay off is kept.  The last runs the real CPU effects at 640x480
+at every level, without judging their timings
+"""
+import os, sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import numpy as np
+import config
+from effect_manager import EFFECTS, Effect, EffectManager, _EffectStage
+
+
+def feed(stage, full, half_res, budget, frames):
+    # cost of one applied frame: level 3 keeps full resolution once level 2 is skipped
+    for _ in range(frames):
+        small = stage.level == 2 or (stage.level == 3 and 2 not in stage.slower)
+        stage._account(half_res if small else full, budget)
+
+
+def test_slower_level_is_left_and_skipped():
+    # half intensity costs the same, the resize pair makes level 2 dearer
+    stage = _EffectStage(Effect(None))
+    feed(stage, full=0.2, half_res=0.6, budget=0.05, frames=200)
+    assert stage.slower == {1, 2}
+    # level 3 without half resolution: every other frame at full cost
+    assert stage.level == 3
+    assert stage.costs[3] < stage.costs[0]
+
+
+def test_cheaper_level_is_kept():
+    stage = _EffectStage(Effect(None))
+    feed(stage, full=4.0, half_res=1.0, budget=1.5, frames=200)
+    assert stage.level == 2
+    assert 2 not in stage.slower and stage.costs[2] < stage.costs[0]
+
+
+class _Record(Effect):
+    # passes the frame through, noting whether it was asked to write its input
+    def __init__(self, log):
+        self.log = log
+
+    def apply(self, frame, out, intensity):
+        self.log.append(out is frame)
+        np.copyto(out, frame)
+        return out
+
+
+def test_skipped_stage_never_makes_the_next_write_its_input(monkeypatch):
+    monkeypatch.setattr(config, 'EFFECT_CHAINS', [['channel_shift', 'scan_line_offset', 'noise_overlay']])
+    monkeypatch.setattr(config, 'EFFECT_WORKERS', 1)
+    em = EffectManager()
+    log = []
+    for name, stage in em._stages.items():
+        stage.effect = _Record(log)
+    # the middle stage skips every other frame
+    em._stages['scan_line_offset']._set_level(3)
+    em._stages['scan_line_offset'].slower = {2}
+    em.start_glitch(['peer'], 3600)
+    frame = np.zeros((48, 64, 3), np.uint8)
+    for _ in range(4):
+        em.apply('peer', frame)
+    assert len(log) == 10 and not any(log)
+    em.close()
+
+
+def test_real_effects_run_at_every_level(monkeypatch):
+    monkeypatch.setattr(config, 'EFFECT_CHAINS', [[name] for name in EFFECTS])
+    monkeypatch.setattr(config, 'EFFECT_WORKERS', 1)
+    em = EffectManager()
+    frame = np.random.default_rng(0).integers(0, 256, (config.FRAME_HEIGHT, config.FRAME_WIDTH, 3), np.uint8)
+    before = frame.copy()
+    for name, stage in em._stages.items():
+        # levels are forced: which one a stage settles on is the injected-cost tests' business
+        for level, slower in ((0, set()), (1, set()), (2, set()), (3, set()), (3, {2})):
+            stage._set_level(level)
+            stage.slower = slower
+            for _ in range(2):
+                res = stage.run('peer', frame, np.empty_like(frame), em.budget_ms)
+                assert res.shape == frame.shape and res.dtype == np.uint8, (name, level)
+            assert stage.frames > 0
+    assert np.array_equal(frame, before)
+    em.close()
+
+
+if __name__ == '__main__':
+    import pytest
+    sys.exit(pytest.main([__file__, '-q']))
@@ -1,65 +1,139 @@
 # TransitionManager: plays short 640x480 clips prior to view switches
-import cv2, random, os
+import random, time
 from pathlib import Path
 from typing import Tuple, List, Optional
+from clip_reader import ClipReader
+from clip_store import StoreClipReader, open_store
 
 
 class TransitionManager:
     """Handle random clip playback between UI view switches
 
-    clips are assumed to be 640x480
+    clips are assumed to be 640x480.  The next clip is picked ahead of time
+    and its first ``prefetch_frames`` frames decoded on a background thread,
+    so arming one is instant; a used or aborted clip is replaced by a new
+    prefetch right away.  Playback follows the clip's own frame rate on the
+    monotonic clock, however often next_frame() is called: late frames are
+    dropped, and a clip lasts exactly its length
+
+    with a clip ``store`` (build_clip_store.py) clips are played out of one
+    memory-mapped file instead: a memcpy or a JPEG decode per frame, no
+    demuxing, and clip_dir is not scanned
     """
 
-    def __init__(self, clip_dir: str, chance: float, window_size: Tuple[int, int] = (640, 480)):
-        self.clip_paths: List[Path] = [p for p in Path(clip_dir).glob("*.*") if p.is_file()]
+    def __init__(self, clip_dir: str, chance: float, window_size: Tuple[int, int] = (640, 480),
+                 prefetch_frames: int = 60, clip_fps: float = 30.0, store: Optional[str] = None):
+        self.store = open_store(store)
+        # clip files, or the store's index entries
+        if self.store is not None:
+            self.clip_paths: List = list(self.store.clips)
+        else:
+            self.clip_paths = [p for p in Path(clip_dir).glob("*.*") if p.is_file()]
         self.chance = float(max(0.0, min(1.0, chance)))
         self.window_size = window_size  # (width, height)
+        self.clip_fps = clip_fps        # for clips that do not report a usable rate
+        self._ring = max(1, prefetch_frames)
+
+        self.reader: Optional[ClipReader] = None   # clip playing
+        self._next: Optional[ClipReader] = None    # clip being prefetched
+        self._last = None
+        self._t0: Optional[float] = None           # monotonic time of frame 0
+        self._fps = clip_fps
+        self._shown = -1                           # frame number on screen
+
+        # playback counters over all clips
+        self.frames_shown = 0
+        self.frames_dropped = 0   # due frames never shown (decoded late or grabbed)
+        self.frames_late = 0      # next_frame calls with a frame due but not decoded yet
+        self._prefetch()
+
+
+    def _prefetch(self):
+        if not self.clip_paths:
+            return
+        # avoid the same clip twice in a row
+        choices = [p for p in self.clip_paths if p is not self._last] or self.clip_paths
+        self._last = random.choice(choices)
+        if self.store is not None:
+            self._next = StoreClipReader(self.store, self._last, self.window_size, self._ring)
+        else:
+            self._next = ClipReader(str(self._last), self.window_size, self._ring)
 
-        self.cap: Optional[cv2.VideoCapture] = None
 
-    
     def arm_transition(self) -> bool:
         """Randomly decide whether to play a clip.  Return True if armed"""
         # if none clips on disk or chance roll fails, skip
-        if not self.clip_paths or random.random() > self.chance:
+        if self._next is None or random.random() > self.chance:
             return False
 
-        clip_path = str(random.choice(self.clip_paths))
-        # try GStreamer first for hardware-accelerated decode on Jetson
-        cap = cv2.VideoCapture(clip_path, cv2.CAP_GSTREAMER)
-        if not cap.isOpened():
-            # Fallback to any available backend
-            cap = cv2.VideoCapture(clip_path)
-        if not cap.isOpened():
-            # failed to open with any backend, skip transition
+        if self._next.ended():
+            # failed to open with any backend (or empty), skip transition and try another clip
+            self._next.close()
+            self._prefetch()
+            return False
+        if not self._next.ready():
+            # still decoding its first frames; rather skip than stall the display
             return False
 
-        # warm-up read to prime decoder; ignore content
-        cap.read()
-        self.cap = cap
+        self.abort()
+        self.reader = self._next
+        fps = self.reader.fps
+        self._fps = fps if 1.0 <= fps <= 240.0 else self.clip_fps
+        # the clock starts with the first next_frame(), when the clip is first drawn
+        self._t0 = None
+        self._shown = -1
+        self._prefetch()
         return True
 
     def next_frame(self):
-        """Return (frame, done)  *done* is True when clip finished or not armed"""
-        if self.cap is None:
-            return None, True
+        """Return (frame, done)  *done* is True when clip finished or not armed
 
-        ok, frame = self.cap.read()
-        if not ok or frame is None:
-            self.cap.release()
-            self.cap = None
+        frame is None when the frame on screen should stay up: the next one
+        is not due yet, or the decoder has fallen behind
+        """
+        if self.reader is None:
             return None, True
 
-        h_target = self.window_size[1]
-        w_target = self.window_size[0]
+        now = time.monotonic()
+        if self._t0 is None:
+            self._t0 = now
+        due = int((now - self._t0) * self._fps)
+
+        if self.reader.ended():
+            # the last frame stays up for its full frame time
+            if self.reader.failed or due >= self.reader.length:
+                self.abort()
+                return None, True
+            return None, False
+        if due <= self._shown:
+            return None, False
 
-        h, w = frame.shape[:2]
-        if (w, h) != (w_target, h_target):
-            frame = cv2.resize(frame, (w_target, h_target))
+        frame, idx = self.reader.read(due)
+        if frame is None:
+            self.frames_late += 1
+            return None, False
+        self.frames_dropped += idx - self._shown - 1
+        self.frames_shown += 1
+        self._shown = idx
         return frame, False
 
-    def abort(self):
+    def time_to_next(self) -> float:
+        """seconds until the playing clip's next frame is due; 0 if not playing or not started"""
+        if self.reader is None or self._t0 is None:
+            return 0.0
+        return max(0.0, self._t0 + (self._shown + 1) / self._fps - time.monotonic())
+
+    def abort(self, wait=False):
         """immediately stop any playing clip"""
-        if self.cap is not None:
-            self.cap.release()
-            self.cap = None 
\ No newline at end of file
+        if self.reader is not None:
+            self.reader.close(wait)
+            self.reader = None
+
+    def close(self):
+        """stop playback and prefetch, waiting for the decoder threads"""
+        self.abort(wait=True)
+        if self._next is not None:
+            self._next.close(wait=True)
+            self._next = None
+        if self.store is not None:
+            self.store.close()